@@ -0,0 +1,93 @@
+"""离线分析基准
+
+生成一个模拟的全天归档（大直播间：弹幕、进场、礼物、盲盒、上舰与每小时一场 PK），
+报告首次加载（逐行解析行头）、缓存加载（.npz）与向量化计算各自的耗时。
+为了快速生成，每种消息只序列化一次作为模板，逐行变化的只有行头。
+
+用法（在仓库根目录执行）：
+    python -m benchmarks.bench_analytics --events 2000000
+    python -m benchmarks.bench_analytics --events 500000 --compress
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+
+from src import analytics, sample_events
+from src.event_archive import archive_row
+
+ROOM_ID = 1
+DAY_SECONDS = 86400
+
+
+def _write_archive(path: str, events: int, compress: bool) -> None:
+    templates = {
+        "danmaku": sample_events.make_danmaku(room_id=ROOM_ID),
+        "entry": sample_events.make_entry_effect(room_id=ROOM_ID),
+        "gift": sample_events.make_send_gift(room_id=ROOM_ID),
+        "blind": sample_events.make_send_gift(room_id=ROOM_ID, gift_id=32126, gift_name="浪漫城堡",
+                                              price=random.choice((5000, 10000, 30000)), blind=True),
+        "guard": sample_events.make_guard_buy(),
+        "pk": sample_events.make_pk_process(room_id=ROOM_ID),
+    }
+    bodies = {kind: json.dumps(message, ensure_ascii=False) for kind, message in templates.items()}
+    kinds = ["danmaku"] * 50 + ["entry"] * 35 + ["gift"] * 12 + ["blind"] * 2 + ["guard"]
+    start = time.time() - DAY_SECONDS
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        for i in range(events):
+            ts = start + DAY_SECONDS * i / events
+            # 每小时的前 5 分钟是一场 PK，期间每 2 秒一次票数更新
+            if int(ts) % 3600 < 300 and i % max(1, events // 43200) == 0:
+                kind = "pk"
+                message = sample_events.make_pk_process(
+                    ROOM_ID, random.randint(0, 5000), random.randint(0, 5000), pk_id=int(ts) // 3600)
+            else:
+                kind = random.choice(kinds)
+                message = templates[kind]
+                if kind in ("danmaku", "entry"):
+                    message = None  # 行头单独生成
+            if message is None:
+                uid = random.randint(1, 300000)
+                row = [round(ts, 3), ROOM_ID, "DANMU_MSG" if kind == "danmaku" else "ENTRY_EFFECT", uid, 0, 0, 0, 0]
+            else:
+                row = archive_row(message, ts, ROOM_ID)
+                if kind in ("gift", "blind", "guard"):
+                    row[3] = random.randint(1, 300000)
+                if kind == "blind":
+                    row[6] = random.choice((5000, 10000, 15000, 30000, 100000))
+            f.write(json.dumps(row, ensure_ascii=False) + "\t" + bodies[kind] + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="离线分析基准")
+    parser.add_argument("--events", type=int, default=2000000, help="全天事件数")
+    parser.add_argument("--compress", action="store_true", help="生成 gzip 压缩的归档")
+    parser.add_argument("--bin", type=float, default=60.0, help="时间桶宽度(秒)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="tofu-analytics-")
+    path = os.path.join(directory, f"{ROOM_ID}-bench.jsonl" + (".gz" if args.compress else ""))
+    started = time.perf_counter()
+    _write_archive(path, args.events, args.compress)
+    print(f"生成 {args.events} 条事件：{os.path.getsize(path) / 1e6:.0f}MB，{time.perf_counter() - started:.1f} 秒")
+
+    started = time.perf_counter()
+    tables = analytics.load_archive([path], ROOM_ID)
+    print(f"首次加载：{time.perf_counter() - started:.2f} 秒")
+    started = time.perf_counter()
+    tables = analytics.load_archive([path], ROOM_ID)
+    print(f"缓存加载：{time.perf_counter() - started:.2f} 秒")
+    started = time.perf_counter()
+    report = analytics.analyze(tables, args.bin)
+    print(f"计算：{time.perf_counter() - started:.2f} 秒")
+    print(analytics.format_report(report).replace("\n", "\n  ")[:2000])
+    print(f"归档保留在 {directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""APIClient 压测
+
+在本机启动桩后端（src/stub_backend.py），用真实的 APIClient 按端点混合比例发送请求，
+报告客户端的发送吞吐、关键端点的延迟，以及桩后端实际收到的请求/事件数。
+
+用法（在仓库根目录执行）：
+    python -m benchmarks.bench_api_client --events 5000 --latency-ms 5
+    python -m benchmarks.bench_api_client --error-rate 0.2 --batch
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from src.stub_backend import start_in_background
+from src.sample_events import make_send_gift, make_entry_effect
+
+# 端点混合比例：进场和礼物占大头，夹杂少量关键请求
+MIX = [("entry_welcome", 60), ("money", 30), ("chatbot", 5), ("ticket", 4), ("pk_wanzun", 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="APIClient 压测")
+    parser.add_argument("--events", type=int, default=5000, help="发送的事件总数")
+    parser.add_argument("--latency-ms", type=float, default=5, help="桩后端每个请求的延迟(毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0, help="桩后端错误注入比例")
+    parser.add_argument("--batch", action="store_true", help="启用批量模式")
+    parser.add_argument("--no-lanes", action="store_true", help="关闭优先级通道（在调用线程中同步发送）")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="等待队列发送完毕的最长时间(秒)")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    # 发件箱写到临时目录，避免污染工作目录
+    os.chdir(tempfile.mkdtemp(prefix="tofu-bench-"))
+    from src.parser_handler import APIClient, outbound_lanes
+
+    server = start_in_background(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = APIClient(base_url, batch_enabled=args.batch, lanes_enabled=not args.no_lanes)
+
+    gift = make_send_gift()["data"]
+    entry = make_entry_effect()["data"]
+    schedule = [ep for ep, weight in MIX for _ in range(weight)]
+
+    critical_latencies = []
+    start = time.perf_counter()
+    for i in range(args.events):
+        endpoint = schedule[i % len(schedule)]
+        payload = {"room_id": 1, "seq": i, "raw_message": gift if endpoint == "money" else entry}
+        t0 = time.perf_counter()
+        client.post(endpoint, payload)
+        if endpoint == "pk_wanzun":
+            critical_latencies.append(time.perf_counter() - t0)
+    submit_elapsed = time.perf_counter() - start
+
+    client.close()
+    deadline = time.time() + args.drain_timeout
+    while time.time() < deadline and any(lane.queue.unfinished_tasks for lane in outbound_lanes.lanes.values()):
+        time.sleep(0.05)
+    total_elapsed = time.perf_counter() - start
+
+    stats = server.state.stats()
+    received = sum(stats["events"].values())
+    print(f"提交 {args.events} 条事件耗时 {submit_elapsed:.2f}s（{args.events / submit_elapsed:.0f} 条/秒，调用方视角）")
+    print(f"后端收到 {received} 条事件 / {sum(stats['requests'].values())} 个请求，"
+          f"总耗时 {total_elapsed:.2f}s（{received / total_elapsed:.0f} 条/秒）")
+    if critical_latencies:
+        critical_latencies.sort()
+        p50 = critical_latencies[len(critical_latencies) // 2]
+        p99 = critical_latencies[int(len(critical_latencies) * 0.99) - 1 if len(critical_latencies) > 1 else 0]
+        print(f"pk_wanzun 调用延迟 p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+    for endpoint in sorted(stats["requests"]):
+        print(f"  /{endpoint:<16} 请求 {stats['requests'][endpoint]:>6}  事件 {stats['events'].get(endpoint, 0):>6}"
+              f"  错误 {stats['errors'].get(endpoint, 0):>5}  入站 {stats['bytes_in'][endpoint] / 1024:.0f}KB")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
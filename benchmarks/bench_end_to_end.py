@@ -0,0 +1,126 @@
+"""端到端压测
+
+在本机同时启动模拟弹幕服务器（src/fake_live_server.py）和桩后端（src/stub_backend.py），
+用真实的 BiliDanmakuClient 连接 N 个直播间，报告客户端处理的消息速率、
+从服务器发出到进入 _handle_message 的延迟，以及桩后端收到的请求数。
+
+用法（在仓库根目录执行）：
+    python -m benchmarks.bench_end_to_end --rooms 1 --rate 500
+    python -m benchmarks.bench_end_to_end --rooms 500 --rate 20 --scenario gift_combo --duration 30
+房间数较多时建议把模拟服务器放到单独的进程，避免与客户端争用 GIL：
+    python -m src.fake_live_server --port 2245 --rate 20 --stats-interval 0 &
+    python -m benchmarks.bench_end_to_end --rooms 500 --live-url ws://127.0.0.1:2245/sub
+此时延迟仍按消息里的发送时刻计算，服务器推送数改为客户端收到的消息数。
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+from src import fake_live_server, stub_backend
+
+
+class _Discard:
+    """丢弃输出；不用 os.devnull 的文件对象，避免数百个线程争用同一个 BufferedWriter 锁"""
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="端到端压测")
+    parser.add_argument("--rooms", type=int, default=10, help="同时连接的直播间数（1~500）")
+    parser.add_argument("--rate", type=float, default=50, help="每个直播间每秒的消息数")
+    parser.add_argument("--flush-ms", type=float, default=100, help="服务器打包间隔(毫秒)")
+    parser.add_argument("--compression", choices=["brotli", "zlib", "none"], default="brotli")
+    parser.add_argument("--scenario", choices=sorted(fake_live_server.SCENARIOS), default="mixed")
+    parser.add_argument("--duration", type=float, default=15, help="统计时长(秒)")
+    parser.add_argument("--warmup", type=float, default=3, help="连接建立后的预热时长(秒)，不计入统计")
+    parser.add_argument("--latency-ms", type=float, default=2, help="桩后端每个请求的延迟(毫秒)")
+    parser.add_argument("--live-url", type=str, help="连接已启动的模拟服务器，而不是在本进程内启动")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    # 发件箱、守护模式状态等写到临时目录
+    os.chdir(tempfile.mkdtemp(prefix="tofu-e2e-"))
+    from src.bili_danmaku_client import BiliDanmakuClient
+
+    live = None
+    if not args.live_url:
+        live = fake_live_server.start_in_background(rate=args.rate, flush_ms=args.flush_ms,
+                                                    compression=args.compression, scenario=args.scenario)
+    live_url = args.live_url or live.url
+    backend = stub_backend.start_in_background(latency_ms=args.latency_ms)
+    api_url = f"http://127.0.0.1:{backend.server_address[1]}"
+
+    latencies: List[float] = []
+    recording = threading.Event()
+
+    def instrument(client: BiliDanmakuClient) -> None:
+        handle = client.parser._handle_message
+
+        def timed_handle(message):
+            sent_at = message.get(fake_live_server.SENT_AT_FIELD) if isinstance(message, dict) else None
+            if sent_at and recording.is_set():
+                latencies.append(time.time() - sent_at)
+            handle(message)
+        client.parser._handle_message = timed_handle
+
+    clients = []
+    out = sys.stdout
+    # 处理器会把弹幕 print 到标准输出，整个压测期间丢弃
+    with contextlib.redirect_stdout(_Discard()):
+        for i in range(args.rooms):
+            client = BiliDanmakuClient(1000 + i, api_base_url=api_url, ws_url=live_url)
+            instrument(client)
+            threading.Thread(target=client.start, name=f"room-{1000 + i}", daemon=True).start()
+            clients.append(client)
+
+        time.sleep(args.warmup)
+        connected = live.stats.snapshot()["authenticated"] if live else sum(1 for c in clients if c.heartbeat_started)
+        sent_before = live.stats.snapshot()["messages"] if live else 0
+        recording.set()
+        start = time.perf_counter()
+        time.sleep(args.duration)
+        recording.clear()
+        elapsed = time.perf_counter() - start
+        sent = live.stats.snapshot()["messages"] - sent_before if live else len(latencies)
+
+        for client in clients:
+            client.stop()
+        _report(out, args, connected, sent, latencies, elapsed, backend.state.stats())
+    if live:
+        live.shutdown()
+    backend.shutdown()
+
+
+def _report(out, args, connected: int, sent: int, latencies: List[float], elapsed: float, backend_stats) -> None:
+    handled = len(latencies)
+    values = sorted(latencies)
+    print(f"直播间 {args.rooms}（已认证 {connected}），场景 {args.scenario}，每间 {args.rate:g} 条/秒，"
+          f"压缩 {args.compression}", file=out)
+    print(f"服务器推送 {sent} 条（{sent / elapsed:.0f} 条/秒），客户端处理 {handled} 条（{handled / elapsed:.0f} 条/秒）", file=out)
+    print(f"端到端延迟 p50={_percentile(values, 0.5) * 1000:.1f}ms p95={_percentile(values, 0.95) * 1000:.1f}ms "
+          f"p99={_percentile(values, 0.99) * 1000:.1f}ms max={(values[-1] if values else 0) * 1000:.1f}ms", file=out)
+    print(f"桩后端收到 {sum(backend_stats['events'].values())} 条事件 / "
+          f"{sum(backend_stats['requests'].values())} 个请求：" +
+          ", ".join(f"{ep}={n}" for ep, n in sorted(backend_stats["requests"].items())), file=out)
+
+
+if __name__ == "__main__":
+    main()
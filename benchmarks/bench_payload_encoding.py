@@ -0,0 +1,129 @@
+"""请求体编码基准测试
+
+对 /money 和 /entry_welcome 的请求体比较各种编码方式的序列化 CPU 耗时与实际发送字节数。
+请求体由真实的 GiftHandler / EntryEffectHandler 生成，并经过与 APIClient 相同的投影规则。
+
+用法（在仓库根目录执行）：
+    python -m benchmarks.bench_payload_encoding
+    python -m benchmarks.bench_payload_encoding --input recorded_events.jsonl --iterations 2000
+--input 为录制的原始事件，每行一个 JSON（含 cmd 字段），只使用 SEND_GIFT 和 ENTRY_EFFECT。
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Any, List
+
+from src.config import PAYLOAD_PROJECTION_RULES, API_GZIP_MIN_BYTES
+from src.parser_handler import GiftHandler, EntryEffectHandler
+from src.payload_encoding import encode_body, msgpack
+from src.payload_projection import PayloadProjector
+from src.sample_events import make_send_gift, make_entry_effect
+
+ENCODINGS = [
+    ("json", {"format": "json"}),
+    ("json+gzip", {"format": "json", "compress": "gzip"}),
+    ("msgpack", {"format": "msgpack"}),
+    ("msgpack+gzip", {"format": "msgpack", "compress": "gzip"}),
+]
+
+
+class _CapturingClient:
+    """替代 APIClient，只记录处理器生成的请求体"""
+
+    def __init__(self):
+        self.payloads: List[tuple] = []
+
+    def post(self, endpoint: str, payload: Dict[str, Any]) -> tuple:
+        self.payloads.append((endpoint, payload))
+        return True, 200
+
+
+def _load_events(path: str) -> List[Dict[str, Any]]:
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+
+def _sample_events(count: int) -> List[Dict[str, Any]]:
+    events = []
+    for i in range(count):
+        events.append(make_send_gift(uid=10000 + i, uname=f"观众{i}", num=1 + i % 5,
+                                     batch_combo_id=f"batch:gift:combo_id:{i}", blind=(i % 7 == 0)))
+        events.append(make_entry_effect(uid=20000 + i, uname=f"路人{i}", guard_level=3 if i % 10 == 0 else 0))
+    return events
+
+
+def build_payloads(events: List[Dict[str, Any]], raw: bool) -> Dict[str, List[Dict[str, Any]]]:
+    """用真实处理器把原始事件转换为各端点的请求体"""
+    client = _CapturingClient()
+    handlers = {
+        "SEND_GIFT": GiftHandler(0, client),
+        "ENTRY_EFFECT": EntryEffectHandler(0, client),
+    }
+    for event in events:
+        handler = handlers.get(event.get("cmd"))
+        if handler:
+            handler.handle(event)
+    projector = PayloadProjector(PAYLOAD_PROJECTION_RULES, debug_raw=raw, sample_every=10 ** 9)
+    by_endpoint: Dict[str, List[Dict[str, Any]]] = {}
+    for endpoint, payload in client.payloads:
+        by_endpoint.setdefault(endpoint, []).append(projector.project(endpoint, payload))
+    return by_endpoint
+
+
+def bench(payloads: List[Dict[str, Any]], encoding: Dict[str, Any], iterations: int) -> Dict[str, float]:
+    """对一组请求体重复编码，返回平均CPU耗时与平均字节数"""
+    total_bytes = 0
+    for payload in payloads:
+        data, _ = encode_body(payload, encoding.get("format", "json"), encoding.get("compress"), API_GZIP_MIN_BYTES)
+        total_bytes += len(data)
+    rounds = max(1, iterations // len(payloads))
+    start = time.process_time()
+    for _ in range(rounds):
+        for payload in payloads:
+            encode_body(payload, encoding.get("format", "json"), encoding.get("compress"), API_GZIP_MIN_BYTES)
+    cpu = time.process_time() - start
+    encoded = rounds * len(payloads)
+    return {"us_per_payload": cpu / encoded * 1e6, "bytes_per_payload": total_bytes / len(payloads)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="请求体编码基准测试")
+    parser.add_argument("--input", type=str, help="录制的原始事件文件（JSON Lines）")
+    parser.add_argument("--samples", type=int, default=200, help="未指定 --input 时生成的示例事件数")
+    parser.add_argument("--iterations", type=int, default=5000, help="每种编码方式的编码次数")
+    parser.add_argument("--raw", action="store_true", help="保留 raw_message（对比投影前的请求体）")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    events = _load_events(args.input) if args.input else _sample_events(args.samples)
+    # 处理器会学习礼物目录，进程退出时保存到当前目录，改到临时目录
+    os.chdir(tempfile.mkdtemp(prefix="tofu-encoding-"))
+    by_endpoint = build_payloads(events, args.raw)
+    if msgpack is None:
+        print("注意：未安装 msgpack，msgpack 结果实际为 JSON")
+
+    print(f"{'端点':<16}{'编码':<16}{'CPU(us/条)':>14}{'字节/条':>12}{'相对JSON':>10}")
+    for endpoint in ("money", "entry_welcome"):
+        payloads = by_endpoint.get(endpoint)
+        if not payloads:
+            continue
+        baseline = None
+        for name, encoding in ENCODINGS:
+            result = bench(payloads, encoding, args.iterations)
+            baseline = baseline or result["bytes_per_payload"]
+            ratio = result["bytes_per_payload"] / baseline
+            print(f"{endpoint:<16}{name:<16}{result['us_per_payload']:>14.1f}"
+                  f"{result['bytes_per_payload']:>12.0f}{ratio:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,12 @@ import argparse
 
 from src.bili_danmaku_client import BiliDanmakuClient
 from src.room_history import load_history, append_room_history, show_history
+from src.config import METRICS_PORT, METRICS_HOST, PROFILER_SIGNAL_SECONDS, PROFILER_OUTPUT_DIR, HOTPATH_TIMINGS_ENABLED
+from src.metrics import start_http_server
+from src.profiler import install_signal_handler, register_admin_routes, set_timings_enabled
+from src.revenue import register_routes as register_revenue_routes
+from src.event_ring import register_routes as register_event_routes
+from src.danmaku_index import register_routes as register_danmaku_search_routes
 
 # 准备一个专门用于存储"脚本内部输入历史"（并非房间号历史）的文件
 READLINE_HISTORY = ".danmaku_input_history"
@@ -30,6 +36,8 @@ def get_arguments():
     parser.add_argument('--cookie', type=str, help='B站 Cookie 字符串（例如 "SESSDATA=...; bili_jct=..."），用于携带登录态')
     parser.add_argument('--login', action='store_true', help='扫码登录B站账号（成功后本次会话携带登录Cookie）；不传则游客')
     parser.add_argument('--debug-ws', action='store_true', help='启用底层WebSocket和网络详细日志（会打印脱敏信息）')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, help='启动 Prometheus 指标服务的端口（GET /metrics），默认不启动')
+    parser.add_argument('--ws-url', type=str, help='直连指定的弹幕WebSocket地址（如本地模拟服务器 ws://127.0.0.1:2245/sub），跳过B站接口')
     return parser.parse_args()
 
 def main():
@@ -41,6 +49,18 @@ def main():
     # 解析命令行参数
     args = get_arguments()
 
+    # 性能剖析：SIGUSR1 触发采样，指标服务上提供 /debug/profile
+    set_timings_enabled(HOTPATH_TIMINGS_ENABLED)
+    install_signal_handler(PROFILER_SIGNAL_SECONDS, PROFILER_OUTPUT_DIR)
+
+    # 启动指标服务
+    if args.metrics_port is not None:
+        register_admin_routes()
+        register_revenue_routes()
+        register_event_routes()
+        register_danmaku_search_routes()
+        start_http_server(args.metrics_port, METRICS_HOST)
+
     # 如果传入了 --room-id 参数，直接启动
     if args.room_id:
         room_id = args.room_id
@@ -71,7 +91,8 @@ def main():
             api_base_url=args.api,
             debug_events=args.debug_events,
             cookie=cookie_header,
-            debug_ws=args.debug_ws
+            debug_ws=args.debug_ws,
+            ws_url=args.ws_url
         )
         client.start()
         return  # 启动后直接退出函数
@@ -125,7 +146,8 @@ def main():
         api_base_url=args.api,
         debug_events=args.debug_events,
         cookie=cookie_header,
-        debug_ws=args.debug_ws
+        debug_ws=args.debug_ws,
+        ws_url=args.ws_url
     )
     client.start()
 
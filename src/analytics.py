@@ -0,0 +1,531 @@
+"""归档事件的离线分析
+
+读取 EventRecorder 写出的 JSONL 归档（src/event_archive.py）或 SQLite 归档（src/sqlite_archive.py），
+把事件装入 NumPy 数组后向量化计算：
+  - 每个时间桶（默认 1 分钟）的流水（礼物 / 上舰 / 醒目留言，金瓜子）、弹幕数与进场数
+  - 观众曲线：每个时间桶的活跃观众数（发弹幕、送礼、上舰、进场的独立 uid）、新观众数与累计观众数
+  - 送礼榜
+  - 盲盒盈亏分布：总体盈亏、返还率、每个盲盒盈亏的分位数与直方图、盈亏最多的用户
+  - PK 票数轨迹：每场 PK 的起止、最终票数、领先变化次数、最大领先/落后与按固定步长采样的票数曲线
+归档行头已包含各项统计所需的字段，加载时不解析原始消息，逐行只做一次短 JSON 解析；
+每个文件按 chunk_size 行分块转换为数组，内存中只保留紧凑的 8 列 float64 表。
+加载结果默认缓存为同目录下的 .npz 文件，归档文件没有变化时直接读取缓存。
+SQLite 归档按同样的列查询，房间与时间范围条件下推到 (room_id, ts) 索引，分块 fetchmany 后转换为数组。
+
+用法（在仓库根目录执行）：
+    python -m src.analytics archive/                      # 分析目录下的全部归档
+    python -m src.analytics archive/123-20241019.jsonl --room 123 --bin 300 --json report.json
+    python -m src.analytics archive/ --since "2024-10-19 20:00" --until "2024-10-19 23:00"
+    python -m src.analytics events.db --room 123
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+from .event_archive import archive_row
+from .tracing import server_timestamp
+
+logger = logging.getLogger(__name__)
+
+# 行头列：[ts, room_id, kind, uid, v1, v2, v3, v4]，kind 为 cmd 在所属表中的序号
+TS, ROOM, KIND, UID, V1, V2, V3, V4 = range(8)
+COLUMNS = 8
+
+# 表名 -> 归入该表的 cmd（按 kind 序号）
+TABLES = {
+    "danmaku": ("DANMU_MSG",),
+    "gifts": ("SEND_GIFT",),
+    "guards": ("GUARD_BUY",),
+    "entries": ("ENTRY_EFFECT",),
+    "super_chats": ("SUPER_CHAT_MESSAGE",),
+    "pk": ("PK_BATTLE_PROCESS_NEW", "PK_INFO", "PK_BATTLE_START_NEW", "PK_BATTLE_END"),
+}
+_CMD_TABLE = {cmd: (table, kind) for table, cmds in TABLES.items() for kind, cmd in enumerate(cmds)}
+
+# 各表中 v1~v4 的含义
+GIFT_ID, GIFT_NUM, GIFT_VALUE, BLIND_ORIGINAL = V1, V2, V3, V4
+GUARD_LEVEL, GUARD_NUM, GUARD_VALUE = V1, V2, V3
+SC_VALUE = V1
+PK_ID, PK_BATTLE_TYPE, PK_SELF, PK_OPPONENT = V1, V2, V3, V4
+
+CACHE_VERSION = 1
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+# SQLite 归档各表映射到行头列的查询（上舰只取 GUARD_BUY，与 JSONL 归档一致）
+_PK_KIND = "CASE cmd " + " ".join(f"WHEN '{cmd}' THEN {kind}" for kind, cmd in enumerate(TABLES["pk"])) + " END"
+SQLITE_QUERIES = {
+    "danmaku": ("SELECT ts, room_id, 0, IFNULL(uid, 0), 0, 0, 0, 0 FROM danmaku", ()),
+    "gifts": ("SELECT ts, room_id, 0, IFNULL(uid, 0), IFNULL(gift_id, 0), IFNULL(num, 1), IFNULL(value, 0), "
+              "IFNULL(blind_original, 0) FROM gifts", ()),
+    "guards": ("SELECT ts, room_id, 0, IFNULL(uid, 0), IFNULL(guard_level, 0), IFNULL(num, 1), IFNULL(value, 0), 0 "
+               "FROM guards", ("source = 'GUARD_BUY'",)),
+    "entries": ("SELECT ts, room_id, 0, IFNULL(uid, 0), IFNULL(privilege_type, 0), 0, 0, 0 FROM entries", ()),
+    "super_chats": ("SELECT ts, room_id, 0, IFNULL(uid, 0), IFNULL(value, 0), 0, 0, 0 FROM super_chats", ()),
+    "pk": (f"SELECT ts, room_id, {_PK_KIND}, 0, IFNULL(pk_id, 0), IFNULL(battle_type, 0), IFNULL(self_votes, 0), "
+           f"IFNULL(opponent_votes, 0) FROM pk", (f"{_PK_KIND} IS NOT NULL",)),
+}
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("离线分析需要 numpy（pip install numpy）")
+
+
+def _empty() -> "np.ndarray":
+    return np.zeros((0, COLUMNS), dtype=np.float64)
+
+
+def archive_files(paths: Iterable[str]) -> List[str]:
+    """展开文件与目录，返回按名称排序的归档文件列表"""
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in os.listdir(path)
+                         if name.endswith((".jsonl", ".jsonl.gz") + SQLITE_SUFFIXES))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def _parse_line(line: bytes, room_id: int) -> Optional[List[Any]]:
+    """解析一行归档，返回行头；没有行头的旧格式行（单纯的消息 JSON）从消息重新生成"""
+    head, sep, _ = line.partition(b"\t")
+    if sep:
+        return json.loads(head)
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        return None
+    return archive_row(message, server_timestamp(message) or 0.0, room_id)
+
+
+def load_file(path: str, chunk_size: int = 200000, room_id: int = 0) -> Dict[str, "np.ndarray"]:
+    """逐块读取一个归档文件，返回 表名 -> (N, 8) 数组
+
+    Args:
+        path: 归档文件（.jsonl 或 .jsonl.gz）
+        chunk_size: 每块转换为数组的行数
+        room_id: 旧格式行使用的房间号
+    """
+    _require_numpy()
+    chunks: Dict[str, List["np.ndarray"]] = {table: [] for table in TABLES}
+    rows: Dict[str, List[List[Any]]] = {table: [] for table in TABLES}
+    pending = 0
+    bad = 0
+
+    def flush() -> None:
+        for table, table_rows in rows.items():
+            if table_rows:
+                chunks[table].append(np.array(table_rows, dtype=np.float64))
+                table_rows.clear()
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for line in f:
+            try:
+                row = _parse_line(line, room_id)
+            except ValueError:
+                bad += 1
+                continue
+            target = _CMD_TABLE.get(row[2]) if row else None
+            if target is None:
+                continue
+            table, kind = target
+            row[2] = kind
+            rows[table].append(row)
+            pending += 1
+            if pending >= chunk_size:
+                flush()
+                pending = 0
+    flush()
+    if bad:
+        logger.warning(f"⚠️ {path} 中有 {bad} 行无法解析，已跳过")
+    return {table: np.concatenate(parts) if parts else _empty() for table, parts in chunks.items()}
+
+
+def _cache_path(path: str) -> str:
+    return f"{path}.npz"
+
+
+def load_file_cached(path: str, chunk_size: int = 200000, room_id: int = 0) -> Dict[str, "np.ndarray"]:
+    """读取归档文件；同目录下有更新的 .npz 缓存时直接使用缓存"""
+    cache = _cache_path(path)
+    try:
+        if os.path.getmtime(cache) >= os.path.getmtime(path):
+            with np.load(cache) as data:
+                if int(data["version"]) == CACHE_VERSION:
+                    return {table: data[table] for table in TABLES}
+    except (OSError, KeyError, ValueError):
+        pass
+    tables = load_file(path, chunk_size, room_id)
+    try:
+        tmp_path = f"{cache}.tmp.npz"
+        np.savez(tmp_path, version=CACHE_VERSION, **tables)
+        os.replace(tmp_path, cache)
+    except OSError as e:
+        logger.warning(f"⚠️ 写入分析缓存 {cache} 失败: {e}")
+    return tables
+
+
+def load_sqlite(path: str, room_id: Optional[int] = None, since: Optional[float] = None,
+                until: Optional[float] = None, chunk_size: int = 200000) -> Dict[str, "np.ndarray"]:
+    """从 SQLite 归档查询各表，返回 表名 -> (N, 8) 数组"""
+    _require_numpy()
+    conditions, params = [], []
+    if room_id is not None:
+        conditions.append("room_id = ?")
+        params.append(room_id)
+    if since is not None:
+        conditions.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("ts < ?")
+        params.append(until)
+
+    tables: Dict[str, "np.ndarray"] = {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for table, (query, extra) in SQLITE_QUERIES.items():
+            where = list(extra) + conditions
+            if where:
+                query += " WHERE " + " AND ".join(where)
+            chunks = []
+            try:
+                cursor = conn.execute(query, params)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"⚠️ {path} 中没有可用的 {table} 表: {e}")
+                tables[table] = _empty()
+                continue
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunks.append(np.array(rows, dtype=np.float64))
+            tables[table] = np.concatenate(chunks) if chunks else _empty()
+    finally:
+        conn.close()
+    return tables
+
+
+def load_archive(paths: Iterable[str], room_id: Optional[int] = None, since: Optional[float] = None,
+                 until: Optional[float] = None, chunk_size: int = 200000, use_cache: bool = True
+                 ) -> Dict[str, "np.ndarray"]:
+    """读取多个归档（JSONL 文件、SQLite 数据库或目录）并按房间、时间范围过滤，每张表按时间排序"""
+    _require_numpy()
+    parts: Dict[str, List["np.ndarray"]] = {table: [] for table in TABLES}
+    loader = load_file_cached if use_cache else load_file
+    for path in archive_files(paths):
+        if path.endswith(SQLITE_SUFFIXES):
+            loaded = load_sqlite(path, room_id, since, until, chunk_size)
+        else:
+            loaded = loader(path, chunk_size, room_id or 0)
+        for table, array in loaded.items():
+            if len(array):
+                parts[table].append(array)
+
+    tables: Dict[str, "np.ndarray"] = {}
+    for table, arrays in parts.items():
+        array = np.concatenate(arrays) if arrays else _empty()
+        mask = np.ones(len(array), dtype=bool)
+        if room_id is not None:
+            mask &= array[:, ROOM] == room_id
+        if since is not None:
+            mask &= array[:, TS] >= since
+        if until is not None:
+            mask &= array[:, TS] < until
+        array = array[mask]
+        tables[table] = array[np.argsort(array[:, TS], kind="stable")]
+    return tables
+
+
+def _bins(ts: "np.ndarray", start: float, bin_seconds: float, count: int) -> "np.ndarray":
+    return np.clip(((ts - start) // bin_seconds).astype(np.int64), 0, count - 1)
+
+
+def _series(tables: Dict[str, "np.ndarray"], start: float, bin_seconds: float, count: int) -> Dict[str, List[Any]]:
+    """每个时间桶的流水、弹幕数、进场数与观众曲线"""
+    gifts, guards, super_chats = tables["gifts"], tables["guards"], tables["super_chats"]
+
+    def weighted(array: "np.ndarray", column: int) -> "np.ndarray":
+        return np.bincount(_bins(array[:, TS], start, bin_seconds, count), weights=array[:, column], minlength=count)
+
+    def counted(array: "np.ndarray") -> "np.ndarray":
+        return np.bincount(_bins(array[:, TS], start, bin_seconds, count), minlength=count)
+
+    revenue_gift = weighted(gifts, GIFT_VALUE)
+    revenue_guard = weighted(guards, GUARD_VALUE)
+    revenue_super_chat = weighted(super_chats, SC_VALUE)
+
+    # 观众：所有带 uid 的事件
+    viewer_rows = [tables[t][:, (TS, UID)] for t in ("danmaku", "gifts", "guards", "entries", "super_chats")]
+    viewers = np.concatenate(viewer_rows) if viewer_rows else np.zeros((0, 2))
+    viewers = viewers[viewers[:, 1] > 0]
+    uid = viewers[:, 1].astype(np.int64)
+    bins = _bins(viewers[:, 0], start, bin_seconds, count)
+
+    # 每个桶的独立 uid 数：按 (桶, uid) 排序后统计相邻不同的对
+    order = np.lexsort((uid, bins))
+    sorted_bins, sorted_uid = bins[order], uid[order]
+    distinct = np.ones(len(order), dtype=bool)
+    distinct[1:] = (sorted_bins[1:] != sorted_bins[:-1]) | (sorted_uid[1:] != sorted_uid[:-1])
+    active = np.bincount(sorted_bins[distinct], minlength=count)
+
+    # 新观众：每个 uid 首次出现所在的桶
+    order = np.argsort(viewers[:, 0], kind="stable")
+    _, first = np.unique(uid[order], return_index=True)
+    new = np.bincount(bins[order][first], minlength=count)
+
+    return {
+        "time": (start + np.arange(count) * bin_seconds).astype(np.int64).tolist(),
+        "revenue": (revenue_gift + revenue_guard + revenue_super_chat).astype(np.int64).tolist(),
+        "revenue_gift": revenue_gift.astype(np.int64).tolist(),
+        "revenue_guard": revenue_guard.astype(np.int64).tolist(),
+        "revenue_super_chat": revenue_super_chat.astype(np.int64).tolist(),
+        "danmaku": counted(tables["danmaku"]).tolist(),
+        "entries": counted(tables["entries"]).tolist(),
+        "active_viewers": active.tolist(),
+        "new_viewers": new.tolist(),
+        "cumulative_viewers": np.cumsum(new).tolist(),
+    }
+
+
+def _top_by_uid(uid: "np.ndarray", weights: "np.ndarray", k: int, largest: bool = True
+                ) -> List[Tuple[int, float]]:
+    """按 uid 汇总 weights，返回前 k 名 (uid, 合计)"""
+    if not len(uid):
+        return []
+    users, inverse = np.unique(uid.astype(np.int64), return_inverse=True)
+    totals = np.bincount(inverse, weights=weights, minlength=len(users))
+    order = np.argsort(-totals if largest else totals, kind="stable")[:k]
+    return [(int(users[i]), float(totals[i])) for i in order]
+
+
+def top_gifters(tables: Dict[str, "np.ndarray"], k: int = 10) -> List[Dict[str, Any]]:
+    """按金瓜子价值（礼物 + 上舰 + 醒目留言）排名的送礼榜"""
+    rows = [(tables["gifts"], GIFT_VALUE), (tables["guards"], GUARD_VALUE), (tables["super_chats"], SC_VALUE)]
+    uid = np.concatenate([array[:, UID] for array, _ in rows])
+    value = np.concatenate([array[:, column] for array, column in rows])
+    mask = (uid > 0) & (value > 0)
+    return [{"uid": u, "value": int(v)} for u, v in _top_by_uid(uid[mask], value[mask], k)]
+
+
+def blind_box_stats(tables: Dict[str, "np.ndarray"], bins: int = 20, k: int = 5) -> Dict[str, Any]:
+    """盲盒盈亏分布"""
+    gifts = tables["gifts"]
+    blind = gifts[gifts[:, BLIND_ORIGINAL] > 0]
+    if not len(blind):
+        return {"events": 0}
+    num = np.maximum(blind[:, GIFT_NUM], 1)
+    original = blind[:, BLIND_ORIGINAL]
+    revealed = blind[:, GIFT_VALUE]
+    diff = revealed - original
+    per_box = diff / num
+    outcome = np.sign(per_box)
+    counts, edges = np.histogram(per_box, bins=bins, weights=num)
+    percentiles = np.percentile(per_box, [5, 25, 50, 75, 95])
+    users = _top_by_uid(blind[:, UID], diff, len(np.unique(blind[:, UID])))
+    return {
+        "events": int(len(blind)),
+        "boxes": int(num.sum()),
+        "original": int(original.sum()),
+        "revealed": int(revealed.sum()),
+        "diff": int(diff.sum()),
+        "return_ratio": float(revealed.sum() / original.sum()),
+        "profit": int(num[outcome > 0].sum()),
+        "loss": int(num[outcome < 0].sum()),
+        "even": int(num[outcome == 0].sum()),
+        "per_box_percentiles": dict(zip(("p5", "p25", "p50", "p75", "p95"), (float(p) for p in percentiles))),
+        "histogram": {"edges": edges.tolist(), "counts": counts.astype(np.int64).tolist()},
+        "users": len(users),
+        "users_in_profit": sum(1 for _, total in users if total > 0),
+        "top_winners": [{"uid": u, "diff": int(v)} for u, v in users[:k] if v > 0],
+        "top_losers": [{"uid": u, "diff": int(v)} for u, v in reversed(users[-k:]) if v < 0],
+    }
+
+
+def pk_trajectories(tables: Dict[str, "np.ndarray"], step: float = 10.0, gap: float = 120.0) -> List[Dict[str, Any]]:
+    """每场 PK 的票数轨迹
+
+    每个房间分别分场：有 pk_id 的消息按 pk_id 分场；没有 pk_id 的（如 PK_INFO）在同一房间内
+    按时间间隔超过 gap 秒分场。
+    """
+    pk = tables["pk"]
+    votes = pk[pk[:, KIND] < TABLES["pk"].index("PK_BATTLE_START_NEW")]
+    if not len(votes):
+        return []
+    ids = votes[:, PK_ID].astype(np.int64)
+    rooms = votes[:, ROOM].astype(np.int64)
+    anonymous = np.flatnonzero(ids == 0)
+    if len(anonymous):
+        anonymous = anonymous[np.lexsort((votes[anonymous, TS], rooms[anonymous]))]
+        ts, room = votes[anonymous, TS], rooms[anonymous]
+        split = np.concatenate(([True], (np.diff(ts) > gap) | (np.diff(room) != 0)))
+        ids[anonymous] = -np.cumsum(split)
+
+    # 按 (房间, 场次, 时间) 排序后在房间或场次边界切分
+    order = np.lexsort((votes[:, TS], ids, rooms))
+    votes, ids, rooms = votes[order], ids[order], rooms[order]
+    bounds = np.flatnonzero((np.diff(ids) != 0) | (np.diff(rooms) != 0)) + 1
+    battles = []
+    for rows in np.split(votes, bounds):
+        ts, own, opponent = rows[:, TS], rows[:, PK_SELF], rows[:, PK_OPPONENT]
+        margin = own - opponent
+        sign = np.sign(margin)
+        sign = sign[sign != 0]
+        samples = np.arange(ts[0], ts[-1] + step, step)
+        at = np.clip(np.searchsorted(ts, samples, side="right") - 1, 0, len(ts) - 1)
+        battles.append({
+            "room_id": int(rows[0, ROOM]),
+            "pk_id": int(rows[0, PK_ID]) or None,
+            "battle_type": int(rows[0, PK_BATTLE_TYPE]),
+            "start": float(ts[0]),
+            "end": float(ts[-1]),
+            "updates": int(len(rows)),
+            "final_self": int(own[-1]),
+            "final_opponent": int(opponent[-1]),
+            "result": "win" if margin[-1] > 0 else "loss" if margin[-1] < 0 else "draw",
+            "lead_changes": int(np.count_nonzero(sign[1:] != sign[:-1])),
+            "max_lead": int(max(margin.max(), 0)),
+            "max_deficit": int(max(-margin.min(), 0)),
+            "trajectory": np.column_stack((samples - ts[0], own[at], opponent[at])).astype(np.int64).tolist(),
+        })
+    battles.sort(key=lambda battle: battle["start"])
+    return battles
+
+
+def analyze(tables: Dict[str, "np.ndarray"], bin_seconds: float = 60.0, top_k: int = 10,
+            pk_step: float = 10.0) -> Dict[str, Any]:
+    """计算完整的分析报告"""
+    _require_numpy()
+    stamps = [array[:, TS] for array in tables.values() if len(array)]
+    counts = {table: int(len(array)) for table, array in tables.items()}
+    if not stamps:
+        return {"counts": counts, "range": None}
+    first = min(float(ts[0]) for ts in stamps)
+    last = max(float(ts[-1]) for ts in stamps)
+    start = first // bin_seconds * bin_seconds
+    bins = int((last - start) // bin_seconds) + 1
+    series = _series(tables, start, bin_seconds, bins)
+    return {
+        "range": {"start": first, "end": last, "bin_seconds": bin_seconds, "bins": bins},
+        "counts": counts,
+        "totals": {
+            "revenue": int(sum(series["revenue"])),
+            "revenue_gift": int(sum(series["revenue_gift"])),
+            "revenue_guard": int(sum(series["revenue_guard"])),
+            "revenue_super_chat": int(sum(series["revenue_super_chat"])),
+            "viewers": int(series["cumulative_viewers"][-1]),
+        },
+        "series": series,
+        "top_gifters": top_gifters(tables, top_k),
+        "blind_box": blind_box_stats(tables),
+        "pk": pk_trajectories(tables, pk_step),
+    }
+
+
+def _fmt_time(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """把报告格式化为终端输出的文本"""
+    if not report.get("range"):
+        return "归档中没有可分析的事件"
+    span, totals, series = report["range"], report["totals"], report["series"]
+    unit = span["bin_seconds"]
+    lines = [
+        f"时间范围: {_fmt_time(span['start'])} ~ {_fmt_time(span['end'])}（{span['bins']} 个 {unit:g} 秒的时间桶）",
+        "事件数: " + ", ".join(f"{table} {count}" for table, count in report["counts"].items()),
+        f"流水: 共 {totals['revenue'] / 1000:.1f} 元（礼物 {totals['revenue_gift'] / 1000:.1f}、"
+        f"上舰 {totals['revenue_guard'] / 1000:.1f}、醒目留言 {totals['revenue_super_chat'] / 1000:.1f}）",
+    ]
+    for name, label in (("revenue", "流水(金瓜子)"), ("danmaku", "弹幕数"), ("active_viewers", "活跃观众")):
+        values = series[name]
+        peak = max(range(len(values)), key=values.__getitem__)
+        lines.append(f"{label}: 每桶平均 {sum(values) / len(values):.1f}，峰值 {values[peak]}"
+                     f"（{_fmt_time(series['time'][peak])}）")
+    lines.append(f"独立观众: {totals['viewers']}")
+    if report["top_gifters"]:
+        lines.append("送礼榜: " + ", ".join(f"{g['uid']}({g['value'] / 1000:.1f}元)" for g in report["top_gifters"]))
+    blind = report["blind_box"]
+    if blind.get("events"):
+        p = blind["per_box_percentiles"]
+        lines.append(f"盲盒: {blind['boxes']} 个，原价 {blind['original'] / 1000:.1f} 元，开出 "
+                     f"{blind['revealed'] / 1000:.1f} 元，返还率 {blind['return_ratio']:.1%}，"
+                     f"盈/亏/平 {blind['profit']}/{blind['loss']}/{blind['even']}，"
+                     f"单个盈亏中位数 {p['p50']:.0f}（p5 {p['p5']:.0f}，p95 {p['p95']:.0f}）")
+    for battle in report["pk"]:
+        lines.append(f"房间 {battle['room_id']} PK {battle['pk_id'] or '-'}: {_fmt_time(battle['start'])} 持续 "
+                     f"{battle['end'] - battle['start']:.0f} 秒，{battle['final_self']}:{battle['final_opponent']} "
+                     f"{battle['result']}，领先变化 {battle['lead_changes']} 次，最大领先 {battle['max_lead']}，"
+                     f"最大落后 {battle['max_deficit']}")
+    return "\n".join(lines)
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """解析时间参数：Unix 时间戳或本地时间 "YYYY-MM-DD[ HH:MM[:SS]]" """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"无法解析的时间: {value}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="归档事件的离线分析")
+    parser.add_argument("paths", nargs="+", help="归档文件或目录")
+    parser.add_argument("--room", type=int, help="只分析指定房间")
+    parser.add_argument("--since", type=parse_time, help="起始时间（时间戳或 \"YYYY-MM-DD HH:MM\"）")
+    parser.add_argument("--until", type=parse_time, help="结束时间（不含）")
+    parser.add_argument("--bin", type=float, default=60.0, help="时间桶宽度(秒)")
+    parser.add_argument("--top", type=int, default=10, help="送礼榜条数")
+    parser.add_argument("--pk-step", type=float, default=10.0, help="PK 票数轨迹的采样步长(秒)")
+    parser.add_argument("--chunk-size", type=int, default=200000, help="每块转换为数组的行数")
+    parser.add_argument("--no-cache", action="store_true", help="不读写 .npz 缓存")
+    parser.add_argument("--json", type=str, help="把完整报告（含各项时间序列）写入 JSON 文件，- 表示标准输出")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if np is None:
+        parser.error("离线分析需要 numpy（pip install numpy）")
+
+    started = time.perf_counter()
+    tables = load_archive(args.paths, args.room, args.since, args.until, args.chunk_size, not args.no_cache)
+    loaded = time.perf_counter()
+    report = analyze(tables, args.bin, args.top, args.pk_step)
+    done = time.perf_counter()
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, ensure_ascii=False)
+        sys.stdout.write("\n")
+        return
+    print(format_report(report))
+    print(f"加载 {loaded - started:.2f} 秒，计算 {done - loaded:.2f} 秒")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False)
+        print(f"完整报告已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""API 批量发送
+
+按端点收集事件，达到条数上限或等待时间上限时以 JSON 数组一次性发送。
+对只接受单条事件的后端，提供拆批兼容（客户端逐条发送 / 服务端 unwrap_batch）。
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Callable, Iterable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def unwrap_batch(body: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """把请求体统一拆成单条事件列表
+
+    后端兼容层可用：批量请求体是事件数组，单条请求体是一个对象
+    """
+    if isinstance(body, list):
+        return [item for item in body if isinstance(item, dict)]
+    if isinstance(body, dict):
+        return [body]
+    return []
+
+
+class EndpointBatcher:
+    """按端点攒批的发送器"""
+
+    def __init__(self, send: Callable[[str, Any], tuple], max_items: int = 20, max_delay_ms: int = 500,
+                 unwrap_endpoints: Optional[Iterable[str]] = None):
+        """
+        Args:
+            send: 实际发送函数 send(endpoint, body) -> (成功标志, 状态码)
+            max_items: 每批最多条数，达到即发送
+            max_delay_ms: 批次中最早一条事件的最长等待时间（毫秒）
+            unwrap_endpoints: 后端只接受单条事件的端点，批次在发送时拆开逐条发送
+        """
+        self.send = send
+        self.max_items = max(1, int(max_items))
+        self.max_delay = max(0, int(max_delay_ms)) / 1000.0
+        self.unwrap_endpoints = set(unwrap_endpoints or [])
+        self._batches: Dict[str, List[Dict[str, Any]]] = {}
+        self._first_at: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        # 统计
+        self.events_queued = 0
+        self.batches_sent = 0
+        self.batches_failed = 0
+        self.requests_saved = 0
+        self._thread = threading.Thread(target=self._run, name="api-batcher", daemon=True)
+        self._thread.start()
+
+    def add(self, endpoint: str, payload: Dict[str, Any]) -> None:
+        """加入一条事件（只做入队，不阻塞调用方）"""
+        with self._cond:
+            batch = self._batches.setdefault(endpoint, [])
+            if not batch:
+                self._first_at[endpoint] = time.monotonic()
+            batch.append(payload)
+            self.events_queued += 1
+            if len(batch) >= self.max_items or len(batch) == 1:
+                self._cond.notify()
+
+    def flush(self, endpoint: Optional[str] = None) -> None:
+        """立即发送指定端点（默认所有端点）的待发事件"""
+        with self._cond:
+            endpoints = [endpoint] if endpoint else list(self._batches.keys())
+            ready = [(ep, self._take(ep)) for ep in endpoints]
+        for ep, items in ready:
+            if items:
+                self._send_batch(ep, items)
+
+    def stop(self) -> None:
+        """停止后台线程并发送剩余事件"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """返回批量发送统计"""
+        with self._cond:
+            return {
+                "events_queued": self.events_queued,
+                "batches_sent": self.batches_sent,
+                "batches_failed": self.batches_failed,
+                "requests_saved": self.requests_saved,
+                "pending": sum(len(b) for b in self._batches.values()),
+            }
+
+    def _take(self, endpoint: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """取出端点的待发事件（需持有锁），超过 limit 的部分留到下一批"""
+        batch = self._batches.get(endpoint, [])
+        if limit is not None and len(batch) > limit:
+            self._batches[endpoint] = batch[limit:]
+            self._first_at[endpoint] = time.monotonic()
+            return batch[:limit]
+        self._first_at.pop(endpoint, None)
+        return self._batches.pop(endpoint, [])
+
+    def _send_batch(self, endpoint: str, items: List[Dict[str, Any]]) -> None:
+        try:
+            if endpoint in self.unwrap_endpoints:
+                for item in items:
+                    self.send(endpoint, item)
+                saved, failed = 0, 0
+            else:
+                success, status_code = self.send(endpoint, items)
+                # 失败的批次没有真正省下请求，单独计数
+                saved, failed = (len(items) - 1, 0) if success else (0, 1)
+                if not success:
+                    logger.error(f"❌ 批量发送失败: /{endpoint} 共 {len(items)} 条, 状态码: {status_code}")
+            with self._cond:
+                self.batches_sent += 1
+                self.batches_failed += failed
+                self.requests_saved += saved
+        except Exception as e:
+            logger.error(f"❌ 批量发送 /{endpoint} 时出错: {e}")
+
+    def _run(self) -> None:
+        """后台线程：按条数或等待时间触发发送"""
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                ready = []
+                next_due = None
+                for endpoint in list(self._batches.keys()):
+                    due = self._first_at[endpoint] + self.max_delay
+                    if len(self._batches[endpoint]) >= self.max_items or due <= now:
+                        ready.append((endpoint, self._take(endpoint, self.max_items)))
+                    elif next_due is None or due < next_due:
+                        next_due = due
+                if not ready:
+                    self._cond.wait(None if next_due is None else max(0.0, next_due - now))
+                    continue
+                self._cond.release()
+                try:
+                    for endpoint, items in ready:
+                        self._send_batch(endpoint, items)
+                finally:
+                    self._cond.acquire()
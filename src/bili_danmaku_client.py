@@ -9,7 +9,20 @@ from typing import Optional
 from .fetch import fetch_server_info
 from .packet import create_handshake_packet, create_heartbeat_packet
 from .parser_handler import BiliMessageParser
-from .config import API_BASE_URL
+from .config import (
+    API_BASE_URL,
+    WS_URL_OVERRIDE,
+    WS_RECONNECT_ENABLED,
+    WS_RECONNECT_BASE_DELAY,
+    WS_RECONNECT_MAX_DELAY,
+    LIVENESS_ENABLED,
+    LIVENESS_ACK_TIMEOUT,
+    LIVENESS_MIN_SILENCE,
+    LIVENESS_MAX_SILENCE,
+    LIVENESS_SILENCE_FACTOR,
+)
+from .metrics import metrics
+from .liveness import LivenessMonitor
 
 # 设置日志
 logging.basicConfig(
@@ -24,12 +37,19 @@ logger = logging.getLogger(__name__)
 # 确保日志立即输出
 logging.getLogger().handlers[0].flush = lambda: sys.stdout.flush()
 
+metrics.describe("ws_connections_total", "WebSocket 连接建立次数")
+metrics.describe("ws_reconnects_total", "WebSocket 重连次数（首次连接之后的连接）")
+metrics.describe("ws_disconnects_total", "WebSocket 连接关闭次数")
+metrics.describe("ws_errors_total", "WebSocket 错误次数")
+
 
 class BiliDanmakuClient:
-    def __init__(self, room_id, spider=False, api_base_url=None, debug_events: bool = False, cookie: Optional[str] = None, debug_ws: bool = False):
+    def __init__(self, room_id, spider=False, api_base_url=None, debug_events: bool = False, cookie: Optional[str] = None, debug_ws: bool = False,
+                 ws_url: Optional[str] = None):
         self.room_id = room_id  # 房间号
         self.spider = spider    # 是否启用爬虫功能
         self.ws_url = None      # WebSocket 地址
+        self.ws_url_override = ws_url or WS_URL_OVERRIDE  # 直连地址（跳过 getDanmuInfo）
         self.token = None       # 动态获取的 token 
         self.ws = None
         self.heartbeat_interval = 30  # 心跳间隔时间（秒）
@@ -47,6 +67,11 @@ class BiliDanmakuClient:
         self.buvid3 = ''
         self.buvid4 = ''
         self.heartbeat_started = False
+        self.connections = 0  # 已建立的连接次数，大于1说明发生过重连
+        self.liveness: Optional[LivenessMonitor] = None  # 当前连接的活性监测
+        self._conn_closed = threading.Event()  # 当前连接已关闭（通知心跳线程退出）
+        self._stall_reconnect = False  # 因卡死主动断开，下次立即重连
+        self._stopped = threading.Event()
         self.parser = BiliMessageParser(
             room_id,
             api_base_url=self.api_base_url or API_BASE_URL,
@@ -84,17 +109,27 @@ class BiliDanmakuClient:
     def create_heartbeat_packet(self):
         return create_heartbeat_packet()
 
-    def send_heartbeat(self):
-        """定时发送心跳包"""
-        while self.ws:
+    def send_heartbeat(self, ws, closed: threading.Event):
+        """定时发送心跳包（每个连接一个线程，连接关闭后退出）"""
+        while not closed.is_set():
+            monitor = self.liveness
+            if monitor:
+                monitor.heartbeat_sent()
             try:
-                self.ws.send(self.create_heartbeat_packet(), ABNF.OPCODE_BINARY)
-                time.sleep(self.heartbeat_interval)
-            except Exception:
+                ws.send(self.create_heartbeat_packet(), ABNF.OPCODE_BINARY)
+            except Exception as e:
+                logger.warning(f"⚠️ 心跳发送失败: {e}")
                 break
+            closed.wait(self.heartbeat_interval)
 
     def on_open(self, ws):
         logger.info("✅ WebSocket 连接已建立")
+        self._conn_closed = threading.Event()
+        self.heartbeat_started = False
+        self.connections += 1
+        metrics.inc("ws_connections_total", room=self.room_id)
+        if self.connections > 1:
+            metrics.inc("ws_reconnects_total", room=self.room_id)
         handshake_packet = self.create_handshake_packet()
         ws.send(handshake_packet, ABNF.OPCODE_BINARY)
         logger.info("✅ 认证包发送成功")
@@ -103,22 +138,77 @@ class BiliDanmakuClient:
         """认证成功后启动心跳，不要在 on_open 里就发，避免早发导致被断开"""
         if not self.heartbeat_started:
             self.heartbeat_started = True
-            threading.Thread(target=self.send_heartbeat, daemon=True).start()
+            ws = self.ws
+            if LIVENESS_ENABLED:
+                self.liveness = LivenessMonitor(
+                    self.room_id,
+                    send_probe=lambda: ws.send(self.create_heartbeat_packet(), ABNF.OPCODE_BINARY),
+                    on_stall=self._on_stall,
+                    ack_timeout=LIVENESS_ACK_TIMEOUT,
+                    min_silence=LIVENESS_MIN_SILENCE,
+                    max_silence=LIVENESS_MAX_SILENCE,
+                    silence_factor=LIVENESS_SILENCE_FACTOR,
+                )
+                self.parser.liveness = self.liveness
+                self.liveness.start()
+            threading.Thread(target=self.send_heartbeat, args=(ws, self._conn_closed), daemon=True).start()
             logger.info("✅ 已收到认证通过，启动心跳线程")
 
+    def _on_stall(self, reason: str):
+        """活性监测判定卡死：关闭当前连接，由 start 中的循环立即重连"""
+        self._stall_reconnect = True
+        if self.ws:
+            self.ws.close()
+
     def on_message(self, ws, message):
         self.parser.parse_message(message)
 
     def on_error(self, ws, error):
         logger.error(f"❌ WebSocket 错误: {error}")
+        metrics.inc("ws_errors_total", room=self.room_id)
 
     def on_close(self, ws, close_status_code, close_msg):
         logger.info(f"❌ WebSocket 连接已关闭，状态码: {close_status_code}, 原因: {close_msg}")
+        metrics.inc("ws_disconnects_total", room=self.room_id)
+        self._connection_closed()
 
-    def start(self):
-        if not self.fetch_server_info():
-            return
+    def _connection_closed(self):
+        """结束当前连接的心跳线程与活性监测"""
+        self._conn_closed.set()
+        if self.liveness:
+            self.liveness.stop()
+            self.liveness = None
+        self.parser.liveness = None
 
+    def start(self):
+        """连接并保持运行：断线或判定卡死后自动重连（失败时指数退避），直到调用 stop()"""
+        delay = WS_RECONNECT_BASE_DELAY
+        while not self._stopped.is_set():
+            started_at = time.monotonic()
+            if self.fetch_server_info():
+                self._run_once()
+            if self._stopped.is_set() or not WS_RECONNECT_ENABLED:
+                break
+            # 稳定运行过一段时间的连接断开后，退避从头开始
+            if time.monotonic() - started_at > WS_RECONNECT_MAX_DELAY:
+                delay = WS_RECONNECT_BASE_DELAY
+            if self._stall_reconnect:
+                self._stall_reconnect = False
+                logger.info(f"🔄 立即重连直播间 {self.room_id}")
+                continue
+            logger.info(f"🔄 {delay:g} 秒后重连直播间 {self.room_id}")
+            self._stopped.wait(delay)
+            delay = min(delay * 2, WS_RECONNECT_MAX_DELAY)
+
+    def stop(self):
+        """停止客户端（不再重连），并输出解析器中仍在合并窗口内的记录"""
+        self._stopped.set()
+        if self.ws:
+            self.ws.close()
+        self.parser.stop()
+
+    def _run_once(self):
+        """建立一次 WebSocket 连接并阻塞到连接关闭"""
         if self.debug_ws:
             logger.info(f"[WS] 即将连接: url={self.ws_url}")
 
@@ -139,3 +229,5 @@ class BiliDanmakuClient:
             logger.info("[WS] Trace 已启用（底层帧将打印到stdout）")
 
         self.ws.run_forever()
+        # run_forever 异常退出时不一定回调 on_close
+        self._connection_closed()
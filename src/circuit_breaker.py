@@ -0,0 +1,139 @@
+"""端点熔断器
+
+每个 API 端点一个熔断器，三种状态：
+  closed    正常放行，统计最近 N 次调用的失败率和慢调用率
+  open      失败率或慢调用率超过阈值后打开，直接拒绝请求，不再等待超时
+  half_open 打开一段时间后放行少量探测请求，成功则关闭，失败则重新打开
+状态切换写入指标 circuit_transitions_total / circuit_state。
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Deque, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 导出到 circuit_state 仪表盘的数值
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+metrics.describe("circuit_state", "端点熔断器状态（0=closed, 1=open, 2=half_open）")
+metrics.describe("circuit_transitions_total", "端点熔断器状态切换次数")
+
+
+class CircuitBreaker:
+    """单个端点的熔断器"""
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call_seconds: float = 3.0, slow_call_rate: float = 0.8, open_seconds: float = 15.0,
+                 half_open_calls: int = 1):
+        """
+        Args:
+            name: 熔断器名称（端点名），用于日志和指标标签
+            window: 统计最近多少次调用
+            min_calls: 窗口内至少有多少次调用才进行判定
+            error_rate: 失败率阈值，达到即打开
+            slow_call_seconds: 超过该耗时的调用计为慢调用
+            slow_call_rate: 慢调用率阈值，达到即打开
+            open_seconds: 打开状态持续多久后进入半开
+            half_open_calls: 半开状态允许同时进行的探测请求数
+        """
+        self.name = name
+        self.min_calls = max(1, int(min_calls))
+        self.error_rate = float(error_rate)
+        self.slow_call_seconds = float(slow_call_seconds)
+        self.slow_call_rate = float(slow_call_rate)
+        self.open_seconds = float(open_seconds)
+        self.half_open_calls = max(1, int(half_open_calls))
+
+        self.state = CLOSED
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=max(1, int(window)))
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+        metrics.set_gauge("circuit_state", STATE_VALUES[CLOSED], endpoint=name)
+
+    def allow(self) -> bool:
+        """是否放行本次请求"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_calls:
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def record(self, success: bool, elapsed: float) -> None:
+        """记录一次调用结果
+
+        Args:
+            success: 调用是否成功（业务性 4xx 应计为成功，只统计后端故障）
+            elapsed: 调用耗时（秒）
+        """
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if success and not slow:
+                    self._calls.clear()
+                    self._transition(CLOSED)
+                else:
+                    self._open()
+                return
+            if self.state == OPEN:
+                return
+            self._calls.append((success, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            total = len(self._calls)
+            failures = sum(1 for ok, _ in self._calls if not ok)
+            slow_calls = sum(1 for _, is_slow in self._calls if is_slow)
+            if failures / total >= self.error_rate or slow_calls / total >= self.slow_call_rate:
+                logger.warning(f"⚡ /{self.name} 最近 {total} 次调用失败 {failures} 次、慢调用 {slow_calls} 次，熔断器打开")
+                self._open()
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self._transition(OPEN)
+
+    def _transition(self, new_state: str) -> None:
+        """切换状态并记录指标（需持有锁）"""
+        if new_state == self.state:
+            return
+        old_state = self.state
+        self.state = new_state
+        metrics.inc("circuit_transitions_total", endpoint=self.name, from_state=old_state, to_state=new_state)
+        metrics.set_gauge("circuit_state", STATE_VALUES[new_state], endpoint=self.name)
+        logger.info(f"⚡ 熔断器 /{self.name}: {old_state} -> {new_state}")
+
+
+class CircuitBreakerRegistry:
+    """按端点懒创建熔断器"""
+
+    def __init__(self, **config):
+        self.config = config
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(endpoint, **self.config)
+            return breaker
+
+    def states(self) -> Dict[str, str]:
+        """返回所有熔断器的当前状态"""
+        with self._lock:
+            return {name: breaker.state for name, breaker in self._breakers.items()}
@@ -11,6 +11,10 @@
 # 格式为：http://IP地址:端口号 或 https://域名
 API_BASE_URL = "http://127.0.0.1:8081"
 
+# 直连的弹幕 WebSocket 地址，设置后跳过 getDanmuInfo 接口（token 为空）
+# 用于连接本地模拟广播服务器，例如 "ws://127.0.0.1:2245/sub"；None 表示正常获取
+WS_URL_OVERRIDE = None
+
 #############################################
 # 系统参数
 #############################################
@@ -54,4 +58,400 @@ PK_OPPONENT_VOTES_THRESHOLD = 100
 GUARD_MODE_KEYWORDS = ["前进一", "前进二", "前进三", "前进四"]
 
 # 保卫模式票数差值（比对方多送的票数）
-GUARD_MODE_VOTE_DIFFERENCE = 2 
\ No newline at end of file
+GUARD_MODE_VOTE_DIFFERENCE = 2
+
+# 保卫模式状态分片数量（按房间分片加锁，多房间共用进程时互不争抢）
+GUARD_MODE_SHARD_COUNT = 16
+
+# 保卫模式状态持久化文件，PK中途重启后可恢复已激活的保卫模式；设为 None 则不持久化
+GUARD_MODE_STATE_FILE = "guard_mode_state.json"
+
+#############################################
+# 礼物连击聚合配置
+#############################################
+# 连击礼物合并窗口(秒)：同一用户、同一礼物、同一 batch_combo_id 在窗口内合并为一条 /money 记录
+# 设为 0 则不合并，每个 SEND_GIFT 都单独发送
+GIFT_COMBO_WINDOW = 3.0
+
+#############################################
+# 上舰事件关联配置
+#############################################
+# 同一次上舰的 GUARD_BUY 与 USER_TOAST_MSG 的关联窗口(秒)：按 uid + guard_level 匹配，合并为一条 /guard 记录
+# 只收到其中一条时窗口结束后单独发送；设为 0 则不关联，两条消息各自上报
+GUARD_CORRELATION_WINDOW = 2.0
+
+#############################################
+# 进场特效限流配置
+#############################################
+# 是否对 /entry_welcome 上报限流（舰长及以上总是放行）
+ENTRY_THROTTLE_ENABLED = True
+
+# 同一用户两次欢迎的最短间隔(秒)，0 表示不按用户冷却
+ENTRY_THROTTLE_COOLDOWN = 300.0
+
+# 每秒欢迎的普通用户数上限，进场速率超过时按比例随机抽样；0 表示不抽样
+ENTRY_THROTTLE_TARGET_RATE = 5.0
+
+# 冷却表最多记录的用户数（超出时淘汰最早的记录）
+ENTRY_THROTTLE_MAX_USERS = 20000
+
+# guard_level 在 1~该值之间的用户总是放行（1总督 2提督 3舰长），0 表示只按 is_captain 放行
+ENTRY_THROTTLE_PASS_GUARD_LEVEL = 3
+
+# 按房间覆盖上面的参数，例如：
+#   12345: {"target_rate": 20, "cooldown": 60},
+#   67890: {"enabled": False},
+ENTRY_THROTTLE_ROOM_OVERRIDES = {}
+
+#############################################
+# 弹幕触发限流配置
+#############################################
+# 按触发类型限制 /chatbot、/sendlike、/setting 的调用频率（令牌桶，速率单位为 次/秒）：
+#   user_rate / user_burst  单个用户的补充速率与突发量
+#   room_rate / room_burst  整个房间的补充速率与突发量
+# 速率 <=0 表示该级不限流；设为 {} 则完全不限流
+DANMAKU_TRIGGER_LIMITS = {
+    "chatbot": {"user_rate": 0.1, "user_burst": 3, "room_rate": 1.0, "room_burst": 10},
+    "sendlike": {"user_rate": 1 / 30, "user_burst": 2, "room_rate": 0.5, "room_burst": 5},
+    "setting": {"user_rate": 0.1, "user_burst": 3, "room_rate": 1.0, "room_burst": 5},
+}
+
+# 每种触发类型最多跟踪的用户数（超出时淘汰最久未触发的用户）
+DANMAKU_TRIGGER_MAX_USERS = 10000
+
+#############################################
+# 用户资料缓存配置
+#############################################
+# 缓存的用户数（所有房间共享，按 房间+uid 存放，LRU 淘汰）；0 表示不缓存
+USER_PROFILE_CACHE_SIZE = 50000
+
+# 缓存资料的有效期(秒)，过期后从下一条消息重新提取；上舰时立即失效
+USER_PROFILE_TTL = 600.0
+
+# 请求体中携带用户资料的方式：
+#   "full"    每个请求都带完整资料（头像、名称色、财富等级、勋章等）
+#   "changed" 同一版本的资料只完整发送一次，之后只带 uid 与 profile_version（需后端按 uid 缓存）
+USER_PROFILE_ATTACH = "full"
+
+#############################################
+# 礼物目录配置
+#############################################
+# 是否按 gift_id 缓存礼物的静态字段（名称、类型、图标与动画资源），同一礼物不再逐条构造
+GIFT_CATALOG_ENABLED = True
+
+# 礼物目录持久化文件；设为 None 则只保存在内存中
+GIFT_CATALOG_FILE = "gift_catalog.json"
+
+# 目录条目的有效期(秒)，过期后从下一条礼物消息重新学习
+GIFT_CATALOG_REFRESH = 86400.0
+
+# /money 请求体中礼物静态字段的发送方式：
+#   "full" 每条记录都带图标与动画资源（gift_assets、tag_image 等）
+#   "id"   只带 gift_id、名称与价格，其余由后端按礼物目录补全（需配合 GIFT_CATALOG_SYNC_ENDPOINT）
+GIFT_CATALOG_PAYLOAD = "full"
+
+# 新增或变化的礼物条目发送到的端点（请求体 {"room_id", "gifts": [...]}），None 表示不发送
+GIFT_CATALOG_SYNC_ENDPOINT = None
+
+#############################################
+# API 批量发送配置
+#############################################
+# 是否启用批量模式：开启后下列端点的事件先在本地攒批，再以 JSON 数组一次性 POST
+API_BATCH_ENABLED = False
+
+# 参与批量发送的端点
+API_BATCH_ENDPOINTS = ["ticket", "setting", "money", "guard", "entry_welcome", "live_room_spider"]
+
+# 延迟敏感、始终立即单条发送的端点（优先于 API_BATCH_ENDPOINTS）
+API_BATCH_OPT_OUT = ["pk_wanzun", "guard_mode", "chatbot", "sendlike"]
+
+# 每批最多条数，达到即发送
+API_BATCH_MAX_ITEMS = 20
+
+# 每批最长等待时间(毫秒)，到时即发送
+API_BATCH_MAX_DELAY_MS = 500
+
+# 兼容模式：后端只接受单条事件的端点，批次在客户端拆开后逐条发送
+API_BATCH_UNWRAP_ENDPOINTS = []
+
+#############################################
+# 发件箱（失败重试）配置
+#############################################
+# 是否启用发件箱：下列端点请求失败时写入磁盘，由后台线程按退避策略重发
+OUTBOX_ENABLED = True
+
+# 发件箱目录
+OUTBOX_DIR = "outbox"
+
+# 失败后需要持久化重发的端点（礼物流水、上舰记录等不能丢的数据）
+OUTBOX_ENDPOINTS = ["money", "guard"]
+
+# 单个分段文件大小上限(字节)，超过后滚动到新分段
+OUTBOX_SEGMENT_BYTES = 4 * 1024 * 1024
+
+# 发件箱总磁盘占用上限(字节)，超过时丢弃最旧的分段
+OUTBOX_MAX_BYTES = 256 * 1024 * 1024
+
+# 批量 fsync 间隔(毫秒)
+OUTBOX_FSYNC_INTERVAL_MS = 200
+
+# 重试退避的初始间隔与最大间隔(秒)，每次失败间隔翻倍
+OUTBOX_RETRY_BASE_DELAY = 1.0
+OUTBOX_RETRY_MAX_DELAY = 60.0
+
+#############################################
+# 熔断与降载配置
+#############################################
+# 是否为每个API端点启用熔断器：后端故障时快速失败，不再逐个等待超时
+CIRCUIT_BREAKER_ENABLED = True
+
+# 统计最近多少次调用，以及至少多少次调用后才开始判定
+CIRCUIT_BREAKER_WINDOW = 20
+CIRCUIT_BREAKER_MIN_CALLS = 5
+
+# 失败率阈值：窗口内失败比例达到该值即熔断
+CIRCUIT_BREAKER_ERROR_RATE = 0.5
+
+# 慢调用阈值(秒)与慢调用率阈值：慢调用比例达到该值也会熔断
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS = 3.0
+CIRCUIT_BREAKER_SLOW_CALL_RATE = 0.8
+
+# 熔断后多久(秒)进入半开状态并放行探测请求
+CIRCUIT_BREAKER_OPEN_SECONDS = 15
+
+# 半开状态同时放行的探测请求数
+CIRCUIT_BREAKER_HALF_OPEN_CALLS = 1
+
+# 熔断期间各端点的处理策略："spool" 写入发件箱稍后重发，"drop" 直接丢弃
+# 未列出的端点默认丢弃
+CIRCUIT_OPEN_POLICY = {
+    "money": "spool",
+    "guard": "spool",
+}
+
+#############################################
+# 出站请求优先级通道配置
+#############################################
+# 是否启用优先级通道：各通道独立排队、独立工作线程、独立限流，
+# 批量上报的洪峰不会拖慢PK绝杀等关键请求
+OUTBOUND_LANES_ENABLED = True
+
+# 通道定义：
+#   endpoints  归属该通道的端点
+#   workers    工作线程数
+#   rate/burst 令牌桶限流（请求/秒、突发容量），rate<=0 表示不限流
+#   queue_size 队列长度上限，满了以后新请求被拒绝（可持久化的端点会写入发件箱）
+#   wait       调用方是否等待请求完成；批量通道入队即返回，不阻塞消息处理
+OUTBOUND_LANES = {
+    "critical": {
+        "endpoints": ["pk_wanzun", "guard_mode"],
+        "workers": 2, "rate": 0, "burst": 1, "queue_size": 100, "wait": True,
+    },
+    "interactive": {
+        "endpoints": ["chatbot", "sendlike", "setting"],
+        "workers": 2, "rate": 10, "burst": 20, "queue_size": 200, "wait": True,
+    },
+    # 礼物与上舰记录单独排队且不限流，进场洪峰不会挤占它们的额度或让它们被拒绝
+    "revenue": {
+        "endpoints": ["money", "guard"],
+        "workers": 2, "rate": 0, "burst": 1, "queue_size": 5000, "wait": False,
+    },
+    "bulk": {
+        "endpoints": ["entry_welcome", "ticket", "live_room_spider"],
+        "workers": 4, "rate": 50, "burst": 100, "queue_size": 5000, "wait": False,
+    },
+}
+
+# 未在上面列出的端点所使用的通道
+OUTBOUND_DEFAULT_LANE = "bulk"
+
+#############################################
+# 请求体投影配置
+#############################################
+# 是否在发送前按端点规则裁剪请求体（后端只读取少量字段，完整原始消息往往有几 KB）
+# 默认关闭：部分后端仍从 raw_message 读取字段，确认后端兼容后再开启
+PAYLOAD_PROJECTION_ENABLED = False
+
+# 调试开关：开启后 raw 规则为 "debug" 的端点仍携带完整的 raw_message（--debug-events 也会开启）
+PAYLOAD_PROJECTION_DEBUG_RAW = False
+
+# 每个端点的投影规则，字段路径可用 "a.b" 表示嵌套字段：
+#   "include": [...]  只保留这些字段
+#   "exclude": [...]  去掉这些字段
+#   "raw": "always" 保留 raw_message / "never" 去掉 / "debug" 仅调试开关打开时保留
+#   "raw_fields": {...}  去掉 raw_message 前从中提取到顶层的字段，路径中的数字为列表下标
+# 未列出的端点不做裁剪
+# ticket、setting、sendlike、guard_mode 的请求体本身不含发送者，uid 与 uname 从弹幕 info[2] 中提取
+_DANMAKU_SENDER = {"uid": "info.2.0", "uname": "info.2.1"}
+PAYLOAD_PROJECTION_RULES = {
+    "ticket": {"raw": "debug", "raw_fields": _DANMAKU_SENDER},
+    "setting": {"raw": "debug", "raw_fields": _DANMAKU_SENDER},
+    "chatbot": {"raw": "debug"},
+    "sendlike": {"raw": "debug", "raw_fields": _DANMAKU_SENDER},
+    "guard_mode": {"raw": "debug", "raw_fields": _DANMAKU_SENDER},
+    "guard": {"raw": "debug"},
+    "entry_welcome": {"raw": "debug"},
+}
+
+# 每多少次投影抽样统计一次节省的字节数
+PAYLOAD_PROJECTION_SAMPLE_EVERY = 10
+
+#############################################
+# 请求体编码配置
+#############################################
+# 按端点协商请求体格式，需后端支持：
+#   "format":   "json"（默认）或 "msgpack"（需 pip install msgpack，未安装时退回 JSON）
+#   "compress": None 或 "gzip"（设置 Content-Encoding: gzip）
+# 未列出的端点使用未压缩的 JSON，例如：
+#   "money": {"format": "msgpack", "compress": "gzip"},
+#   "entry_welcome": {"compress": "gzip"},
+API_PAYLOAD_ENCODINGS = {}
+
+# 请求体不小于该字节数时才进行 gzip 压缩
+API_GZIP_MIN_BYTES = 1024
+
+#############################################
+# 延迟追踪配置
+#############################################
+# 是否记录消息从服务器时间戳到 API 响应的各阶段耗时（写入 trace_* 直方图）
+TRACING_ENABLED = True
+
+# 附带 X-Trace-Id 请求头并记录完整时间线（DEBUG 日志）的消息比例
+TRACE_SAMPLE_RATE = 0.01
+
+#############################################
+# 指标导出配置
+#############################################
+# Prometheus 指标 HTTP 服务端口（GET /metrics），None 表示不启动；命令行 --metrics-port 优先
+METRICS_PORT = None
+
+# 指标服务监听地址
+METRICS_HOST = "0.0.0.0"
+
+#############################################
+# 性能剖析配置
+#############################################
+# 收到 SIGUSR1 时采样剖析的时长(秒)，结果写入 PROFILER_OUTPUT_DIR（collapsed stacks，可生成火焰图）
+PROFILER_SIGNAL_SECONDS = 30
+
+# 剖析结果目录
+PROFILER_OUTPUT_DIR = "profiles"
+
+# 启动时是否打开热点计时（parse_message、_handle_message、各处理器 handle 的耗时写入 hotpath_seconds）
+# 关闭时也可在剖析期间或通过指标服务的 /debug/timings?enable=1 临时打开
+HOTPATH_TIMINGS_ENABLED = False
+
+#############################################
+# 断线重连与活性监测配置
+#############################################
+# 连接断开或判定卡死后是否自动重连
+WS_RECONNECT_ENABLED = True
+
+# 重连失败时的退避时间(秒)：从 BASE 开始翻倍，不超过 MAX；判定卡死后的第一次重连不等待
+WS_RECONNECT_BASE_DELAY = 1.0
+WS_RECONNECT_MAX_DELAY = 30.0
+
+# 是否启用连接活性监测（跟踪 op=3 心跳回复与 op=5 消息，发现半开连接后主动重连）
+LIVENESS_ENABLED = True
+
+# 心跳发出后多少秒内没有收到 op=3 即判定卡死
+LIVENESS_ACK_TIMEOUT = 5.0
+
+# 连接沉默多久后发探测心跳：clamp(SILENCE_FACTOR × 消息平均间隔, MIN_SILENCE, MAX_SILENCE)
+# 热闹的房间几秒没消息就会探测，冷清的房间最多等 MAX_SILENCE 秒
+LIVENESS_MIN_SILENCE = 5.0
+LIVENESS_MAX_SILENCE = 45.0
+LIVENESS_SILENCE_FACTOR = 10.0
+
+#############################################
+# 消息去重配置
+#############################################
+# 是否按自然ID（DANMU_MSG 的 extra.id_str、SEND_GIFT 的 tid/rnd、USER_TOAST_MSG 的 payflow_id）
+# 丢弃重连或重发造成的重复消息
+DEDUP_ENABLED = True
+
+# 去重时间窗口(秒)，分为 DEDUP_GENERATIONS 代轮换；ID 至少保留 窗口×(代数-1)/代数 秒
+DEDUP_WINDOW = 300.0
+DEDUP_GENERATIONS = 4
+
+# 弹幕布隆过滤器每代预计的消息数与目标误判率，决定每个房间固定占用的内存（默认约 4×90KB）
+# 容量应不低于 弹幕峰值速率×窗口/代数，默认可承受约 650 条/秒，超过后误判率升高（见 dedup_false_positive_ratio）
+DEDUP_CAPACITY = 50000
+DEDUP_FALSE_POSITIVE_RATE = 0.001
+
+# 礼物与上舰消息使用精确的ID集合（不会误丢流水），窗口内最多保留的ID数
+DEDUP_EXACT_MAX_IDS = 100000
+
+#############################################
+# 礼物流水聚合配置
+#############################################
+# 是否在客户端增量维护每个房间的流水、送礼榜、礼物榜、盲盒盈亏与每分钟流水
+REVENUE_ENABLED = True
+
+# 流水快照发送到的端点（请求体为紧凑快照 JSON），None 表示不发送，只能通过指标服务的 /revenue 查看
+REVENUE_SNAPSHOT_ENDPOINT = None
+
+# 发送快照的间隔(秒)，期间没有新礼物时不发送
+REVENUE_SNAPSHOT_INTERVAL = 60.0
+
+# 快照中送礼榜、礼物榜的条数
+REVENUE_TOP_K = 10
+
+# 快照中保留的每分钟流水桶数
+REVENUE_MINUTE_BUCKETS = 60
+
+#############################################
+# 最近事件缓冲配置
+#############################################
+# 是否为每个房间保留最近的事件（弹幕、礼物、上舰、进场、醒目留言），需要 numpy
+# 默认关闭；/events 查询与 CHATBOT_CONTEXT_MESSAGES 需要先开启
+EVENT_RING_ENABLED = False
+
+# 每个房间保留的事件条数与文本区字节数（每条约 37 字节，默认每个房间约 0.85MB）
+EVENT_RING_CAPACITY = 16384
+EVENT_RING_TEXT_BYTES = 262144
+
+# 发送到 /chatbot 时附带的最近弹幕条数（meta.context），0 表示不附带
+CHATBOT_CONTEXT_MESSAGES = 0
+
+#############################################
+# 事件归档配置
+#############################################
+# 事件归档目录（按房间、按天写入 JSONL，供 python -m src.analytics 离线分析），None 表示不归档
+EVENT_ARCHIVE_DIR = None
+
+# 归档的 cmd，None 表示全部消息（INTERACT_WORD 等消息量很大，默认不归档）
+EVENT_ARCHIVE_CMDS = [
+    "DANMU_MSG", "SEND_GIFT", "GUARD_BUY", "USER_TOAST_MSG", "ENTRY_EFFECT", "SUPER_CHAT_MESSAGE",
+    "PK_BATTLE_START_NEW", "PK_BATTLE_PROCESS_NEW", "PK_INFO", "PK_BATTLE_END",
+]
+
+# 是否以 gzip 压缩归档文件（体积约为 1/10，离线分析时解压较慢）
+EVENT_ARCHIVE_COMPRESS = False
+
+# SQLite 事件归档文件（WAL 模式，按 cmd 分表，由单独的写线程批量写入），None 表示不写入
+EVENT_ARCHIVE_SQLITE = None
+
+# 每个事务最多写入的事件数，以及凑批的最长等待时间(秒)
+EVENT_ARCHIVE_SQLITE_BATCH = 500
+EVENT_ARCHIVE_SQLITE_MAX_DELAY = 1.0
+
+# 写入队列长度上限，写入跟不上时丢弃新事件（见 event_archive_sqlite_dropped_total）
+EVENT_ARCHIVE_SQLITE_QUEUE_SIZE = 100000
+
+# 是否同时保存原始消息 JSON（raw 列，数据库体积约大 10 倍）
+EVENT_ARCHIVE_SQLITE_RAW = False
+
+#############################################
+# 弹幕全文索引配置
+#############################################
+# 弹幕全文索引目录（按字符二元组建倒排索引，可在指标服务的 /danmaku/search 或
+# python -m src.danmaku_index search 查询），None 表示不建索引；需要 numpy
+DANMAKU_INDEX_DIR = None
+
+# 内存缓冲达到该条数或保留超过该时间(秒)时写成一个段
+DANMAKU_INDEX_FLUSH_DOCS = 20000
+DANMAKU_INDEX_FLUSH_INTERVAL = 60.0
+
+# 同一层的段达到该数量时在后台合并
+DANMAKU_INDEX_MERGE_FACTOR = 4
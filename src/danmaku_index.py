@@ -0,0 +1,650 @@
+"""弹幕全文索引
+
+房管常问"昨天直播时谁说过 X"，而归档只能顺序扫描。这里随归档增量建立弹幕的倒排索引：
+  - 弹幕以中文为主，不分词，按字符二元组（bigram）建索引；每条弹幕末尾另加一个 (末字, 0) 哨兵二元组，
+    单字查询即为该字开头的所有二元组的并集。文本先做 NFKC 归一化并转小写（全角/半角、大小写不敏感）
+  - 新弹幕先进入内存缓冲（可直接查询），满 flush_docs 条或每 flush_interval 秒由后台线程写成一个段
+  - 段是一个目录，内含若干 .npy 数组：文档列（ts、room_id、uid）、UTF-8 打包的弹幕与用户名、
+    有序的二元组键（uint64）与对应的倒排表（段内文档号 uint32），查询时以 mmap 打开
+  - 分层合并：同一层的段达到 merge_factor 个时，后台线程把它们合并为上一层的一个段
+    （倒排表按键稳定排序后直接拼接，不重新分析文本）；manifest.json 记录当前的段，替换时先写临时文件
+查询时取出查询词各二元组的倒排表求交，按房间、时间范围过滤后逐条校验原文是否包含查询词，
+按段内最新时间从新到旧访问各段，用小根堆保留最新的 limit 条，更旧的段与文档直接跳过。
+
+指标服务上的 /danmaku/search?q=词&room=房间号&since=时间戳&until=时间戳&limit=N 可直接查询；
+也可以离线建立和查询（在仓库根目录执行）：
+    python -m src.danmaku_index build danmaku_index/ archive/ events.db   # 从 JSONL / SQLite 归档回填
+    python -m src.danmaku_index search danmaku_index/ 关键词 --room 123 --since "2024-10-19 20:00"
+"""
+
+import argparse
+import gzip
+import heapq
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+import logging
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，不做跨进程互斥
+    fcntl = None
+
+from .metrics import metrics, add_route
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("danmaku_index_docs", "弹幕索引中的弹幕数（含内存缓冲）")
+metrics.describe("danmaku_index_segments", "弹幕索引的段数")
+metrics.describe("danmaku_index_bytes", "弹幕索引的磁盘占用")
+metrics.describe("danmaku_index_search_seconds", "弹幕索引查询耗时")
+
+SEARCH_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+MANIFEST = "manifest.json"
+WRITE_LOCK = "write.lock"
+SEGMENT_PREFIX = "seg-"
+CHAR_BITS = 21  # Unicode 码位不超过 21 位
+ARRAYS = ("ts", "room", "uid", "text_off", "text", "uname_off", "uname", "terms", "post_off", "postings")
+
+# 写入索引的进程中的索引，供 /danmaku/search 查询
+active_index: Optional["DanmakuIndex"] = None
+
+# 一条弹幕：(room_id, ts, uid, uname, 原文, 归一化文本)
+Doc = Tuple[int, float, int, str, str, str]
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def grams(normalized: str) -> Iterable[int]:
+    """弹幕的二元组键（含末尾哨兵），已去重"""
+    codes = [ord(c) for c in normalized]
+    codes.append(0)
+    return {(a << CHAR_BITS) | b for a, b in zip(codes, codes[1:])}
+
+
+def _pack(strings: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """把字符串列表打包为 (偏移[n+1], UTF-8 字节)"""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _postings(keys: "np.ndarray", ids: "np.ndarray") -> Dict[str, "np.ndarray"]:
+    """由 (键, 文档号) 对生成有序键与倒排表；同一键内文档号保持输入顺序（升序）"""
+    order = np.argsort(keys, kind="stable")
+    keys, ids = keys[order], ids[order]
+    terms, starts = np.unique(keys, return_index=True)
+    return {
+        "terms": terms,
+        "post_off": np.append(starts, len(keys)).astype(np.int64),
+        "postings": ids.astype(np.uint32),
+    }
+
+
+def build_arrays(docs: List[Doc]) -> Dict[str, "np.ndarray"]:
+    """由弹幕列表构建一个段的全部数组"""
+    keys: List[int] = []
+    counts: List[int] = []
+    for doc in docs:
+        doc_grams = grams(doc[5])
+        keys.extend(doc_grams)
+        counts.append(len(doc_grams))
+    ids = np.repeat(np.arange(len(docs), dtype=np.uint32), counts)
+    text_off, text = _pack([doc[4] for doc in docs])
+    uname_off, uname = _pack([doc[3] for doc in docs])
+    arrays = {
+        "ts": np.array([doc[1] for doc in docs], dtype=np.float64),
+        "room": np.array([doc[0] for doc in docs], dtype=np.int64),
+        "uid": np.array([doc[2] for doc in docs], dtype=np.int64),
+        "text_off": text_off, "text": text, "uname_off": uname_off, "uname": uname,
+    }
+    arrays.update(_postings(np.array(keys, dtype=np.uint64), ids))
+    return arrays
+
+
+def merge_arrays(segments: List["Segment"]) -> Dict[str, "np.ndarray"]:
+    """合并若干段的数组（按段顺序拼接文档，倒排表按键稳定排序）"""
+    bases = np.cumsum([0] + [segment.docs for segment in segments])
+    arrays = {name: np.concatenate([getattr(s, name) for s in segments]) for name in ("ts", "room", "uid")}
+    for blob, offsets in (("text", "text_off"), ("uname", "uname_off")):
+        sizes = np.cumsum([0] + [len(getattr(s, blob)) for s in segments])
+        arrays[offsets] = np.concatenate([getattr(s, offsets)[:-1] + size for s, size in zip(segments, sizes)]
+                                         + [np.array([sizes[-1]], dtype=np.int64)])
+        arrays[blob] = np.concatenate([getattr(s, blob) for s in segments])
+    keys = np.concatenate([np.repeat(s.terms, np.diff(s.post_off)) for s in segments])
+    ids = np.concatenate([s.postings.astype(np.uint32) + np.uint32(base) for s, base in zip(segments, bases)])
+    arrays.update(_postings(keys, ids))
+    return arrays
+
+
+def write_segment(path: str, arrays: Dict[str, "np.ndarray"]) -> None:
+    """写入段目录（先写临时目录再改名）"""
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """一个只读的索引段"""
+
+    def __init__(self, path: str, level: int = 0):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.level = level
+        self.bytes = 0
+        for name in ARRAYS:
+            file = os.path.join(path, f"{name}.npy")
+            size = os.path.getsize(file)
+            self.bytes += size
+            # 很小的数组（包括空数组）不值得 mmap
+            setattr(self, name, np.load(file, mmap_mode="r" if size > 65536 else None))
+        self.docs = len(self.ts)
+        self.min_ts = float(self.ts.min()) if self.docs else 0.0
+        self.max_ts = float(self.ts.max()) if self.docs else 0.0
+
+    def _string(self, blob: "np.ndarray", offsets: "np.ndarray", i: int) -> str:
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8", "replace")
+
+    def doc(self, i: int) -> Dict[str, Any]:
+        return {
+            "room_id": int(self.room[i]),
+            "ts": float(self.ts[i]),
+            "uid": int(self.uid[i]),
+            "uname": self._string(self.uname, self.uname_off, i),
+            "text": self._string(self.text, self.text_off, i),
+        }
+
+    def _posting(self, key: int) -> Optional["np.ndarray"]:
+        i = int(np.searchsorted(self.terms, np.uint64(key)))
+        if i >= len(self.terms) or int(self.terms[i]) != key:
+            return None
+        return self.postings[self.post_off[i]:self.post_off[i + 1]]
+
+    def candidates(self, needle: str, room_id: Optional[int], since: Optional[float], until: Optional[float]
+                   ) -> "np.ndarray":
+        """可能包含 needle 的文档号（归一化后的查询词），按时间从新到旧排列"""
+        if len(needle) == 1:
+            # 单字：以该字开头的所有二元组的倒排表是连续的一段
+            code = ord(needle)
+            lo, hi = np.searchsorted(self.terms, np.array([code << CHAR_BITS, (code + 1) << CHAR_BITS],
+                                                          dtype=np.uint64))
+            ids = np.unique(self.postings[self.post_off[lo]:self.post_off[hi]])
+        else:
+            lists = []
+            for key in {(ord(a) << CHAR_BITS) | ord(b) for a, b in zip(needle, needle[1:])}:
+                posting = self._posting(key)
+                if posting is None:
+                    return np.zeros(0, dtype=np.uint32)
+                lists.append(posting)
+            lists.sort(key=len)
+            ids = np.asarray(lists[0])
+            for posting in lists[1:]:
+                ids = ids[np.isin(ids, posting, assume_unique=True)]
+                if not len(ids):
+                    break
+        if len(ids) and (room_id is not None or since is not None or until is not None):
+            mask = np.ones(len(ids), dtype=bool)
+            if room_id is not None:
+                mask &= self.room[ids] == room_id
+            if since is not None:
+                mask &= self.ts[ids] >= since
+            if until is not None:
+                mask &= self.ts[ids] < until
+            ids = ids[mask]
+        # 合并段与回填的段中文档号不一定按时间排列
+        return ids[np.argsort(-self.ts[ids], kind="stable")]
+
+    def contains(self, i: int, needle: str) -> bool:
+        return needle in normalize(self._string(self.text, self.text_off, i))
+
+
+class DanmakuIndex:
+    """增量的弹幕倒排索引"""
+
+    def __init__(self, directory: str, flush_docs: int = 20000, flush_interval: float = 60.0,
+                 merge_factor: int = 4, readonly: bool = False):
+        """
+        Args:
+            directory: 索引目录
+            flush_docs: 内存缓冲达到该条数时写成一个段
+            flush_interval: 内存缓冲最长的保留时间（秒）
+            merge_factor: 同一层的段达到该数量时合并
+            readonly: 只读打开（离线查询）；索引目录变化时自动重新加载
+
+        同一目录同时只允许一个写入者（对 write.lock 加排他锁），第二个写入者抛出 RuntimeError
+        """
+        if np is None:
+            raise RuntimeError("弹幕索引需要 numpy（pip install numpy）")
+        self.directory = directory
+        self.flush_docs = max(1, int(flush_docs))
+        self.flush_interval = float(flush_interval)
+        self.merge_factor = max(2, int(merge_factor))
+        self.readonly = readonly
+        self._lock = threading.Lock()         # 保护缓冲与段列表
+        self._write_lock = threading.Lock()   # 串行化写段与合并
+        self._buffer: List[Doc] = []
+        self._flushing: List[Doc] = []
+        self._segments: List[Segment] = []
+        self._next_id = 0
+        self._manifest_mtime: Optional[float] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+
+        if readonly:
+            self._reload()
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self._acquire_write_lock()
+            self._reload()
+            self._remove_orphans()
+            global active_index
+            active_index = self
+            metrics.register_collector(self._collect_metrics)
+
+    def _acquire_write_lock(self) -> None:
+        """对索引目录加写入锁：两个写入者会分配相同的段号、互相覆盖 manifest 并删除对方的段"""
+        path = os.path.join(self.directory, WRITE_LOCK)
+        self._lock_file = open(path, "a+", encoding="utf-8")
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.seek(0)
+            owner = self._lock_file.read().strip() or "?"
+            self._lock_file.close()
+            self._lock_file = None
+            raise RuntimeError(f"弹幕索引目录 {self.directory} 正被另一个进程（pid {owner}）写入，"
+                               f"离线查询请以只读方式打开")
+        self._lock_file.seek(0)
+        self._lock_file.truncate()
+        self._lock_file.write(str(os.getpid()))
+        self._lock_file.flush()
+
+    def _release_write_lock(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()  # 关闭文件即释放 flock
+            self._lock_file = None
+
+    # ---------- manifest ----------
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST)
+
+    def _reload(self) -> None:
+        """按 manifest 打开段（复用已打开的段）"""
+        path = self._manifest_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ 读取弹幕索引 manifest 失败: {e}")
+            return
+        opened = {segment.name: segment for segment in self._segments}
+        segments = []
+        for entry in manifest.get("segments") or []:
+            segment = opened.get(entry["name"])
+            if segment is None:
+                try:
+                    segment = Segment(os.path.join(self.directory, entry["name"]), entry.get("level", 0))
+                except (OSError, ValueError) as e:
+                    logger.error(f"❌ 打开弹幕索引段 {entry['name']} 失败: {e}")
+                    continue
+            segments.append(segment)
+        with self._lock:
+            self._segments = segments
+            self._next_id = max(self._next_id, int(manifest.get("next_id") or 0))
+        self._manifest_mtime = mtime
+
+    def _save_manifest(self) -> None:
+        with self._lock:
+            manifest = {
+                "version": 1,
+                "next_id": self._next_id,
+                "segments": [{"name": s.name, "level": s.level, "docs": s.docs, "min_ts": s.min_ts,
+                              "max_ts": s.max_ts} for s in self._segments],
+            }
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+        self._manifest_mtime = os.path.getmtime(self._manifest_path())
+
+    def _remove_orphans(self) -> None:
+        """删除 manifest 之外的段目录（写段或合并中途退出留下的）"""
+        with self._lock:
+            live = {segment.name for segment in self._segments}
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name not in live:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _new_segment_path(self) -> str:
+        with self._lock:
+            self._next_id += 1
+            return os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._next_id:08d}")
+
+    # ---------- 写入 ----------
+
+    def add(self, room_id: int, ts: float, uid: int, uname: Optional[str], text: str) -> None:
+        """加入一条弹幕（只追加到内存缓冲，建索引在后台线程中进行）"""
+        doc = (int(room_id), float(ts), int(uid or 0), uname or "", text, normalize(text))
+        with self._lock:
+            self._buffer.append(doc)
+            full = len(self._buffer) >= self.flush_docs
+        if full:
+            self._wake.set()
+
+    def add_message(self, room_id: int, message: Dict[str, Any], ts: Optional[float] = None) -> None:
+        """加入一条 DANMU_MSG"""
+        try:
+            info = message["info"]
+            text, uid, uname = info[1], info[2][0], info[2][1]
+        except (KeyError, IndexError, TypeError):
+            return
+        if isinstance(text, str) and text:
+            self.add(room_id, time.time() if ts is None else ts, uid, uname, text)
+
+    def flush(self) -> bool:
+        """把内存缓冲写成一个段，返回是否写入"""
+        with self._write_lock:
+            with self._lock:
+                if not self._buffer:
+                    return False
+                docs, self._buffer = self._buffer, []
+                self._flushing = docs
+            try:
+                path = self._new_segment_path()
+                write_segment(path, build_arrays(docs))
+                segment = Segment(path, level=0)
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ 写入弹幕索引段失败: {e}")
+                with self._lock:
+                    self._buffer = docs + self._buffer
+                    self._flushing = []
+                return False
+            with self._lock:
+                self._segments.append(segment)
+                self._flushing = []
+            self._save_manifest()
+        logger.debug(f"🔎 弹幕索引新增段 {segment.name}（{segment.docs} 条）")
+        return True
+
+    def merge(self) -> int:
+        """合并同一层达到 merge_factor 个的段，返回合并次数"""
+        merged = 0
+        with self._write_lock:
+            while True:
+                with self._lock:
+                    segments = list(self._segments)
+                levels: Dict[int, List[int]] = {}
+                for i, segment in enumerate(segments):
+                    levels.setdefault(segment.level, []).append(i)
+                group = next((idx[:self.merge_factor] for level, idx in sorted(levels.items())
+                              if len(idx) >= self.merge_factor), None)
+                if group is None:
+                    return merged
+                sources = [segments[i] for i in group]
+                try:
+                    path = self._new_segment_path()
+                    write_segment(path, merge_arrays(sources))
+                    target = Segment(path, level=sources[0].level + 1)
+                except (OSError, ValueError) as e:
+                    logger.error(f"❌ 合并弹幕索引段失败: {e}")
+                    return merged
+                with self._lock:
+                    names = {s.name for s in sources}
+                    position = next(i for i, s in enumerate(self._segments) if s.name in names)
+                    self._segments = [s for s in self._segments if s.name not in names]
+                    self._segments.insert(position, target)
+                self._save_manifest()
+                for source in sources:
+                    shutil.rmtree(source.path, ignore_errors=True)
+                merged += 1
+                logger.debug(f"🔎 弹幕索引合并 {len(sources)} 个段为 {target.name}（{target.docs} 条）")
+
+    def start(self) -> None:
+        if self.readonly or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="danmaku-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台线程并写出内存缓冲"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(30)
+        if not self.readonly and self._lock_file is not None:
+            self.flush()
+            self.merge()
+            self._release_write_lock()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.flush()
+            self.merge()
+
+    # ---------- 查询 ----------
+
+    def search(self, term: str, room_id: Optional[int] = None, since: Optional[float] = None,
+               until: Optional[float] = None, limit: int = 100) -> Dict[str, Any]:
+        """查询包含 term 的弹幕，按时间从新到旧返回最新的最多 limit 条"""
+        started = time.perf_counter()
+        if self.readonly:
+            self._reload()
+        needle = normalize(term)
+        # 小根堆保留目前最新的 limit 条：(ts, 序号, 结果)
+        heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        seq = itertools.count()
+        truncated = False
+        with self._lock:
+            segments = list(self._segments)
+            pending = self._flushing + self._buffer
+
+        def full_and_older(ts: float) -> bool:
+            return len(heap) >= limit and ts <= heap[0][0]
+
+        def offer(match: Dict[str, Any]) -> None:
+            nonlocal truncated
+            item = (match["ts"], next(seq), match)
+            if len(heap) < limit:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heapreplace(heap, item)
+                truncated = True
+
+        if needle and limit > 0:
+            # 内存缓冲中的最新弹幕
+            for doc in pending:
+                if (room_id is None or doc[0] == room_id) and (since is None or doc[1] >= since) \
+                        and (until is None or doc[1] < until) and needle in doc[5]:
+                    if full_and_older(doc[1]):
+                        truncated = True
+                        continue
+                    offer({"room_id": doc[0], "ts": doc[1], "uid": doc[2], "uname": doc[3], "text": doc[4]})
+            # 按段内最新时间从新到旧访问，堆满后跳过不可能更新的段与文档
+            for segment in sorted(segments, key=lambda s: s.max_ts, reverse=True):
+                if not segment.docs or (since is not None and segment.max_ts < since) or \
+                        (until is not None and segment.min_ts >= until):
+                    continue
+                if full_and_older(segment.max_ts):
+                    truncated = True
+                    break
+                for i in segment.candidates(needle, room_id, since, until):
+                    i = int(i)
+                    if full_and_older(float(segment.ts[i])):
+                        truncated = True
+                        break
+                    if segment.contains(i, needle):
+                        offer(segment.doc(i))
+        matches = [item[2] for item in heap]
+        matches.sort(key=lambda match: match["ts"], reverse=True)
+        elapsed = time.perf_counter() - started
+        metrics.observe("danmaku_index_search_seconds", elapsed, SEARCH_BUCKETS)
+        return {"term": term, "matches": matches, "truncated": truncated, "took_ms": round(elapsed * 1000, 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            segments = list(self._segments)
+            pending = len(self._flushing) + len(self._buffer)
+        return {
+            "docs": sum(s.docs for s in segments) + pending,
+            "buffered": pending,
+            "segments": len(segments),
+            "bytes": sum(s.bytes for s in segments),
+        }
+
+    def _collect_metrics(self) -> None:
+        stats = self.stats()
+        metrics.set_gauge("danmaku_index_docs", stats["docs"])
+        metrics.set_gauge("danmaku_index_segments", stats["segments"])
+        metrics.set_gauge("danmaku_index_bytes", stats["bytes"])
+
+
+def _float_param(query: Dict[str, List[str]], name: str) -> Optional[float]:
+    values = query.get(name)
+    return float(values[0]) if values else None
+
+
+def _search_route(query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+    """GET /danmaku/search?q=词[&room=N][&since=时间戳][&until=时间戳][&limit=N]"""
+    if active_index is None:
+        return 404, "text/plain; charset=utf-8", b"danmaku index disabled\n"
+    terms = query.get("q")
+    if not terms or not terms[0]:
+        return 400, "text/plain; charset=utf-8", b"missing q\n"
+    try:
+        room = query.get("room")
+        result = active_index.search(terms[0], int(room[0]) if room else None, _float_param(query, "since"),
+                                     _float_param(query, "until"), int((query.get("limit") or [100])[0]))
+    except ValueError:
+        return 400, "text/plain; charset=utf-8", b"bad parameter\n"
+    return 200, "application/json; charset=utf-8", json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+
+def register_routes() -> None:
+    """在指标 HTTP 服务上注册 /danmaku/search"""
+    add_route("/danmaku/search", _search_route)
+
+
+def iter_archive_danmaku(paths: Iterable[str], room_id: Optional[int] = None) -> Iterator[Tuple[int, float, Any, Any, str]]:
+    """从 JSONL / SQLite 归档读取弹幕 (room_id, ts, uid, uname, text)"""
+    from .analytics import SQLITE_SUFFIXES, archive_files
+    for path in archive_files(paths):
+        if path.endswith(SQLITE_SUFFIXES):
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                query = "SELECT room_id, ts, uid, uname, text FROM danmaku"
+                params: Tuple[Any, ...] = ()
+                if room_id is not None:
+                    query += " WHERE room_id = ?"
+                    params = (room_id,)
+                for row in conn.execute(query + " ORDER BY ts", params):
+                    if row[4]:
+                        yield row
+            finally:
+                conn.close()
+            continue
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            for line in f:
+                head, sep, body = line.partition(b"\t")
+                try:
+                    row = json.loads(head)
+                    if not sep or row[2] != "DANMU_MSG" or (room_id is not None and row[1] != room_id):
+                        continue
+                    info = json.loads(body)["info"]
+                    text = info[1]
+                except (ValueError, KeyError, IndexError, TypeError):
+                    continue
+                if isinstance(text, str) and text:
+                    yield row[1], row[0], row[3], info[2][1], text
+
+
+def main() -> None:
+    from .analytics import parse_time
+
+    parser = argparse.ArgumentParser(description="弹幕全文索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="从 JSONL / SQLite 归档回填索引")
+    build.add_argument("index", help="索引目录")
+    build.add_argument("archives", nargs="+", help="归档文件或目录")
+    build.add_argument("--room", type=int, help="只索引指定房间")
+    build.add_argument("--segment-docs", type=int, default=200000, help="每个段的弹幕数")
+    search = sub.add_parser("search", help="查询")
+    search.add_argument("index", help="索引目录")
+    search.add_argument("term", help="查询词")
+    search.add_argument("--room", type=int, help="只查指定房间")
+    search.add_argument("--since", type=parse_time, help="起始时间（时间戳或 \"YYYY-MM-DD HH:MM\"）")
+    search.add_argument("--until", type=parse_time, help="结束时间（不含）")
+    search.add_argument("--limit", type=int, default=50, help="最多返回的条数")
+    search.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if np is None:
+        parser.error("弹幕索引需要 numpy（pip install numpy）")
+
+    if args.command == "build":
+        try:
+            index = DanmakuIndex(args.index, flush_docs=args.segment_docs)
+        except RuntimeError as e:
+            parser.error(str(e))
+        started = time.perf_counter()
+        count = 0
+        for room_id, ts, uid, uname, text in iter_archive_danmaku(args.archives, args.room):
+            index.add(room_id, ts, uid, uname, text)
+            count += 1
+            if count % args.segment_docs == 0:
+                index.flush()
+                index.merge()
+        index.stop()
+        stats = index.stats()
+        print(f"已索引 {count} 条弹幕，用时 {time.perf_counter() - started:.1f} 秒；"
+              f"索引共 {stats['docs']} 条、{stats['segments']} 个段、{stats['bytes'] / 1e6:.1f}MB")
+        return
+
+    index = DanmakuIndex(args.index, readonly=True)
+    result = index.search(args.term, args.room, args.since, args.until, args.limit)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    for match in result["matches"]:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(match["ts"]))
+        print(f"{when}  房间 {match['room_id']}  {match['uname']}({match['uid']}): {match['text']}")
+    more = "（结果已截断，可加大 --limit 或缩小时间范围）" if result["truncated"] else ""
+    print(f"共 {len(result['matches'])} 条，用时 {result['took_ms']} 毫秒{more}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""消息去重
+
+重连后或服务器重发一批消息时，同一条 DANMU_MSG（相同 extra.id_str）、SEND_GIFT（相同 tid/rnd）
+或上舰消息可能被处理两次，导致重复的 /money、/guard、/chatbot 请求。这里在 _handle_message 之前
+按各 cmd 的自然ID去重。
+
+弹幕使用按时间分代的布隆过滤器：window 秒被分成 generations 代，新ID写入当前代，查询时检查所有代；
+每过 window/generations 秒清空最老的一代并作为新的当前代。每个房间占用的内存固定为
+generations × 每代位图大小，与消息量无关；代价是少量误判（把新消息当作重复）。误判率按各代的
+写入量估算，写入量超过每代容量时会升高。
+
+涉及流水的 cmd（SEND_GIFT、GUARD_BUY、USER_TOAST_MSG）误判会直接丢掉一笔收入，因此改用精确的
+有界ID集合：按到达顺序保存窗口内的ID，超过 max_ids 时淘汰最旧的（只会漏判重复，不会误丢消息）。
+
+指标：
+  dedup_checked_total{room, cmd}          参与去重的消息数
+  dedup_duplicates_total{room, cmd}       判定为重复而丢弃的消息数
+  dedup_false_positive_ratio{room}        当前估算误判率
+  dedup_memory_bytes{room}                位图占用内存
+  dedup_exact_evictions_total{room}       精确ID集合因超过上限而提前淘汰的ID数
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("dedup_checked_total", "参与去重的消息数")
+metrics.describe("dedup_duplicates_total", "判定为重复而丢弃的消息数")
+metrics.describe("dedup_false_positive_ratio", "去重布隆过滤器的估算误判率")
+metrics.describe("dedup_memory_bytes", "去重布隆过滤器占用的内存")
+metrics.describe("dedup_exact_evictions_total", "去重精确ID集合超过上限而提前淘汰的ID数")
+
+# 涉及流水、必须精确去重的 cmd
+EXACT_CMDS = frozenset(("SEND_GIFT", "GUARD_BUY", "USER_TOAST_MSG"))
+
+
+def message_key(message: Dict[str, Any]) -> Optional[str]:
+    """提取消息的自然ID；没有可用ID的消息返回 None（不参与去重）"""
+    cmd = message.get("cmd")
+    try:
+        if cmd == "DANMU_MSG":
+            info = message.get("info") or []
+            header = info[0] if info and isinstance(info[0], list) else []
+            # info[0][15].extra 为字符串 JSON，其中 id_str 唯一标识一条弹幕
+            header_obj = next((elem for elem in header if isinstance(elem, dict)), None)
+            if header_obj is not None:
+                extra = header_obj.get("extra")
+                if isinstance(extra, str):
+                    id_str = json.loads(extra).get("id_str")
+                    if id_str:
+                        return f"D:{id_str}"
+            # 退回 发送者 + 毫秒时间戳 + 内容
+            if len(header) > 4 and len(info) > 2 and isinstance(info[2], list) and info[2]:
+                return f"D:{info[2][0]}:{header[4]}:{info[1]}"
+            return None
+        if cmd == "SEND_GIFT":
+            data = message.get("data") or {}
+            tid = data.get("tid")
+            if tid:
+                return f"G:{tid}"
+            rnd = data.get("rnd")
+            if rnd:
+                return f"G:{rnd}:{data.get('uid')}:{data.get('giftId')}:{data.get('num')}"
+            return None
+        if cmd == "USER_TOAST_MSG":
+            payflow_id = (message.get("data") or {}).get("payflow_id")
+            return f"T:{payflow_id}" if payflow_id else None
+        if cmd == "GUARD_BUY":
+            # GUARD_BUY 没有订单号，重发的消息各字段完全相同
+            data = message.get("data") or {}
+            if not data.get("uid") or not data.get("start_time"):
+                return None
+            return f"B:{data.get('uid')}:{data.get('guard_level')}:{data.get('num')}:{data.get('start_time')}"
+    except (TypeError, ValueError, IndexError, AttributeError):
+        return None
+    return None
+
+
+class TimeBucketedBloomFilter:
+    """按时间分代轮换的布隆过滤器"""
+
+    def __init__(self, capacity: int, false_positive_rate: float, window: float, generations: int = 4):
+        """
+        Args:
+            capacity: 每代预计写入的ID数
+            false_positive_rate: 每代写满 capacity 时的目标误判率
+            window: 去重时间窗口（秒），ID 至少保留 window × (generations-1)/generations 秒
+            generations: 分代数
+        """
+        self.generations = max(2, int(generations))
+        self.span = float(window) / self.generations
+        capacity = max(1, int(capacity))
+        p = min(0.5, max(1e-9, float(false_positive_rate)))
+        self.bits = max(64, int(math.ceil(-capacity * math.log(p) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self._size = (self.bits + 7) // 8
+        self._filters: List[bytearray] = [bytearray(self._size) for _ in range(self.generations)]
+        self._counts: List[int] = [0] * self.generations
+        self._current = 0
+        self._rotated_at = time.monotonic()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._size * self.generations
+
+    def _positions(self, key: str) -> List[int]:
+        # 双重哈希：h1 + i*h2
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _rotate(self, now: float) -> None:
+        elapsed = int((now - self._rotated_at) // self.span)
+        if elapsed <= 0:
+            return
+        for _ in range(min(elapsed, self.generations)):
+            self._current = (self._current + 1) % self.generations
+            self._filters[self._current] = bytearray(self._size)
+            self._counts[self._current] = 0
+        self._rotated_at += elapsed * self.span
+
+    def check_and_add(self, key: str, now: Optional[float] = None) -> bool:
+        """查询并写入；返回该ID是否已出现过（可能误判）"""
+        self._rotate(time.monotonic() if now is None else now)
+        positions = self._positions(key)
+        for bitmap in self._filters:
+            if all(bitmap[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+                return True
+        current = self._filters[self._current]
+        for pos in positions:
+            current[pos >> 3] |= 1 << (pos & 7)
+        self._counts[self._current] += 1
+        return False
+
+    def false_positive_ratio(self) -> float:
+        """按各代写入量估算：新ID在任意一代全部命中的概率"""
+        miss = 1.0
+        for count in self._counts:
+            fill = 1.0 - math.exp(-self.hashes * count / self.bits)
+            miss *= 1.0 - fill ** self.hashes
+        return 1.0 - miss
+
+
+class ExactIdWindow:
+    """按到达顺序保存窗口内ID的精确集合（有上限）"""
+
+    def __init__(self, window: float, max_ids: int = 100000):
+        """
+        Args:
+            window: 去重时间窗口（秒）
+            max_ids: ID 数上限，超过时淘汰最旧的
+        """
+        self.window = float(window)
+        self.max_ids = max(1, int(max_ids))
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def check_and_add(self, key: str, now: Optional[float] = None) -> bool:
+        """查询并写入；返回该ID是否已出现过"""
+        now = time.monotonic() if now is None else now
+        expire = now - self.window
+        while self._seen:
+            oldest, seen_at = next(iter(self._seen.items()))
+            if seen_at > expire:
+                break
+            del self._seen[oldest]
+        if key in self._seen:
+            return True
+        self._seen[key] = now
+        if len(self._seen) > self.max_ids:
+            self._seen.popitem(last=False)
+            self.evicted += 1
+        return False
+
+
+class MessageDeduplicator:
+    """单个房间的消息去重器"""
+
+    def __init__(self, room_id: int, capacity: int = 50000, false_positive_rate: float = 0.001,
+                 window: float = 300.0, generations: int = 4, exact_max_ids: int = 100000):
+        self.room_id = room_id
+        self.filter = TimeBucketedBloomFilter(capacity, false_positive_rate, window, generations)
+        self.exact = ExactIdWindow(window, exact_max_ids)
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+        metrics.set_gauge("dedup_memory_bytes", self.filter.memory_bytes, room=room_id)
+
+    def is_duplicate(self, message: Dict[str, Any]) -> bool:
+        """消息是否已处理过；没有自然ID的消息总是返回 False"""
+        key = message_key(message)
+        if key is None:
+            return False
+        cmd = message.get("cmd")
+        with self._lock:
+            if cmd in EXACT_CMDS:
+                evicted = self.exact.evicted
+                duplicate = self.exact.check_and_add(key)
+                evicted = self.exact.evicted - evicted
+            else:
+                duplicate = self.filter.check_and_add(key)
+                evicted = 0
+            self.checked += 1
+            if duplicate:
+                self.duplicates += 1
+        if evicted:
+            metrics.inc("dedup_exact_evictions_total", evicted, room=self.room_id)
+        metrics.inc("dedup_checked_total", room=self.room_id, cmd=cmd)
+        if duplicate:
+            metrics.inc("dedup_duplicates_total", room=self.room_id, cmd=cmd)
+            logger.debug(f"♻️ 丢弃重复消息 {cmd} {key}")
+        return duplicate
+
+    def stats(self) -> Dict[str, Any]:
+        """返回去重统计"""
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "hit_ratio": self.duplicates / self.checked if self.checked else 0.0,
+                "false_positive_ratio": self.filter.false_positive_ratio(),
+                "memory_bytes": self.filter.memory_bytes,
+                "exact_ids": len(self.exact),
+                "exact_evicted": self.exact.evicted,
+            }
+
+    def collect_metrics(self) -> None:
+        with self._lock:
+            ratio = self.filter.false_positive_ratio()
+        metrics.set_gauge("dedup_false_positive_ratio", ratio, room=self.room_id)
@@ -0,0 +1,116 @@
+"""进场特效限流
+
+大直播间开播或被推荐时，ENTRY_EFFECT 会以每秒数百条的速度涌入，每条都会触发一次 /entry_welcome。
+这里在上报前依次做三步：
+  1. 舰长及以上（is_captain，或 guard_level 在 1~pass_guard_level 之间）直接放行，不受限流影响
+  2. 同一 uid 在 cooldown 秒内只放行一次（按 TTL 淘汰的冷却表，条数上限 max_users）
+  3. 通过冷却的进场速率超过 target_rate 条/秒时，按 target_rate/速率 的概率抽样放行
+参数可按房间覆盖（ENTRY_THROTTLE_ROOM_OVERRIDES）。
+
+指标：
+  entry_effect_passed_total{room, reason}    放行数（guard / normal / sampled）
+  entry_effect_dropped_total{room, reason}   丢弃数（cooldown / sampled）
+"""
+
+import random
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("entry_effect_passed_total", "限流后放行的进场特效数")
+metrics.describe("entry_effect_dropped_total", "被限流丢弃的进场特效数")
+
+
+class EntryThrottle:
+    """单个房间的进场特效限流器"""
+
+    def __init__(self, room_id: int, cooldown: float = 300.0, target_rate: float = 5.0, max_users: int = 20000,
+                 pass_guard_level: int = 3):
+        """
+        Args:
+            room_id: 房间ID（指标标签）
+            cooldown: 同一用户两次放行的最短间隔（秒），<=0 表示不按用户冷却
+            target_rate: 每秒放行的普通进场数上限（超过时抽样），<=0 表示不抽样
+            max_users: 冷却表最多记录的用户数
+            pass_guard_level: guard_level 在 1~该值之间的用户总是放行（1总督 2提督 3舰长），0 表示不特殊处理
+        """
+        self.room_id = room_id
+        self.cooldown = float(cooldown)
+        self.target_rate = float(target_rate)
+        self.max_users = max(1, int(max_users))
+        self.pass_guard_level = int(pass_guard_level)
+        self._last_passed: "OrderedDict[Any, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 1 秒滑动窗口估算进场速率：上一秒计数按剩余比例折算 + 本秒计数
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._previous_count = 0
+
+    @classmethod
+    def for_room(cls, room_id: int, defaults: Dict[str, Any], overrides: Optional[Dict[int, Dict[str, Any]]] = None
+                 ) -> Optional["EntryThrottle"]:
+        """按默认参数与房间覆盖项创建；该房间关闭限流时返回 None"""
+        options = dict(defaults)
+        options.update((overrides or {}).get(room_id) or (overrides or {}).get(str(room_id)) or {})
+        if not options.pop("enabled", True):
+            return None
+        return cls(room_id, **options)
+
+    def _rate(self, now: float) -> float:
+        """当前进场速率（条/秒，需持有锁）"""
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self._previous_count = self._window_count if elapsed < 2.0 else 0
+            self._window_count = 0
+            self._window_start = now - (elapsed % 1.0)
+            elapsed = now - self._window_start
+        return self._previous_count * (1.0 - elapsed) + self._window_count
+
+    def _evict(self, now: float) -> None:
+        """淘汰冷却已过期的用户（需持有锁）；表按放行时间排序，只需检查表头"""
+        while self._last_passed:
+            uid, passed_at = next(iter(self._last_passed.items()))
+            if now - passed_at < self.cooldown and len(self._last_passed) <= self.max_users:
+                break
+            self._last_passed.popitem(last=False)
+
+    def allow(self, uid: Any, guard_level: Optional[int] = None, is_captain: bool = False) -> bool:
+        """是否放行这次进场"""
+        if is_captain or (guard_level and 0 < guard_level <= self.pass_guard_level):
+            metrics.inc("entry_effect_passed_total", room=self.room_id, reason="guard")
+            return True
+
+        now = time.monotonic()
+        tracked = self.cooldown > 0 and uid is not None
+        dropped = None
+        sampled = False
+        with self._lock:
+            if tracked:
+                self._evict(now)
+                if uid in self._last_passed:
+                    dropped = "cooldown"
+            if dropped is None:
+                rate = self._rate(now) + 1
+                self._window_count += 1
+                sampled = self.target_rate > 0 and rate > self.target_rate
+                if sampled and random.random() >= self.target_rate / rate:
+                    dropped = "sampled"
+                elif tracked:
+                    self._last_passed[uid] = now
+
+        if dropped:
+            metrics.inc("entry_effect_dropped_total", room=self.room_id, reason=dropped)
+            return False
+        metrics.inc("entry_effect_passed_total", room=self.room_id, reason="sampled" if sampled else "normal")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """返回冷却表大小与当前速率"""
+        with self._lock:
+            return {"tracked_users": len(self._last_passed), "rate": self._rate(time.monotonic())}
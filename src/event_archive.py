@@ -0,0 +1,185 @@
+"""事件归档
+
+把解析后的事件按房间、按天追加写入 JSONL 文件，供离线分析（python -m src.analytics）使用。
+每行由两部分组成，中间用制表符分隔（json.dumps 会转义字符串中的制表符，因此不会混淆）：
+  1. 定长的行头 JSON 数组：[收到时间, room_id, cmd, uid, v1, v2, v3, v4]
+  2. 原始消息 JSON
+离线分析只解析很短的行头即可得到各项统计所需的字段，只有旧格式（没有行头）的行才解析整条消息。
+行头中 v1~v4 的含义随 cmd 不同（见 archive_row），金额单位为金瓜子：
+  DANMU_MSG                 -
+  SEND_GIFT                 gift_id、礼物数、金瓜子价值、盲盒原价（×礼物数，非盲盒为 0）
+  GUARD_BUY/USER_TOAST_MSG  guard_level、数量、价值
+  ENTRY_EFFECT              privilege_type
+  SUPER_CHAT_MESSAGE        价值（醒目留言价格单位为元，×1000）
+  PK_*                      pk_id、battle_type、本方票数、对方票数
+文件名为 {room_id}-{YYYYMMDD}.jsonl（开启压缩时为 .jsonl.gz），按本地日期切换。
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+import logging
+from typing import Dict, Any, IO, Iterable, List, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("event_archive_records_total", "写入归档文件的事件数")
+metrics.describe("event_archive_errors_total", "写入归档文件失败的次数")
+
+# 默认归档的 cmd（其余消息量大但离线分析用不到，例如 INTERACT_WORD、ONLINE_RANK_COUNT）
+DEFAULT_CMDS = (
+    "DANMU_MSG", "SEND_GIFT", "GUARD_BUY", "USER_TOAST_MSG", "ENTRY_EFFECT", "SUPER_CHAT_MESSAGE",
+    "PK_BATTLE_START_NEW", "PK_BATTLE_PROCESS_NEW", "PK_INFO", "PK_BATTLE_END",
+)
+
+# 所有房间的归档器，进程退出时统一关闭
+recorders: Dict[int, "EventRecorder"] = {}
+
+
+def _num(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _pk_votes(message: Dict[str, Any], room_id: int) -> List[int]:
+    """提取 PK 消息中的 [pk_id, battle_type, 本方票数, 对方票数]"""
+    data = message.get("data") or {}
+    pk_id = _num(message.get("pk_id") or data.get("pk_id"))
+    battle_type = _num(data.get("battle_type"))
+    members = data.get("members")
+    if isinstance(members, list):
+        # PK_INFO（多人 PK）：本房间的票数与对手中的最高票数
+        own = [_num(m.get("votes")) for m in members if isinstance(m, dict) and _num(m.get("room_id")) == room_id]
+        others = [_num(m.get("votes")) for m in members if isinstance(m, dict) and _num(m.get("room_id")) != room_id]
+        return [pk_id, battle_type, own[0] if own else 0, max(others) if others else 0]
+    init_info = data.get("init_info") or {}
+    match_info = data.get("match_info") or {}
+    if room_id and _num(match_info.get("room_id")) == room_id:
+        init_info, match_info = match_info, init_info
+    return [pk_id, battle_type, _num(init_info.get("votes")), _num(match_info.get("votes"))]
+
+
+def archive_row(message: Dict[str, Any], ts: float, room_id: int) -> Optional[List[Any]]:
+    """生成归档行头 [ts, room_id, cmd, uid, v1, v2, v3, v4]；无法识别的消息返回 None"""
+    cmd = message.get("cmd")
+    if not isinstance(cmd, str):
+        return None
+    uid = 0
+    values = [0, 0, 0, 0]
+    try:
+        if cmd == "DANMU_MSG":
+            uid = _num((message.get("info") or [])[2][0])
+        elif cmd.startswith("PK_"):
+            values = _pk_votes(message, room_id)
+        else:
+            data = message.get("data") or {}
+            uid = _num(data.get("uid"))
+            if cmd == "SEND_GIFT":
+                num = _num(data.get("num")) or 1
+                value = _num(data.get("price")) * num if data.get("coin_type") == "gold" else 0
+                blind = data.get("blind_gift")
+                original = _num(blind.get("original_gift_price")) * num if isinstance(blind, dict) else 0
+                values = [_num(data.get("giftId")), num, value, original]
+            elif cmd in ("GUARD_BUY", "USER_TOAST_MSG"):
+                num = _num(data.get("num")) or 1
+                values = [_num(data.get("guard_level")), num, _num(data.get("price")) * num, 0]
+            elif cmd == "ENTRY_EFFECT":
+                values = [_num(data.get("privilege_type")), 0, 0, 0]
+            elif cmd == "SUPER_CHAT_MESSAGE":
+                values = [_num((data.get("price") or 0) * 1000), 0, 0, 0]
+    except (TypeError, IndexError, AttributeError):
+        pass
+    return [round(ts, 3), room_id, cmd, uid] + values
+
+
+class EventRecorder:
+    """单个房间的事件归档器"""
+
+    def __init__(self, room_id: int, directory: str, cmds: Optional[Iterable[str]] = DEFAULT_CMDS,
+                 compress: bool = False, flush_interval: float = 1.0):
+        """
+        Args:
+            room_id: 房间ID
+            directory: 归档目录
+            cmds: 归档的 cmd，None 表示全部
+            compress: 是否以 gzip 压缩写入
+            flush_interval: 把缓冲写入文件的最长间隔（秒）
+        """
+        self.room_id = room_id
+        self.directory = directory
+        self.cmds = frozenset(cmds) if cmds is not None else None
+        self.compress = bool(compress)
+        self.flush_interval = float(flush_interval)
+        self._file: Optional[IO[str]] = None
+        self._day: Optional[str] = None
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+        self.records = 0
+        recorders[room_id] = self
+
+    def path_for(self, day: str) -> str:
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        return os.path.join(self.directory, f"{self.room_id}-{day}{suffix}")
+
+    def _open(self, day: str) -> IO[str]:
+        """打开（追加）当天的归档文件（需持有锁）"""
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(day)
+        if self.compress:
+            self._file = gzip.open(path, "at", encoding="utf-8")
+        else:
+            self._file = open(path, "a", encoding="utf-8")
+        self._day = day
+        logger.info(f"🗄️ 房间 {self.room_id} 的事件归档写入 {path}")
+        return self._file
+
+    def record(self, message: Dict[str, Any], ts: Optional[float] = None) -> None:
+        """追加一条事件"""
+        if self.cmds is not None and message.get("cmd") not in self.cmds:
+            return
+        now = time.time() if ts is None else ts
+        row = archive_row(message, now, self.room_id)
+        if row is None:
+            return
+        try:
+            line = json.dumps(row, ensure_ascii=False) + "\t" + json.dumps(message, ensure_ascii=False) + "\n"
+        except (TypeError, ValueError):
+            return
+        day = time.strftime("%Y%m%d", time.localtime(now))
+        try:
+            with self._lock:
+                f = self._file if day == self._day else self._open(day)
+                f.write(line)
+                self.records += 1
+                if now - self._flushed_at >= self.flush_interval:
+                    f.flush()
+                    self._flushed_at = now
+        except OSError as e:
+            metrics.inc("event_archive_errors_total", room=self.room_id)
+            logger.error(f"❌ 写入事件归档失败: {e}")
+            return
+        metrics.inc("event_archive_records_total", room=self.room_id)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError as e:
+                    logger.error(f"❌ 关闭事件归档失败: {e}")
+                self._file = None
+                self._day = None
+
+
+def close_all() -> None:
+    """关闭所有房间的归档文件"""
+    for recorder in list(recorders.values()):
+        recorder.close()
@@ -0,0 +1,307 @@
+"""最近事件的列式环形缓冲
+
+_handle_message 处理完的消息不会留下任何记录，而 /chatbot 的上下文、"最近 N 分钟"统计等都需要近期历史。
+这里为每个房间保存最近 capacity 条事件，按列存放在定长 NumPy 数组中：
+  ts（收到时间，秒）、uid、cmd（编码见 CMD_CODES）、value（金瓜子价值）、文本在文本区中的偏移与长度
+文本（弹幕内容、礼物名等）以 UTF-8 写入定长的环形字节区，短时间内重复的文本（刷屏）只写一次；
+文本区被覆盖后，旧事件的文本读出为 None。追加为 O(1)，内存固定为
+capacity × 37 字节 + text_bytes。
+
+查询在数组切片上向量化计算：counts_per_window（按时间桶计数）、top_users（按条数或价值排名）、
+recent（最近的若干条）、summary（窗口内各 cmd 的条数、价值与独立用户数）。
+处理器可直接使用所属房间的缓冲，指标服务上的 /events/stats、/events/top 可查看任一房间。
+"""
+
+import json
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+from .metrics import add_route
+
+logger = logging.getLogger(__name__)
+
+# cmd 编码（0 保留给未知）
+CMD_CODES = {
+    "DANMU_MSG": 1,
+    "SEND_GIFT": 2,
+    "GUARD_BUY": 3,
+    "USER_TOAST_MSG": 4,
+    "ENTRY_EFFECT": 5,
+    "SUPER_CHAT_MESSAGE": 6,
+}
+CMD_NAMES = {code: cmd for cmd, code in CMD_CODES.items()}
+
+# 每行占用的字节数：ts(8) + uid(8) + cmd(1) + value(8) + text_off(8) + text_len(4)
+ROW_BYTES = 37
+
+# 所有房间的缓冲，供指标服务路由查询
+rings: Dict[int, "EventRingBuffer"] = {}
+
+
+def extract_event(message: Dict[str, Any]) -> Optional[Tuple[int, int, int, Optional[str]]]:
+    """提取 (cmd 编码, uid, 金瓜子价值, 文本)；不记录的消息返回 None"""
+    cmd = message.get("cmd")
+    code = CMD_CODES.get(cmd)
+    if code is None:
+        return None
+    try:
+        if code == 1:
+            info = message.get("info") or []
+            return code, int(info[2][0] or 0), 0, info[1]
+        data = message.get("data") or {}
+        uid = int(data.get("uid") or 0)
+        if code == 2:
+            value = (data.get("price") or 0) * (data.get("num") or 1) if data.get("coin_type") == "gold" else 0
+            return code, uid, int(value), data.get("giftName")
+        if code in (3, 4):
+            return code, uid, int((data.get("price") or 0) * (data.get("num") or 1)), \
+                data.get("gift_name") or data.get("role_name")
+        if code == 6:
+            # 醒目留言价格单位为元
+            return code, uid, int((data.get("price") or 0) * 1000), data.get("message")
+        return code, uid, 0, None
+    except (TypeError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class EventRingBuffer:
+    """单个房间的列式环形缓冲"""
+
+    def __init__(self, room_id: int, capacity: int = 16384, text_bytes: int = 262144, intern_size: int = 1024):
+        """
+        Args:
+            room_id: 房间ID
+            capacity: 保留的事件条数
+            text_bytes: 文本区字节数
+            intern_size: 去重复用的最近文本数
+        """
+        if np is None:
+            raise RuntimeError("事件环形缓冲需要 numpy（pip install numpy）")
+        self.room_id = room_id
+        self.capacity = max(1, int(capacity))
+        self.ts = np.zeros(self.capacity, dtype=np.float64)
+        self.uid = np.zeros(self.capacity, dtype=np.int64)
+        self.cmd = np.zeros(self.capacity, dtype=np.uint8)
+        self.value = np.zeros(self.capacity, dtype=np.int64)
+        self.text_off = np.full(self.capacity, -1, dtype=np.int64)  # 文本区中的绝对偏移，-1 表示无文本
+        self.text_len = np.zeros(self.capacity, dtype=np.int32)
+        self.count = 0  # 累计写入条数
+
+        self.text_bytes = max(64, int(text_bytes))
+        self._text = bytearray(self.text_bytes)
+        self._text_written = 0  # 累计写入的文本字节数
+        self._intern: Dict[str, Tuple[int, int]] = {}
+        self.intern_size = max(1, int(intern_size))
+        self._lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.capacity * ROW_BYTES + self.text_bytes
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def _write_text(self, text: str) -> Tuple[int, int]:
+        """写入文本区，返回 (绝对偏移, 长度)（需持有锁）"""
+        interned = self._intern.get(text)
+        if interned is not None and interned[0] >= self._text_written - self.text_bytes:
+            return interned
+        data = text.encode("utf-8")[:self.text_bytes // 4]
+        offset = self._text_written
+        start = offset % self.text_bytes
+        end = start + len(data)
+        if end <= self.text_bytes:
+            self._text[start:end] = data
+        else:
+            split = self.text_bytes - start
+            self._text[start:] = data[:split]
+            self._text[:end - self.text_bytes] = data[split:]
+        self._text_written += len(data)
+        if len(self._intern) >= self.intern_size:
+            self._intern.clear()
+        self._intern[text] = (offset, len(data))
+        return offset, len(data)
+
+    def _read_text(self, offset: int, length: int) -> Optional[str]:
+        """读出文本；已被覆盖时返回 None（需持有锁）"""
+        if offset < 0 or offset < self._text_written - self.text_bytes:
+            return None
+        start = offset % self.text_bytes
+        end = start + length
+        if end <= self.text_bytes:
+            data = bytes(self._text[start:end])
+        else:
+            data = bytes(self._text[start:]) + bytes(self._text[:end - self.text_bytes])
+        return data.decode("utf-8", errors="ignore")
+
+    def append(self, cmd_code: int, uid: int, value: int = 0, text: Optional[str] = None,
+               ts: Optional[float] = None) -> None:
+        """追加一条事件"""
+        with self._lock:
+            i = self.count % self.capacity
+            self.ts[i] = time.time() if ts is None else ts
+            self.uid[i] = uid
+            self.cmd[i] = cmd_code
+            self.value[i] = value
+            if text:
+                self.text_off[i], self.text_len[i] = self._write_text(text)
+            else:
+                self.text_off[i] = -1
+                self.text_len[i] = 0
+            self.count += 1
+
+    def record(self, message: Dict[str, Any]) -> bool:
+        """从消息提取并追加，返回是否记录"""
+        event = extract_event(message)
+        if event is None:
+            return False
+        self.append(*event)
+        return True
+
+    def _window(self, seconds: Optional[float], cmd: Optional[str] = None,
+                columns: Tuple[str, ...] = ("ts", "uid", "cmd", "value")) -> Dict[str, Any]:
+        """按时间顺序取出窗口内的列（副本）"""
+        with self._lock:
+            n = len(self)
+            if self.count <= self.capacity:
+                order = slice(0, n)
+                data = {c: getattr(self, c)[order].copy() for c in columns}
+            else:
+                head = self.count % self.capacity
+                data = {c: np.concatenate((getattr(self, c)[head:], getattr(self, c)[:head])) for c in columns}
+        mask = None
+        if seconds is not None:
+            mask = data["ts"] >= time.time() - seconds
+        if cmd is not None:
+            cmd_mask = data["cmd"] == CMD_CODES.get(cmd, 0)
+            mask = cmd_mask if mask is None else mask & cmd_mask
+        if mask is not None:
+            data = {c: v[mask] for c, v in data.items()}
+        return data
+
+    def counts_per_window(self, seconds: float = 300.0, bucket: float = 60.0, cmd: Optional[str] = None
+                          ) -> List[Tuple[int, int]]:
+        """最近 seconds 秒内按 bucket 秒分桶的事件数，返回 [(桶起点, 条数)]"""
+        data = self._window(seconds, cmd, ("ts", "cmd"))
+        now = time.time()
+        buckets = int(np.ceil(seconds / bucket))
+        first = (now - seconds) // bucket * bucket
+        index = ((data["ts"] - first) // bucket).astype(np.int64)
+        counts = np.bincount(index[(index >= 0) & (index <= buckets)], minlength=buckets + 1)
+        return [(int(first + i * bucket), int(c)) for i, c in enumerate(counts)]
+
+    def top_users(self, k: int = 10, seconds: Optional[float] = None, cmd: Optional[str] = None,
+                  by: str = "count") -> List[Tuple[int, int]]:
+        """窗口内按条数（by="count"）或价值（by="value"）排名的用户，返回 [(uid, 值)]"""
+        data = self._window(seconds, cmd, ("ts", "uid", "cmd", "value"))
+        uids = data["uid"][data["uid"] > 0]
+        if not len(uids):
+            return []
+        weights = data["value"][data["uid"] > 0] if by == "value" else None
+        unique, inverse = np.unique(uids, return_inverse=True)
+        totals = np.bincount(inverse, weights=weights, minlength=len(unique))
+        k = min(k, len(unique))
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(int(unique[i]), int(totals[i])) for i in top if totals[i] > 0]
+
+    def summary(self, seconds: Optional[float] = None) -> Dict[str, Any]:
+        """窗口内各 cmd 的条数、价值与独立用户数"""
+        data = self._window(seconds)
+        result: Dict[str, Any] = {"events": int(len(data["ts"])), "unique_users": int(len(np.unique(data["uid"]))),
+                                  "by_cmd": {}}
+        for code in np.unique(data["cmd"]):
+            mask = data["cmd"] == code
+            result["by_cmd"][CMD_NAMES.get(int(code), "unknown")] = {
+                "events": int(mask.sum()),
+                "value": int(data["value"][mask].sum()),
+                "unique_users": int(len(np.unique(data["uid"][mask]))),
+            }
+        return result
+
+    def recent(self, n: int = 10, cmd: Optional[str] = None, uid: Optional[int] = None) -> List[Dict[str, Any]]:
+        """最近的 n 条事件（由旧到新）"""
+        code = CMD_CODES.get(cmd, 0) if cmd is not None else None
+        rows: List[Dict[str, Any]] = []
+        with self._lock:
+            for back in range(1, len(self) + 1):
+                i = (self.count - back) % self.capacity
+                if code is not None and self.cmd[i] != code:
+                    continue
+                if uid is not None and self.uid[i] != uid:
+                    continue
+                rows.append({
+                    "ts": float(self.ts[i]),
+                    "uid": int(self.uid[i]),
+                    "cmd": CMD_NAMES.get(int(self.cmd[i]), "unknown"),
+                    "value": int(self.value[i]),
+                    "text": self._read_text(int(self.text_off[i]), int(self.text_len[i])),
+                })
+                if len(rows) >= n:
+                    break
+        rows.reverse()
+        return rows
+
+
+def create_ring(room_id: int, capacity: int, text_bytes: int) -> Optional[EventRingBuffer]:
+    """创建并登记房间的缓冲；未安装 numpy 时返回 None"""
+    if np is None:
+        logger.warning("⚠️ 未安装 numpy，最近事件缓冲已禁用（pip install numpy）")
+        return None
+    ring = EventRingBuffer(room_id, capacity, text_bytes)
+    rings[room_id] = ring
+    return ring
+
+
+def _first(query: Dict[str, List[str]], key: str, default: Optional[str]) -> Optional[str]:
+    return query.get(key, [default])[0]
+
+
+def _ring_for(query: Dict[str, List[str]]) -> Optional[EventRingBuffer]:
+    room = _first(query, "room", None)
+    if room is None and len(rings) == 1:
+        return next(iter(rings.values()))
+    return rings.get(int(room)) if room is not None else None
+
+
+def _json(body: Any) -> Tuple[int, str, bytes]:
+    return 200, "application/json; charset=utf-8", json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def _stats_route(query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+    """GET /events/stats?room=N&window=300&bucket=60[&cmd=DANMU_MSG]"""
+    ring = _ring_for(query)
+    if ring is None:
+        return 404, "text/plain; charset=utf-8", b"room not found\n"
+    window = float(_first(query, "window", "300"))
+    bucket = float(_first(query, "bucket", "60"))
+    cmd = _first(query, "cmd", None)
+    return _json({
+        "room_id": ring.room_id,
+        "summary": ring.summary(window),
+        "per_bucket": ring.counts_per_window(window, bucket, cmd),
+    })
+
+
+def _top_route(query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+    """GET /events/top?room=N&window=300&k=10&by=count|value[&cmd=SEND_GIFT]"""
+    ring = _ring_for(query)
+    if ring is None:
+        return 404, "text/plain; charset=utf-8", b"room not found\n"
+    window = float(_first(query, "window", "300"))
+    top = ring.top_users(int(_first(query, "k", "10")), window, _first(query, "cmd", None),
+                         _first(query, "by", "count"))
+    return _json({"room_id": ring.room_id, "top_users": [{"uid": u, "value": v} for u, v in top]})
+
+
+def register_routes() -> None:
+    """在指标 HTTP 服务上注册 /events/stats 与 /events/top"""
+    add_route("/events/stats", _stats_route)
+    add_route("/events/top", _top_route)
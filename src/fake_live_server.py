@@ -0,0 +1,450 @@
+"""本地模拟弹幕广播服务器
+
+按B站直播弹幕协议模拟 broadcastlv 的 WebSocket 服务，用于端到端压测 BiliDanmakuClient：
+  - 接收 op=7 认证包（create_handshake_packet 生成），回复 op=8
+  - 收到 op=2 心跳回复 op=3（4 字节人气值）
+  - 认证后按配置的速率与 cmd 比例推送 op=5 消息，多条消息打包后用 brotli / zlib 压缩
+内置场景：
+  mixed          弹幕、礼物、进场混合
+  danmaku_storm  弹幕风暴
+  gift_combo     连击礼物（同一 batch_combo_id 连续投喂）
+  pk             周期性 PK：开始 → 票数更新 → 结束
+--stall-after N 模拟半开连接：认证 N 秒后既不推送消息也不回复心跳，但保持 TCP 连接不断开。
+每条消息带 "_fake_sent_at"（发送时刻的 Unix 时间戳，秒，浮点），供压测计算端到端延迟。
+客户端通过 --ws-url（或 config.WS_URL_OVERRIDE）直连本服务器。
+
+用法：
+    python -m src.fake_live_server --port 2245 --rate 200 --scenario danmaku_storm
+    python -m src.fake_live_server --mix DANMU_MSG=70 SEND_GIFT=25 GUARD_BUY=5 --compression zlib
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import socketserver
+import struct
+import threading
+import time
+import logging
+import zlib
+from typing import Dict, Any, List, Optional
+
+import brotli
+
+from .sample_events import (
+    make_danmaku, make_send_gift, make_entry_effect, make_guard_buy, make_user_toast,
+    make_pk_start, make_pk_process, make_pk_end,
+)
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">IHHII")
+OP_HEARTBEAT = 2
+OP_HEARTBEAT_REPLY = 3
+OP_MESSAGE = 5
+OP_AUTH = 7
+OP_AUTH_REPLY = 8
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_OPCODE_BINARY = 0x2
+WS_OPCODE_CLOSE = 0x8
+WS_OPCODE_PING = 0x9
+WS_OPCODE_PONG = 0xA
+
+SENT_AT_FIELD = "_fake_sent_at"
+BROTLI_QUALITY = 4
+
+SCENARIOS: Dict[str, Dict[str, int]] = {
+    "mixed": {"DANMU_MSG": 60, "SEND_GIFT": 20, "ENTRY_EFFECT": 18, "GUARD_BUY": 2},
+    "danmaku_storm": {"DANMU_MSG": 95, "ENTRY_EFFECT": 5},
+    "gift_combo": {"SEND_GIFT": 85, "DANMU_MSG": 10, "ENTRY_EFFECT": 5},
+    "pk": {"DANMU_MSG": 50, "SEND_GIFT": 40, "ENTRY_EFFECT": 10},
+}
+
+DANMAKU_TEXTS = ["主播好", "哈哈哈哈", "来了来了", "666", "晚上好", "这波可以", "好耶", "？？？", "冲冲冲", "打卡"]
+GIFTS = [(31036, "小花花", 100), (31039, "牛哇牛哇", 100), (31164, "粉丝团灯牌", 100), (31037, "打call", 500)]
+
+
+def pack_packet(body: bytes, operation: int, protover: int = 0, sequence: int = 1) -> bytes:
+    """按16字节头部打包一个弹幕协议包"""
+    return HEADER.pack(len(body) + HEADER.size, HEADER.size, protover, operation, sequence) + body
+
+
+def pack_messages(messages: List[Dict[str, Any]], compression: str = "brotli") -> bytes:
+    """把多条业务消息打成一个 op=5 包，compression 为 brotli / zlib / none"""
+    inner = b"".join(
+        pack_packet(json.dumps(m, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), OP_MESSAGE)
+        for m in messages
+    )
+    if compression == "brotli":
+        # 默认 quality=11 单帧要几十毫秒，会算进端到端延迟；实时推送用低压缩等级
+        return pack_packet(brotli.compress(inner, quality=BROTLI_QUALITY), OP_MESSAGE, 3)
+    if compression == "zlib":
+        return pack_packet(zlib.compress(inner), OP_MESSAGE, 2)
+    return inner
+
+
+class TrafficGenerator:
+    """按 cmd 权重生成一个直播间的消息流"""
+
+    def __init__(self, room_id: int, mix: Dict[str, int], pk_enabled: bool = False, pk_duration: float = 60.0,
+                 pk_gap: float = 10.0, combo_continue: float = 0.8, users: int = 5000, seed: Optional[int] = None):
+        self.room_id = room_id
+        self.cmds = list(mix.keys())
+        self.weights = list(mix.values())
+        self.pk_enabled = pk_enabled
+        self.pk_duration = pk_duration
+        self.pk_gap = pk_gap
+        self.combo_continue = combo_continue
+        self.users = max(1, users)
+        self.rng = random.Random(seed)
+        self._combo: Optional[Dict[str, Any]] = None
+        self._pk_id = 0
+        self._pk_started_at: Optional[float] = None
+        self._pk_next_at = time.time() if pk_enabled else float("inf")
+        self._pk_votes = [0, 0]
+
+    def _user(self) -> tuple:
+        uid = 100000 + self.rng.randrange(self.users)
+        return uid, f"用户{uid}"
+
+    def _gift(self) -> Dict[str, Any]:
+        combo = self._combo
+        if combo and self.rng.random() < self.combo_continue:
+            combo["num"] += 1
+        else:
+            uid, uname = self._user()
+            gift_id, gift_name, price = self.rng.choice(GIFTS)
+            combo = self._combo = {
+                "uid": uid, "uname": uname, "gift_id": gift_id, "gift_name": gift_name, "price": price, "num": 1,
+                "combo_id": f"batch:gift:combo_id:{uid}:{self.room_id}:{gift_id}:{time.time():.4f}",
+            }
+        self._pk_votes[0] += combo["price"] // 100
+        return make_send_gift(uid=combo["uid"], uname=combo["uname"], room_id=self.room_id,
+                              gift_id=combo["gift_id"], gift_name=combo["gift_name"], price=combo["price"],
+                              num=combo["num"], batch_combo_id=combo["combo_id"])
+
+    def _message(self, cmd: str) -> Dict[str, Any]:
+        if cmd == "SEND_GIFT":
+            return self._gift()
+        uid, uname = self._user()
+        if cmd == "DANMU_MSG":
+            return make_danmaku(uid=uid, uname=uname, text=self.rng.choice(DANMAKU_TEXTS), room_id=self.room_id)
+        if cmd == "ENTRY_EFFECT":
+            return make_entry_effect(uid=uid, uname=uname, room_id=self.room_id,
+                                     guard_level=3 if self.rng.random() < 0.05 else 0)
+        if cmd == "GUARD_BUY":
+            return make_guard_buy(uid=uid, uname=uname)
+        if cmd == "USER_TOAST_MSG":
+            return make_user_toast(uid=uid, uname=uname)
+        return {"cmd": cmd, "data": {}}
+
+    def _pk_messages(self, now: float) -> List[Dict[str, Any]]:
+        """PK 生命周期：到点开始，进行中每批附带一次票数更新，超时结束"""
+        if self._pk_started_at is None:
+            if now < self._pk_next_at:
+                return []
+            self._pk_id += 1
+            self._pk_started_at = now
+            self._pk_votes = [0, 0]
+            return [make_pk_start(self.room_id, pk_id=self._pk_id)]
+        if now - self._pk_started_at >= self.pk_duration:
+            self._pk_started_at = None
+            self._pk_next_at = now + self.pk_gap
+            return [make_pk_end(self.room_id, pk_id=self._pk_id)]
+        self._pk_votes[1] += self.rng.randrange(0, 20)
+        return [make_pk_process(self.room_id, self._pk_votes[0], self._pk_votes[1], pk_id=self._pk_id)]
+
+    def batch(self, count: int) -> List[Dict[str, Any]]:
+        """生成一批消息（count 条业务消息，PK 场景下另附 PK 消息）"""
+        now = time.time()
+        messages = self._pk_messages(now) if self.pk_enabled else []
+        if count > 0:
+            messages.extend(self._message(cmd) for cmd in self.rng.choices(self.cmds, self.weights, k=count))
+        for message in messages:
+            message[SENT_AT_FIELD] = now
+        return messages
+
+
+class FakeLiveConfig:
+    """模拟服务器的推送配置"""
+
+    def __init__(self, rate: float = 50.0, flush_ms: float = 100.0, compression: str = "brotli",
+                 scenario: str = "mixed", mix: Optional[Dict[str, int]] = None, pk_duration: float = 60.0,
+                 pk_gap: float = 10.0, popularity: int = 1000, stall_after: Optional[float] = None):
+        if compression not in ("brotli", "zlib", "none"):
+            raise ValueError(f"未知的压缩方式: {compression}")
+        if scenario not in SCENARIOS:
+            raise ValueError(f"未知的场景: {scenario}")
+        self.rate = float(rate)  # 每个直播间每秒的消息数
+        self.flush_ms = float(flush_ms)  # 打包间隔，间隔内的消息合并为一个 WebSocket 帧
+        self.compression = compression
+        self.scenario = scenario
+        self.mix = dict(mix) if mix else dict(SCENARIOS[scenario])
+        self.pk_duration = float(pk_duration)
+        self.pk_gap = float(pk_gap)
+        self.popularity = int(popularity)
+        self.stall_after = stall_after  # 认证后多少秒开始装死（None 表示不装死）
+
+    def stalled(self, authenticated_at: Optional[float]) -> bool:
+        return (self.stall_after is not None and authenticated_at is not None
+                and time.monotonic() - authenticated_at >= self.stall_after)
+
+    def generator(self, room_id: int) -> TrafficGenerator:
+        return TrafficGenerator(room_id, self.mix, pk_enabled=(self.scenario == "pk"),
+                                pk_duration=self.pk_duration, pk_gap=self.pk_gap)
+
+
+class FakeLiveStats:
+    """连接与发送统计（多线程共享）"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.connections = 0
+        self.active = 0
+        self.authenticated = 0
+        self.heartbeats = 0
+        self.frames = 0
+        self.messages = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def add(self, **deltas: int) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = max(1e-6, time.time() - self.started_at)
+            return {
+                "uptime_sec": elapsed,
+                "connections": self.connections,
+                "active": self.active,
+                "authenticated": self.authenticated,
+                "heartbeats": self.heartbeats,
+                "frames": self.frames,
+                "messages": self.messages,
+                "bytes_sent": self.bytes_sent,
+                "messages_per_sec": self.messages / elapsed,
+            }
+
+
+class _WebSocketConnection:
+    """最小的服务端 WebSocket 实现（RFC 6455），只支持不分片的帧"""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self._write_lock = threading.Lock()
+
+    def handshake(self) -> Optional[str]:
+        request_line = self.rfile.readline(65537).decode("latin-1").strip()
+        if not request_line:
+            return None
+        headers = {}
+        while True:
+            line = self.rfile.readline(65537).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        if not key:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return None
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        self.wfile.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("ascii"))
+        self.wfile.flush()
+        parts = request_line.split()
+        return parts[1] if len(parts) >= 2 else "/"
+
+    def _read_exact(self, size: int) -> bytes:
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise EOFError("连接已关闭")
+        return data
+
+    def read_frame(self) -> tuple:
+        first, second = self._read_exact(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", self._read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self._read_exact(8))[0]
+        mask = self._read_exact(4) if second & 0x80 else None
+        payload = self._read_exact(length) if length else b""
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+    def write_frame(self, opcode: int, payload: bytes) -> int:
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        with self._write_lock:
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+        return len(header) + length
+
+
+class FakeLiveHandler(socketserver.StreamRequestHandler):
+    """一个客户端连接：读取认证/心跳，认证后启动推送线程"""
+
+    def handle(self) -> None:
+        server: "FakeLiveServer" = self.server
+        conn = _WebSocketConnection(self.rfile, self.wfile)
+        if conn.handshake() is None:
+            return
+        server.stats.add(connections=1, active=1)
+        stop = threading.Event()
+        self.authenticated_at: Optional[float] = None
+        try:
+            while True:
+                opcode, payload = conn.read_frame()
+                if opcode == WS_OPCODE_CLOSE:
+                    conn.write_frame(WS_OPCODE_CLOSE, payload[:2])
+                    break
+                if opcode == WS_OPCODE_PING:
+                    conn.write_frame(WS_OPCODE_PONG, payload)
+                    continue
+                if opcode == WS_OPCODE_BINARY:
+                    self._handle_packets(conn, payload, stop)
+        except (EOFError, OSError, ValueError):
+            pass
+        finally:
+            stop.set()
+            server.stats.add(active=-1)
+
+    def _handle_packets(self, conn: _WebSocketConnection, data: bytes, stop: threading.Event) -> None:
+        server: "FakeLiveServer" = self.server
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            packet_length, header_length, _, operation, sequence = HEADER.unpack_from(data, offset)
+            body = data[offset + header_length:offset + packet_length]
+            if operation == OP_AUTH:
+                auth = json.loads(body.decode("utf-8"))
+                room_id = int(auth.get("roomid", 0))
+                conn.write_frame(WS_OPCODE_BINARY, pack_packet(b'{"code":0}', OP_AUTH_REPLY, 1, sequence))
+                server.stats.add(authenticated=1)
+                self.authenticated_at = time.monotonic()
+                threading.Thread(target=self._stream, args=(conn, room_id, stop),
+                                 name=f"fake-live-{room_id}", daemon=True).start()
+            elif operation == OP_HEARTBEAT and not server.config.stalled(self.authenticated_at):
+                popularity = struct.pack(">I", server.config.popularity)
+                conn.write_frame(WS_OPCODE_BINARY, pack_packet(popularity, OP_HEARTBEAT_REPLY, 1, sequence))
+                server.stats.add(heartbeats=1)
+            offset += max(packet_length, HEADER.size)
+
+    def _stream(self, conn: _WebSocketConnection, room_id: int, stop: threading.Event) -> None:
+        """按 rate 推送消息，每 flush_ms 打包一帧；小数部分累积到下一帧"""
+        server: "FakeLiveServer" = self.server
+        config = server.config
+        generator = config.generator(room_id)
+        interval = max(0.001, config.flush_ms / 1000.0)
+        carry = 0.0
+        next_at = time.monotonic()
+        while not stop.is_set():
+            next_at += interval
+            carry += config.rate * interval
+            count = int(carry)
+            carry -= count
+            messages = generator.batch(count) if not config.stalled(self.authenticated_at) else []
+            if messages:
+                try:
+                    sent = conn.write_frame(WS_OPCODE_BINARY, pack_messages(messages, config.compression))
+                except (OSError, ValueError):
+                    break
+                server.stats.add(frames=1, messages=len(messages), bytes_sent=sent)
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                stop.wait(delay)
+            else:
+                next_at = time.monotonic()  # 跟不上时不补发，避免突发
+
+
+class FakeLiveServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address: tuple, config: Optional[FakeLiveConfig] = None):
+        super().__init__(address, FakeLiveHandler)
+        self.config = config or FakeLiveConfig()
+        self.stats = FakeLiveStats()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"ws://{host}:{port}/sub"
+
+
+def start_in_background(host: str = "127.0.0.1", port: int = 0, **config_kwargs: Any) -> FakeLiveServer:
+    """在后台线程中启动模拟服务器，port=0 时自动分配端口（server.url 为连接地址）"""
+    server = FakeLiveServer((host, port), FakeLiveConfig(**config_kwargs))
+    threading.Thread(target=server.serve_forever, name="fake-live-server", daemon=True).start()
+    return server
+
+
+def _parse_mix(pairs: Optional[List[str]]) -> Optional[Dict[str, int]]:
+    if not pairs:
+        return None
+    mix = {}
+    for pair in pairs:
+        cmd, _, weight = pair.partition("=")
+        mix[cmd.strip()] = int(weight or 1)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tofu Danmaku 本地模拟弹幕广播服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2245)
+    parser.add_argument("--rate", type=float, default=50, help="每个直播间每秒推送的消息数")
+    parser.add_argument("--flush-ms", type=float, default=100, help="打包间隔(毫秒)，间隔内的消息合并为一帧")
+    parser.add_argument("--compression", choices=["brotli", "zlib", "none"], default="brotli")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--mix", nargs="*", metavar="CMD=WEIGHT", help="自定义 cmd 比例，覆盖场景默认值")
+    parser.add_argument("--pk-duration", type=float, default=60, help="pk 场景下每场 PK 的时长(秒)")
+    parser.add_argument("--pk-gap", type=float, default=10, help="pk 场景下两场 PK 的间隔(秒)")
+    parser.add_argument("--stall-after", type=float, help="认证后多少秒开始装死（模拟半开连接）")
+    parser.add_argument("--stats-interval", type=float, default=10, help="打印统计的间隔(秒)，0 表示不打印")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = FakeLiveConfig(args.rate, args.flush_ms, args.compression, args.scenario, _parse_mix(args.mix),
+                            args.pk_duration, args.pk_gap, stall_after=args.stall_after)
+    server = FakeLiveServer((args.host, args.port), config)
+    logger.info(f"📡 模拟弹幕服务器已启动: {server.url} （场景={config.scenario}, 每间 {config.rate:g} 条/秒）")
+
+    if args.stats_interval > 0:
+        def report() -> None:
+            while True:
+                time.sleep(args.stats_interval)
+                s = server.stats.snapshot()
+                logger.info(f"📈 在线 {s['active']} 间，已推送 {s['messages']} 条 / {s['frames']} 帧，"
+                            f"平均 {s['messages_per_sec']:.0f} 条/秒，心跳 {s['heartbeats']}")
+        threading.Thread(target=report, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
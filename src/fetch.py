@@ -67,6 +67,14 @@ def fetch_wbi_keys():
 
 def fetch_server_info(self):
     """通过 API 获取服务器地址和 token"""
+    # 指定了直连地址（如本地模拟服务器）时不请求B站接口
+    override = getattr(self, 'ws_url_override', None)
+    if override:
+        self.ws_url = override
+        self.token = ""
+        logger.info(f"✅ 使用指定的 WebSocket 地址: {self.ws_url}")
+        return True
+
     # 获取 buvid3 和 buvid4
     buvid_data = fetch_buvid()
     try:
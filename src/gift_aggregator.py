@@ -0,0 +1,96 @@
+"""礼物连击聚合
+
+连击礼物会以几十个共享同一 batch_combo_id 的 SEND_GIFT 包到达，
+这里在可配置的时间窗口内按 (uid, gift_id, batch_combo_id) 合并，
+窗口结束（或PK截止检查前）只发出一条汇总记录，减少 /money 请求数。
+盲盒连击合并后 blind_box.diff 仍是单个盲盒的盈亏，另加 total_diff 为整个连击的盈亏。
+"""
+
+import logging
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from .windowed_buffer import WindowedBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class GiftComboAggregator(WindowedBuffer):
+    """礼物连击聚合器"""
+
+    thread_name = "gift-combo-flusher"
+    log_prefix = "🎁 连击合并"
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], window: float = 3.0):
+        """
+        Args:
+            emit: 汇总记录的输出回调（通常是发送到 /money）
+            window: 合并窗口（秒），从该连击的第一个包开始计时；<=0 表示不合并
+        """
+        super().__init__(emit, window)
+        self.avoided_calls = 0
+
+    @staticmethod
+    def _key(payload: Dict[str, Any]) -> Optional[Tuple[Any, Any, Any]]:
+        batch_combo_id = payload.get("batch_combo_id")
+        if not batch_combo_id:
+            return None
+        return payload.get("uid"), payload.get("gift_id"), batch_combo_id
+
+    def add(self, payload: Dict[str, Any]) -> None:
+        """加入一条礼物记录；没有连击ID或未开启合并时直接输出"""
+        self._offer(self._key(payload), payload)
+
+    def _new_entry(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {"payload": dict(payload), "count": 1}
+
+    @staticmethod
+    def _blind_total_diff(payload: Dict[str, Any]) -> Optional[float]:
+        """盲盒记录的总盈亏：已合并的取 total_diff，单个包为单个盈亏 × 数量"""
+        box = payload.get("blind_box")
+        if not isinstance(box, dict):
+            return None
+        if isinstance(box.get("total_diff"), (int, float)):
+            return box["total_diff"]
+        diff = box.get("diff")
+        if not isinstance(diff, (int, float)):
+            return None
+        return diff * (payload.get("gift_num") or 1)
+
+    def _merge(self, entry: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+        """合并同一连击的后续礼物：数量与总价累加，盲盒盈亏重新计算，其余字段取最新值"""
+        merged = entry["payload"]
+        merged_diff = self._blind_total_diff(merged)
+        payload_diff = self._blind_total_diff(payload)
+        if merged_diff is not None and payload_diff is not None:
+            # diff 保持单个盈亏（各包相同），total_diff 为整个连击的盈亏，result 按总盈亏判定
+            total_diff = merged_diff + payload_diff
+            box = dict(merged["blind_box"])
+            box["diff"] = payload["blind_box"].get("diff")
+            box["total_diff"] = total_diff
+            box["result"] = "profit" if total_diff > 0 else "loss" if total_diff < 0 else "even"
+            merged["blind_box"] = box
+        merged["gift_num"] = (merged.get("gift_num") or 0) + (payload.get("gift_num") or 0)
+        merged["total_price"] = (merged.get("total_price") or 0) + (payload.get("total_price") or 0)
+        for k in ("timestamp", "combo_total_coin", "total_coin", "combo_id"):
+            if payload.get(k) is not None:
+                merged[k] = payload[k]
+        entry["count"] += 1
+        return False
+
+    def _counters(self) -> Dict[str, int]:
+        return {"avoided_calls": self.avoided_calls}
+
+    def _emit(self, entry: Dict[str, Any]) -> None:
+        payload = entry["payload"]
+        count = entry["count"]
+        if count > 1:
+            payload["combo_merged_count"] = count
+        with self._cond:
+            self.avoided_calls += count - 1
+            avoided_total = self.avoided_calls
+        if count > 1:
+            logger.info(f"🎁 连击合并：{count} 个包合并为 1 条记录，累计节省 {avoided_total} 次请求")
+        try:
+            self.emit(payload)
+        except Exception as e:
+            logger.error(f"❌ 输出连击合并记录时出错: {e}")
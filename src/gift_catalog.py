@@ -0,0 +1,176 @@
+"""礼物目录缓存
+
+礼物名称、类型、货币类型、图标与动画资源（gift_info 中的 gif / webp / img_basic / effect_id 等）
+对同一个 gift_id 是固定的，却随每条 SEND_GIFT 重复出现在 /money 请求体里。
+这里按 gift_id 学习这些静态字段并持久化到磁盘：
+  - 已知且未过期（refresh 秒内学习过）的礼物不再逐条构造资源字典，直接复用目录中的条目
+  - 新礼物或字段有变化时标记为待保存，后台线程定期写盘（先写临时文件再替换），进程退出时也会保存
+  - 可选地把新增/变化的条目发送到后端（GIFT_CATALOG_SYNC_ENDPOINT），后端据此维护自己的礼物目录
+目录在所有房间间共享。
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("gift_catalog_entries", "礼物目录中的礼物数")
+metrics.describe("gift_catalog_lookups_total", "礼物目录查询次数（按是否命中）")
+
+# gift_info 中的可视资源字段
+ASSET_FIELDS = ("effect_id", "gif", "webp", "img_basic", "has_imaged_gift")
+
+
+def entry_from_gift(data: Dict[str, Any]) -> Dict[str, Any]:
+    """从 SEND_GIFT 的 data 提取礼物的静态字段"""
+    entry: Dict[str, Any] = {
+        "gift_id": data.get("giftId"),
+        "gift_name": data.get("giftName"),
+        "price": data.get("price"),
+        "coin_type": data.get("coin_type"),
+        "gift_type": data.get("giftType"),
+    }
+    gift_info = data.get("gift_info")
+    if isinstance(gift_info, dict):
+        assets = {key: gift_info.get(key) for key in ASSET_FIELDS if key in gift_info}
+        if assets:
+            entry["gift_assets"] = assets
+    if data.get("tag_image"):
+        entry["tag_image"] = data.get("tag_image")
+    if data.get("combo_resources_id") is not None:
+        entry["combo_resources_id"] = data.get("combo_resources_id")
+    return {k: v for k, v in entry.items() if v is not None}
+
+
+class GiftCatalog:
+    """按 gift_id 缓存的礼物目录"""
+
+    def __init__(self, path: Optional[str] = None, refresh: float = 86400.0, flush_interval: float = 30.0):
+        """
+        Args:
+            path: 持久化文件，None 表示只保存在内存中
+            refresh: 条目的有效期（秒），过期后从下一条礼物消息重新学习
+            flush_interval: 有变化时写盘的间隔（秒）
+        """
+        self.path = path
+        self.refresh = float(refresh)
+        self.flush_interval = float(flush_interval)
+        self._entries: Dict[Any, Dict[str, Any]] = {}
+        self._learned_at: Dict[Any, float] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._loaded = False
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        metrics.register_collector(self._collect_metrics)
+
+    def load(self) -> int:
+        """从持久化文件加载目录（每个进程只加载一次），返回加载的条目数"""
+        with self._lock:
+            if self._loaded:
+                return 0
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                return 0
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    gifts = json.load(f).get("gifts") or []
+            except (OSError, ValueError, AttributeError) as e:
+                logger.error(f"❌ 读取礼物目录失败: {e}")
+                return 0
+            # 从磁盘加载的条目视为已过期，下次出现时顺带刷新
+            for entry in gifts:
+                if isinstance(entry, dict) and entry.get("gift_id") is not None:
+                    self._entries[entry["gift_id"]] = entry
+            count = len(self._entries)
+        logger.info(f"🎁 已从 {self.path} 加载 {count} 个礼物的目录信息")
+        return count
+
+    def get(self, gift_id: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._entries.get(gift_id)
+
+    def learn(self, data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """查询礼物；未知或已过期时从 data 学习
+
+        Returns:
+            (目录条目, 是否为新增或有变化的条目)；条目由目录持有，调用方不要修改
+        """
+        gift_id = data.get("giftId")
+        if gift_id is None:
+            return None, False
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(gift_id)
+            fresh = entry is not None and now - self._learned_at.get(gift_id, float("-inf")) < self.refresh
+        if fresh:
+            metrics.inc("gift_catalog_lookups_total", result="hit")
+            return entry, False
+
+        learned = entry_from_gift(data)
+        with self._lock:
+            current = self._entries.get(gift_id)
+            changed = current != learned
+            if changed:
+                self._entries[gift_id] = learned
+                self._dirty = True
+            self._learned_at[gift_id] = now
+            entry = self._entries[gift_id]
+        metrics.inc("gift_catalog_lookups_total", result="learned" if changed else "refreshed")
+        if changed:
+            logger.info(f"🎁 礼物目录{'更新' if current else '新增'}：{learned.get('gift_name')} (gift_id={gift_id})")
+            self._ensure_thread()
+        return entry, changed
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"gifts": list(self._entries.values())}
+
+    def save(self) -> None:
+        """有变化时写入持久化文件（先写临时文件再替换）"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            gifts = list(self._entries.values())
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"gifts": gifts}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            with self._lock:
+                self._dirty = True
+            logger.error(f"❌ 保存礼物目录失败: {e}")
+
+    def stop(self) -> None:
+        """停止后台写盘线程并保存"""
+        self._stop.set()
+        self.save()
+
+    def _ensure_thread(self) -> None:
+        if not self.path or self._stop.is_set():
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="gift-catalog-saver", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.save()
+
+    def _collect_metrics(self) -> None:
+        with self._lock:
+            count = len(self._entries)
+        metrics.set_gauge("gift_catalog_entries", count)
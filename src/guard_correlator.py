@@ -0,0 +1,93 @@
+"""上舰事件关联
+
+一次上舰通常会先后收到 GUARD_BUY 和 USER_TOAST_MSG 两条消息，描述的是同一笔购买。
+这里把上舰记录在短时间窗口内按 (uid, guard_level) 缓存，另一条消息到达时合并为一条记录，
+字段取两者中更完整的值，只向 /guard 上报一次。同一 cmd 的第二条消息视为另一笔购买，
+先输出已缓存的记录再重新开始。只收到其中一条时，窗口结束后原样输出。
+
+合并掉的重复记录数写入 guard_duplicates_collapsed_total{room}。
+"""
+
+import logging
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from .metrics import metrics
+from .windowed_buffer import WindowedBuffer
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("guard_duplicates_collapsed_total", "GUARD_BUY 与 USER_TOAST_MSG 合并掉的重复上舰记录数")
+
+# 仅出现在 USER_TOAST_MSG 中、合并后保留的字段
+TOAST_FIELDS = ("payflow_id", "unit", "op_type", "toast_msg")
+
+
+class GuardEventCorrelator(WindowedBuffer):
+    """上舰事件关联器"""
+
+    thread_name = "guard-correlator"
+    log_prefix = "⚓ 上舰关联"
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], window: float = 2.0, room_id: Optional[int] = None):
+        """
+        Args:
+            emit: 合并后记录的输出回调（通常是发送到 /guard）
+            window: 等待另一条消息的时间（秒），从第一条消息到达开始计时；<=0 表示不关联
+            room_id: 指标标签
+        """
+        super().__init__(emit, window)
+        self.room_id = room_id
+        self.collapsed = 0
+
+    @staticmethod
+    def _key(payload: Dict[str, Any]) -> Optional[Tuple[Any, Any]]:
+        uid = payload.get("uid")
+        guard_level = payload.get("guard_level")
+        if not uid or not guard_level:
+            return None
+        return uid, guard_level
+
+    def add(self, cmd: str, payload: Dict[str, Any]) -> None:
+        """加入一条上舰记录；无法关联或未开启关联时直接输出"""
+        self._offer(self._key(payload), cmd, payload)
+
+    def _new_entry(self, cmd: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {"payload": dict(payload), "cmds": [cmd]}
+
+    def _accepts(self, entry: Dict[str, Any], cmd: str, payload: Dict[str, Any]) -> bool:
+        # 同类消息再次出现：另一笔购买
+        return cmd not in entry["cmds"]
+
+    def _merge(self, entry: Dict[str, Any], cmd: str, payload: Dict[str, Any]) -> bool:
+        """合并另一条消息：缺失的字段补齐；USER_TOAST_MSG 的原始消息更完整，优先保留"""
+        merged = entry["payload"]
+        for k, v in payload.items():
+            if k == "raw_message":
+                continue
+            if merged.get(k) is None and v is not None:
+                merged[k] = v
+        for k in TOAST_FIELDS:
+            if payload.get(k) is not None:
+                merged[k] = payload[k]
+        if cmd == "USER_TOAST_MSG" and payload.get("raw_message") is not None:
+            merged["raw_message"] = payload["raw_message"]
+        entry["cmds"].append(cmd)
+        # 两条消息都已到达，不必等到窗口结束
+        return True
+
+    def _counters(self) -> Dict[str, int]:
+        return {"collapsed": self.collapsed}
+
+    def _emit(self, entry: Dict[str, Any]) -> None:
+        payload = entry["payload"]
+        cmds = entry["cmds"]
+        payload["sources"] = list(cmds)
+        with self._cond:
+            self.collapsed += len(cmds) - 1
+        if len(cmds) > 1:
+            metrics.inc("guard_duplicates_collapsed_total", len(cmds) - 1, room=self.room_id)
+            logger.info(f"⚓ 上舰关联：{' + '.join(cmds)} 合并为 1 条记录 (uid={payload.get('uid')})")
+        try:
+            self.emit(payload)
+        except Exception as e:
+            logger.error(f"❌ 输出上舰记录时出错: {e}")
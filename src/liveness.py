@@ -0,0 +1,137 @@
+"""连接活性监测
+
+半开的 TCP 连接不会报错，只是再也收不到数据。这里对每个连接跟踪最近一次 op=3（心跳回复）
+和 op=5（业务消息）的时间：
+  - 任何一次心跳（定时心跳或探测心跳）发出后 ack_timeout 秒内没有收到 op=3，判定卡死
+  - 连接沉默（op=3、op=5 都没有）超过按该房间消息速率推算的阈值
+    clamp(silence_factor × op=5 平均间隔, min_silence, max_silence) 时，立即发一个探测心跳，
+    而不是等下一次 30 秒的定时心跳；冷清的房间阈值自然放宽到 max_silence
+判定卡死后回调 on_stall(reason)（由客户端主动断开重连），并记录：
+  ws_stalls_total{room, reason}            卡死次数
+  ws_stall_detection_seconds{room}          从最后一次收到数据到判定卡死的耗时
+  ws_liveness_probes_total{room}            探测心跳次数
+"""
+
+import threading
+import time
+import logging
+from typing import Callable, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DETECTION_BUCKETS = (1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+
+metrics.describe("ws_stalls_total", "判定连接卡死的次数")
+metrics.describe("ws_stall_detection_seconds", "从最后一次收到数据到判定卡死的耗时")
+metrics.describe("ws_liveness_probes_total", "因业务消息沉默而发出的探测心跳次数")
+
+
+class LivenessMonitor:
+    """单个连接的活性监测，on_stall 最多回调一次"""
+
+    def __init__(self, room_id: int, send_probe: Callable[[], None], on_stall: Callable[[str], None],
+                 ack_timeout: float = 10.0, min_silence: float = 5.0, max_silence: float = 45.0,
+                 silence_factor: float = 10.0, check_interval: float = 1.0, ewma_alpha: float = 0.05):
+        self.room_id = room_id
+        self.send_probe = send_probe
+        self.on_stall = on_stall
+        self.ack_timeout = ack_timeout
+        self.min_silence = min_silence
+        self.max_silence = max_silence
+        self.silence_factor = silence_factor
+        self.check_interval = check_interval
+        self.ewma_alpha = ewma_alpha
+
+        now = time.monotonic()
+        self.last_ack = now
+        self.last_message: Optional[float] = None
+        self.last_activity = now
+        self.mean_gap: Optional[float] = None  # op=5 帧平均间隔（指数加权）
+        self._probe_sent_at: Optional[float] = None  # 等待 op=3 的心跳发出时刻
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stalled = False
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"liveness-{self.room_id}", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def heartbeat_sent(self) -> None:
+        """发出了一次心跳，开始等待 op=3"""
+        with self._lock:
+            if self._probe_sent_at is None:
+                self._probe_sent_at = time.monotonic()
+
+    def ack_received(self) -> None:
+        """收到 op=3"""
+        now = time.monotonic()
+        with self._lock:
+            self.last_ack = now
+            self.last_activity = now
+            self._probe_sent_at = None
+
+    def message_received(self) -> None:
+        """收到 op=5"""
+        now = time.monotonic()
+        with self._lock:
+            if self.last_message is not None:
+                gap = now - self.last_message
+                self.mean_gap = gap if self.mean_gap is None else \
+                    self.mean_gap + self.ewma_alpha * (gap - self.mean_gap)
+            self.last_message = now
+            self.last_activity = now
+
+    def silence_threshold(self) -> float:
+        """业务消息沉默多久后发探测心跳"""
+        with self._lock:
+            mean_gap = self.mean_gap
+        if mean_gap is None:
+            return self.max_silence
+        return min(self.max_silence, max(self.min_silence, self.silence_factor * mean_gap))
+
+    def check(self) -> Optional[str]:
+        """检查一次；判定卡死时返回原因"""
+        now = time.monotonic()
+        threshold = self.silence_threshold()
+        with self._lock:
+            probe_sent_at = self._probe_sent_at
+            silence = now - self.last_activity
+        if probe_sent_at is not None and now - probe_sent_at > self.ack_timeout:
+            return "heartbeat_timeout"
+        if probe_sent_at is None and silence > threshold:
+            logger.info(f"🔎 直播间 {self.room_id} 已 {silence:.1f}s 未收到数据（阈值 {threshold:.1f}s），发送探测心跳")
+            metrics.inc("ws_liveness_probes_total", room=self.room_id)
+            self.heartbeat_sent()
+            try:
+                self.send_probe()
+            except Exception as e:
+                logger.warning(f"⚠️ 探测心跳发送失败: {e}")
+                return "probe_failed"
+        return None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            reason = self.check()
+            if reason:
+                self._declare_stalled(reason)
+                return
+
+    def _declare_stalled(self, reason: str) -> None:
+        with self._lock:
+            detection = time.monotonic() - self.last_activity
+        self.stalled = True
+        self._stop.set()
+        metrics.inc("ws_stalls_total", room=self.room_id, reason=reason)
+        metrics.observe("ws_stall_detection_seconds", detection, DETECTION_BUCKETS, room=self.room_id)
+        logger.warning(f"💤 直播间 {self.room_id} 连接卡死（{reason}），已 {detection:.1f}s 未收到数据，主动重连")
+        try:
+            self.on_stall(reason)
+        except Exception as e:
+            logger.error(f"❌ 卡死回调失败: {e}")
@@ -0,0 +1,229 @@
+"""运行时指标
+
+进程内的轻量指标注册表：计数器、仪表盘和直方图，按名称 + 标签区分。
+各模块直接写入全局的 metrics 实例。
+start_http_server 以 Prometheus 文本格式在 /metrics 导出全部指标。
+"""
+
+import bisect
+import math
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Tuple, Optional, Sequence, Callable, List
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 附加路由的处理函数：接收查询参数，返回 (状态码, Content-Type, 响应体)
+RouteHandler = Callable[[Dict[str, List[str]]], Tuple[int, str, bytes]]
+
+# 默认直方图分桶（秒），覆盖 1ms ~ 10s 的请求/处理耗时
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """固定分桶直方图"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按分桶估算分位数（返回所在桶的上界）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def describe(self, name: str, text: str) -> None:
+        """设置指标说明"""
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """计数器累加"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """设置仪表盘数值"""
+        key = _label_key(labels)
+        with self._lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: Any) -> None:
+        """记录一次直方图观测值"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def register_collector(self, collector: Callable[[], None]) -> None:
+        """注册拉取式采集函数，在导出前调用（用于刷新队列深度等仪表盘）"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> None:
+        """执行所有采集函数"""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                pass
+
+    def render(self) -> str:
+        """先执行采集函数，再按 Prometheus 文本格式导出全部指标"""
+        self.collect()
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+            histograms = {
+                name: {key: (h.buckets, list(h.counts), h.count, h.sum) for key, h in series.items()}
+                for name, series in self.histograms.items()
+            }
+            help_text = dict(self.help)
+
+        lines: List[str] = []
+        for kind, table in (("counter", counters), ("gauge", gauges)):
+            for name in sorted(table):
+                _header(lines, name, kind, help_text)
+                for key, value in sorted(table[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for name in sorted(histograms):
+            _header(lines, name, "histogram", help_text)
+            for key, (buckets, counts, count, total) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, c in zip(buckets, counts):
+                    cumulative += c
+                    lines.append(f"{name}_bucket{_format_labels(key, le=_format_value(bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, le='+Inf')} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def get(self, name: str, **labels: Any) -> Optional[float]:
+        """读取计数器或仪表盘的当前值"""
+        key = _label_key(labels)
+        with self._lock:
+            for table in (self.counters, self.gauges):
+                if name in table and key in table[name]:
+                    return table[name][key]
+        return None
+
+
+def _header(lines: List[str], name: str, kind: str, help_text: Dict[str, str]) -> None:
+    if name in help_text:
+        lines.append(f"# HELP {name} {help_text[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, le: Optional[str] = None) -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in key]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+        return repr(value)
+    return str(value)
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+# /metrics 以外的附加路由（如性能剖析的管理接口），路径 -> 处理函数
+routes: Dict[str, RouteHandler] = {}
+
+
+def add_route(path: str, handler: RouteHandler) -> None:
+    """在指标 HTTP 服务上注册附加路由（GET）"""
+    routes[path] = handler
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = metrics
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("metrics: " + format % args)
+
+    def _reply(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._reply(200, PROMETHEUS_CONTENT_TYPE, self.registry.render().encode("utf-8"))
+            return
+        handler = routes.get(url.path)
+        if handler is None:
+            self._reply(404, "text/plain; charset=utf-8", b"not found\n")
+            return
+        try:
+            status, content_type, body = handler(parse_qs(url.query))
+        except Exception as e:
+            logger.error(f"❌ 处理 {url.path} 失败: {e}")
+            status, content_type, body = 500, "text/plain; charset=utf-8", f"{e}\n".encode("utf-8")
+        self._reply(status, content_type, body)
+
+
+def start_http_server(port: int, host: str = "0.0.0.0", registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """在后台线程启动指标 HTTP 服务（GET /metrics），port=0 时自动分配端口"""
+    handler = type("BoundMetricsRequestHandler", (_MetricsRequestHandler,), {"registry": registry or metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"📊 指标服务已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
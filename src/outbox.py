@@ -0,0 +1,379 @@
+"""持久化发件箱
+
+API 请求失败（后端重启、网络异常）时，事件写入磁盘上的追加式分段日志，
+由后台重试线程按端点顺序、指数退避重新发送，避免 /money、/guard 等记录丢失。
+
+目录结构：
+  <dir>/<首条记录ID>.seg   分段日志，每行一条 JSON 记录
+  <dir>/acks.log          已确认（发送成功或丢弃）的记录ID，每行一个
+分段内所有记录都确认后整段删除；acks.log 过大时压缩掉已删除分段的ID。
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import logging
+from collections import deque, OrderedDict
+from typing import Dict, Any, Callable, Deque, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".seg"
+ACKS_FILE = "acks.log"
+
+
+class Outbox:
+    """追加式分段日志 + 后台重试"""
+
+    def __init__(self, directory: str, segment_bytes: int = 4 * 1024 * 1024, max_bytes: int = 256 * 1024 * 1024,
+                 fsync_interval_ms: int = 200, retry_base_delay: float = 1.0, retry_max_delay: float = 60.0):
+        """
+        Args:
+            directory: 发件箱目录
+            segment_bytes: 单个分段的大小上限，超过后滚动到新分段
+            max_bytes: 发件箱总磁盘占用上限，超过时丢弃最旧的分段
+            fsync_interval_ms: 批量 fsync 的间隔（毫秒），追加时不逐条 fsync
+            retry_base_delay: 重试退避的初始间隔（秒）
+            retry_max_delay: 重试退避的最大间隔（秒）
+        """
+        self.directory = directory
+        self.segment_bytes = int(segment_bytes)
+        self.max_bytes = int(max_bytes)
+        self.fsync_interval = max(0, int(fsync_interval_ms)) / 1000.0
+        self.retry_base_delay = float(retry_base_delay)
+        self.retry_max_delay = float(retry_max_delay)
+
+        self._cond = threading.Condition()
+        self._send: Optional[Callable[[Dict[str, Any]], tuple]] = None
+        self._started = False
+        self._stopped = False
+        self._dirty = False
+
+        self._next_id = 1
+        self._pending: Dict[str, Deque[Dict[str, Any]]] = {}
+        # 每个端点的退避状态：{"attempts": n, "next_at": monotonic}
+        self._backoff: Dict[str, Dict[str, float]] = {}
+        # 分段信息：名称 -> {"path", "bytes", "live"}，按创建顺序排列
+        self._segments: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._active_name: Optional[str] = None
+        self._active_fh = None
+        self._acks_fh = None
+        self._acks_bytes = 0
+        self._replay_times: Deque[float] = deque(maxlen=10000)
+
+        metrics.describe("outbox_backlog", "发件箱中待重试的事件数")
+        metrics.describe("outbox_disk_bytes", "发件箱分段占用的磁盘字节数")
+        metrics.describe("outbox_appended_total", "写入发件箱的事件数")
+        metrics.describe("outbox_replayed_total", "从发件箱重发成功的事件数")
+        metrics.describe("outbox_dropped_total", "因超出磁盘上限或不可重试而丢弃的事件数")
+        metrics.register_collector(self._collect_metrics)
+
+    # ---------------------------------------------------------------- 生命周期
+
+    def start(self, send: Callable[[Dict[str, Any]], tuple]) -> None:
+        """加载磁盘上的未确认记录并启动后台线程（重复调用无副作用）
+
+        Args:
+            send: 重发函数 send(record) -> (成功标志, 状态码或None)，
+                  record 含 base_url / endpoint / body
+        """
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            self._send = send
+            os.makedirs(self.directory, exist_ok=True)
+            self._load()
+        threading.Thread(target=self._retry_loop, name="outbox-retrier", daemon=True).start()
+        threading.Thread(target=self._sync_loop, name="outbox-fsync", daemon=True).start()
+        backlog = self.backlog()
+        if backlog:
+            logger.info(f"📮 发件箱已加载 {backlog} 条待重发事件")
+
+    @property
+    def started(self) -> bool:
+        """是否已启动"""
+        return self._started
+
+    def stop(self) -> None:
+        """停止后台线程，把缓冲写入磁盘并关闭文件（重复调用无副作用）"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            self._sync()
+            for fh in (self._active_fh, self._acks_fh):
+                if fh is not None:
+                    fh.close()
+            self._active_fh = None
+            self._active_name = None
+            self._acks_fh = None
+
+    # ---------------------------------------------------------------- 写入
+
+    def append(self, base_url: str, endpoint: str, body: Any) -> bool:
+        """写入一条发送失败的事件
+
+        Returns:
+            bool: 是否写入成功
+        """
+        with self._cond:
+            if not self._started or self._stopped:
+                return False
+            record = {
+                "id": self._next_id,
+                "ts": time.time(),
+                "base_url": base_url,
+                "endpoint": endpoint,
+                "body": body,
+            }
+            try:
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                self._ensure_segment(len(line))
+                self._active_fh.write(line)
+                self._active_fh.flush()
+            except (OSError, TypeError, ValueError) as e:
+                logger.error(f"❌ 写入发件箱失败: {e}")
+                return False
+            self._next_id += 1
+            segment = self._segments[self._active_name]
+            segment["bytes"] += len(line)
+            segment["live"] += 1
+            record["segment"] = self._active_name
+            self._pending.setdefault(endpoint, deque()).append(record)
+            self._dirty = True
+            self._enforce_disk_limit()
+            self._cond.notify_all()
+        metrics.inc("outbox_appended_total", endpoint=endpoint)
+        return True
+
+    # ---------------------------------------------------------------- 查询
+
+    def backlog(self, endpoint: Optional[str] = None) -> int:
+        """待重发的事件数"""
+        with self._cond:
+            if endpoint is not None:
+                return len(self._pending.get(endpoint, ()))
+            return sum(len(q) for q in self._pending.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """返回发件箱统计：积压量、磁盘占用、最近一分钟的重发速率"""
+        now = time.monotonic()
+        with self._cond:
+            recent = sum(1 for t in self._replay_times if now - t <= 60)
+            return {
+                "backlog": {ep: len(q) for ep, q in self._pending.items() if q},
+                "disk_bytes": self._disk_bytes(),
+                "segments": len(self._segments),
+                "replay_per_sec": recent / 60.0,
+            }
+
+    # ---------------------------------------------------------------- 内部实现
+
+    def _disk_bytes(self) -> int:
+        return sum(s["bytes"] for s in self._segments.values()) + self._acks_bytes
+
+    def _collect_metrics(self) -> None:
+        with self._cond:
+            for endpoint, queue in self._pending.items():
+                metrics.set_gauge("outbox_backlog", len(queue), endpoint=endpoint)
+            metrics.set_gauge("outbox_disk_bytes", self._disk_bytes())
+
+    def _load(self) -> None:
+        """启动时重建内存索引：读取所有分段，剔除已确认的记录"""
+        acked = set()
+        acks_path = os.path.join(self.directory, ACKS_FILE)
+        if os.path.exists(acks_path):
+            with open(acks_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.isdigit():
+                        acked.add(int(line))
+            self._acks_bytes = os.path.getsize(acks_path)
+        # 已确认的ID可能比现存分段中的都大（分段已删除而 acks.log 未压缩），新ID不能与之重复
+        self._next_id = max(acked, default=0) + 1
+
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            live = 0
+            with open(path, "rb") as f:
+                for raw in f:
+                    try:
+                        record = json.loads(raw.decode("utf-8"))
+                    except (UnicodeDecodeError, ValueError):
+                        # 崩溃时写了一半的尾行，忽略
+                        continue
+                    self._next_id = max(self._next_id, int(record.get("id", 0)) + 1)
+                    if record.get("id") in acked:
+                        continue
+                    record["segment"] = name
+                    self._pending.setdefault(record.get("endpoint", ""), deque()).append(record)
+                    live += 1
+            self._segments[name] = {"path": path, "bytes": os.path.getsize(path), "live": live}
+            if live == 0:
+                self._delete_segment(name)
+
+        if not self._segments:
+            # 没有未确认的记录，acks.log 中的ID都已无用，清空后从头编号也不会冲突
+            self._acks_fh = open(acks_path, "wb")
+            self._acks_bytes = 0
+            return
+        self._acks_fh = open(acks_path, "ab")
+        self._compact_acks()
+
+    def _ensure_segment(self, incoming: int) -> None:
+        """确保有可写的活动分段，超过大小上限时滚动"""
+        if self._active_fh is not None:
+            if self._segments[self._active_name]["bytes"] + incoming <= self.segment_bytes:
+                return
+            self._active_fh.flush()
+            os.fsync(self._active_fh.fileno())
+            self._active_fh.close()
+            previous = self._active_name
+            self._active_fh = None
+            self._active_name = None
+            if self._segments[previous]["live"] == 0:
+                self._delete_segment(previous)
+        name = f"{self._next_id:012d}{SEGMENT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        self._active_fh = open(path, "ab")
+        self._active_name = name
+        self._segments[name] = {"path": path, "bytes": 0, "live": 0}
+
+    def _ack(self, record: Dict[str, Any]) -> None:
+        """确认一条记录（需持有锁）"""
+        self._acks_fh.write(f"{record['id']}\n".encode("ascii"))
+        self._acks_bytes += len(str(record["id"])) + 1
+        self._dirty = True
+        name = record.get("segment")
+        segment = self._segments.get(name)
+        if segment is None:
+            return
+        segment["live"] -= 1
+        if segment["live"] <= 0 and name != self._active_name:
+            self._delete_segment(name)
+            self._compact_acks()
+
+    def _delete_segment(self, name: str) -> None:
+        segment = self._segments.pop(name, None)
+        if segment:
+            try:
+                os.remove(segment["path"])
+            except OSError as e:
+                logger.warning(f"⚠️ 删除发件箱分段失败 {name}: {e}")
+
+    def _compact_acks(self) -> None:
+        """压缩 acks.log：只保留仍存在的分段中的记录ID"""
+        if self._acks_bytes < 64 * 1024:
+            return
+        live_min_id = min((int(n[:-len(SEGMENT_SUFFIX)]) for n in self._segments), default=self._next_id)
+        acks_path = os.path.join(self.directory, ACKS_FILE)
+        self._acks_fh.flush()
+        with open(acks_path, "r", encoding="utf-8") as f:
+            kept = [line for line in f if line.strip().isdigit() and int(line) >= live_min_id]
+        tmp_path = acks_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        self._acks_fh.close()
+        os.replace(tmp_path, acks_path)
+        self._acks_fh = open(acks_path, "ab")
+        self._acks_bytes = os.path.getsize(acks_path)
+
+    def _enforce_disk_limit(self) -> None:
+        """超过磁盘上限时丢弃最旧的分段（需持有锁）"""
+        while self._disk_bytes() > self.max_bytes and len(self._segments) > 1:
+            oldest = next(iter(self._segments))
+            if oldest == self._active_name:
+                break
+            dropped = 0
+            for endpoint, queue in self._pending.items():
+                kept = deque(r for r in queue if r.get("segment") != oldest)
+                dropped += len(queue) - len(kept)
+                self._pending[endpoint] = kept
+            self._delete_segment(oldest)
+            metrics.inc("outbox_dropped_total", dropped, reason="disk_limit")
+            logger.error(f"❌ 发件箱超出磁盘上限 {self.max_bytes} 字节，丢弃最旧分段 {oldest}（{dropped} 条事件）")
+
+    def _sync(self) -> None:
+        """把已写入的数据 fsync 到磁盘（需持有锁）"""
+        if not self._dirty:
+            return
+        for fh in (self._active_fh, self._acks_fh):
+            if fh is not None:
+                fh.flush()
+                os.fsync(fh.fileno())
+        self._dirty = False
+
+    def _sync_loop(self) -> None:
+        """后台线程：按固定间隔批量 fsync"""
+        with self._cond:
+            while not self._stopped:
+                self._cond.wait(self.fsync_interval or 0.2)
+                try:
+                    self._sync()
+                except OSError as e:
+                    logger.error(f"❌ 发件箱 fsync 失败: {e}")
+
+    def _next_delay(self, endpoint: str) -> float:
+        state = self._backoff.setdefault(endpoint, {"attempts": 0, "next_at": 0.0})
+        state["attempts"] += 1
+        delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** (state["attempts"] - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        state["next_at"] = time.monotonic() + delay
+        return delay
+
+    def _retry_loop(self) -> None:
+        """后台线程：每个端点按写入顺序逐条重发，失败则对该端点退避"""
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                ready = []
+                next_at = None
+                for endpoint, queue in self._pending.items():
+                    if not queue:
+                        continue
+                    due = self._backoff.get(endpoint, {}).get("next_at", 0.0)
+                    if due <= now:
+                        ready.append((endpoint, queue[0]))
+                    elif next_at is None or due < next_at:
+                        next_at = due
+                if not ready:
+                    self._cond.wait(None if next_at is None else max(0.0, next_at - now))
+                    continue
+
+            for endpoint, record in ready:
+                try:
+                    success, status_code = self._send(record)
+                except Exception as e:
+                    success, status_code = False, None
+                    logger.error(f"❌ 发件箱重发出错: {e}")
+                permanent = status_code is not None and 400 <= status_code < 500 and status_code != 429
+                with self._cond:
+                    if self._stopped:
+                        # 文件已关闭，不再确认；下次启动时重发（至少一次）
+                        return
+                    queue = self._pending.get(endpoint)
+                    if not queue or queue[0] is not record:
+                        continue
+                    if success or permanent:
+                        queue.popleft()
+                        self._ack(record)
+                        self._backoff.pop(endpoint, None)
+                        if success:
+                            self._replay_times.append(time.monotonic())
+                    else:
+                        delay = self._next_delay(endpoint)
+                        logger.warning(f"⚠️ 发件箱重发 /{endpoint} 失败，{delay:.1f} 秒后重试（积压 {len(queue)} 条）")
+                if success:
+                    metrics.inc("outbox_replayed_total", endpoint=endpoint)
+                elif permanent:
+                    metrics.inc("outbox_dropped_total", reason="rejected")
+                    logger.error(f"❌ 发件箱事件被后端拒绝 /{endpoint}，状态码 {status_code}，已丢弃")
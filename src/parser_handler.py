@@ -1,4 +1,7 @@
 import json
+import os
+import atexit
+import time
 import zlib
 import brotli
 import requests
@@ -22,8 +25,110 @@ from .config import (
     PK_END_CHECK_TIME,
     PK_OPPONENT_VOTES_THRESHOLD,
     GUARD_MODE_KEYWORDS,
-    GUARD_MODE_VOTE_DIFFERENCE
+    GUARD_MODE_VOTE_DIFFERENCE,
+    GUARD_MODE_SHARD_COUNT,
+    GUARD_MODE_STATE_FILE,
+    GIFT_COMBO_WINDOW,
+    GUARD_CORRELATION_WINDOW,
+    ENTRY_THROTTLE_ENABLED,
+    ENTRY_THROTTLE_COOLDOWN,
+    ENTRY_THROTTLE_TARGET_RATE,
+    ENTRY_THROTTLE_MAX_USERS,
+    ENTRY_THROTTLE_PASS_GUARD_LEVEL,
+    ENTRY_THROTTLE_ROOM_OVERRIDES,
+    DANMAKU_TRIGGER_LIMITS,
+    DANMAKU_TRIGGER_MAX_USERS,
+    USER_PROFILE_CACHE_SIZE,
+    USER_PROFILE_TTL,
+    USER_PROFILE_ATTACH,
+    GIFT_CATALOG_ENABLED,
+    GIFT_CATALOG_FILE,
+    GIFT_CATALOG_REFRESH,
+    GIFT_CATALOG_PAYLOAD,
+    GIFT_CATALOG_SYNC_ENDPOINT,
+    REVENUE_ENABLED,
+    REVENUE_SNAPSHOT_ENDPOINT,
+    REVENUE_SNAPSHOT_INTERVAL,
+    REVENUE_TOP_K,
+    REVENUE_MINUTE_BUCKETS,
+    EVENT_RING_ENABLED,
+    EVENT_RING_CAPACITY,
+    EVENT_RING_TEXT_BYTES,
+    CHATBOT_CONTEXT_MESSAGES,
+    EVENT_ARCHIVE_DIR,
+    EVENT_ARCHIVE_CMDS,
+    EVENT_ARCHIVE_COMPRESS,
+    EVENT_ARCHIVE_SQLITE,
+    EVENT_ARCHIVE_SQLITE_BATCH,
+    EVENT_ARCHIVE_SQLITE_MAX_DELAY,
+    EVENT_ARCHIVE_SQLITE_QUEUE_SIZE,
+    EVENT_ARCHIVE_SQLITE_RAW,
+    DANMAKU_INDEX_DIR,
+    DANMAKU_INDEX_FLUSH_DOCS,
+    DANMAKU_INDEX_FLUSH_INTERVAL,
+    DANMAKU_INDEX_MERGE_FACTOR,
+    API_BATCH_ENABLED,
+    API_BATCH_ENDPOINTS,
+    API_BATCH_OPT_OUT,
+    API_BATCH_MAX_ITEMS,
+    API_BATCH_MAX_DELAY_MS,
+    API_BATCH_UNWRAP_ENDPOINTS,
+    OUTBOX_ENABLED,
+    OUTBOX_DIR,
+    OUTBOX_ENDPOINTS,
+    OUTBOX_SEGMENT_BYTES,
+    OUTBOX_MAX_BYTES,
+    OUTBOX_FSYNC_INTERVAL_MS,
+    OUTBOX_RETRY_BASE_DELAY,
+    OUTBOX_RETRY_MAX_DELAY,
+    CIRCUIT_BREAKER_ENABLED,
+    CIRCUIT_BREAKER_WINDOW,
+    CIRCUIT_BREAKER_MIN_CALLS,
+    CIRCUIT_BREAKER_ERROR_RATE,
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+    CIRCUIT_BREAKER_SLOW_CALL_RATE,
+    CIRCUIT_BREAKER_OPEN_SECONDS,
+    CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+    CIRCUIT_OPEN_POLICY,
+    OUTBOUND_LANES_ENABLED,
+    OUTBOUND_LANES,
+    OUTBOUND_DEFAULT_LANE,
+    PAYLOAD_PROJECTION_ENABLED,
+    PAYLOAD_PROJECTION_DEBUG_RAW,
+    PAYLOAD_PROJECTION_RULES,
+    PAYLOAD_PROJECTION_SAMPLE_EVERY,
+    API_PAYLOAD_ENCODINGS,
+    API_GZIP_MIN_BYTES,
+    TRACING_ENABLED,
+    TRACE_SAMPLE_RATE,
+    DEDUP_ENABLED,
+    DEDUP_WINDOW,
+    DEDUP_GENERATIONS,
+    DEDUP_CAPACITY,
+    DEDUP_FALSE_POSITIVE_RATE,
+    DEDUP_EXACT_MAX_IDS
 )
+from .gift_aggregator import GiftComboAggregator
+from .entry_throttle import EntryThrottle
+from .trigger_limiter import TriggerRateLimiter
+from .user_profiles import UserProfileCache
+from .gift_catalog import GiftCatalog
+from .revenue import RevenueAggregator
+from .event_ring import EventRingBuffer, create_ring
+from .event_archive import EventRecorder, close_all as close_event_archives
+from .sqlite_archive import SqliteArchive
+from .danmaku_index import DanmakuIndex
+from .guard_correlator import GuardEventCorrelator, TOAST_FIELDS as GUARD_TOAST_FIELDS
+from .api_batcher import EndpointBatcher
+from .outbox import Outbox
+from .circuit_breaker import CircuitBreakerRegistry
+from .priority_lanes import OutboundLanes
+from .payload_projection import PayloadProjector
+from .payload_encoding import encode_body
+from .metrics import metrics
+from .tracing import Tracer, FrameTimer, ApiTrace, TRACE_HEADER, STAGE_BUCKETS
+from .profiler import timed
+from .dedup import MessageDeduplicator
 
 # 配置日志，确保在 Docker 中也能正确输出
 logging.basicConfig(
@@ -62,34 +167,263 @@ class Constants:
     GUARD_MODE_VOTE_DIFFERENCE = GUARD_MODE_VOTE_DIFFERENCE
 
 
+def _http_post(url: str, body: Union[Dict[str, Any], List[Dict[str, Any]]], encoding: Optional[Dict[str, Any]] = None,
+               extra_headers: Optional[Dict[str, str]] = None) -> tuple:
+    """发送一次 HTTP POST
+    
+    Args:
+        url: 完整请求地址
+        body: 单条事件或事件数组
+        encoding: 端点的编码配置 {"format": ..., "compress": ...}，None 表示 JSON
+        extra_headers: 附加请求头（如 X-Trace-Id）
+    
+    Returns:
+        tuple: (成功标志, 状态码或None)
+    """
+    encoding = encoding or {}
+    try:
+        data, headers = encode_body(
+            body,
+            fmt=encoding.get("format", "json"),
+            compress=encoding.get("compress"),
+            min_bytes=API_GZIP_MIN_BYTES
+        )
+        if extra_headers:
+            headers.update(extra_headers)
+        response = requests.post(url, data=data, headers=headers, timeout=Constants.DEFAULT_TIMEOUT)
+        status_code = response.status_code
+        if status_code == 200:
+            logger.info(f"✅ 请求成功发送至 {url}")
+            return True, status_code
+        else:
+            logger.error(f"❌ 请求失败，HTTP 状态码: {status_code}")
+            return False, status_code
+    except requests.RequestException as e:
+        logger.error(f"❌ 请求异常: {e}")
+        return False, None
+    except (TypeError, ValueError) as e:
+        logger.error(f"❌ 请求体编码失败: {e}")
+        return False, None
+
+
+def _sent_label(status_code: Optional[int]) -> str:
+    """post 成功时的日志前缀：有状态码表示后端已响应，否则只是已入队（批量或非等待通道）"""
+    return "✅ 已发送" if status_code else "📤 已入队"
+
+
+def _replay_outbox_record(record: Dict[str, Any]) -> tuple:
+    """发件箱重发：按记录中的 base_url/endpoint 重新发送"""
+    endpoint = record["endpoint"]
+    return _http_post(f"{record['base_url']}/{endpoint}", record["body"], API_PAYLOAD_ENCODINGS.get(endpoint))
+
+
+# 全局发件箱实例（同一进程的所有房间共用一个目录）
+outbox = Outbox(
+    OUTBOX_DIR,
+    segment_bytes=OUTBOX_SEGMENT_BYTES,
+    max_bytes=OUTBOX_MAX_BYTES,
+    fsync_interval_ms=OUTBOX_FSYNC_INTERVAL_MS,
+    retry_base_delay=OUTBOX_RETRY_BASE_DELAY,
+    retry_max_delay=OUTBOX_RETRY_MAX_DELAY
+)
+
+
+# 全局出站优先级通道（同一进程的所有房间共享工作线程与限流额度）
+outbound_lanes = OutboundLanes(OUTBOUND_LANES, OUTBOUND_DEFAULT_LANE)
+
+# 全局延迟追踪器（追踪上下文按线程保存）
+tracer = Tracer(TRACING_ENABLED, TRACE_SAMPLE_RATE)
+
+# 全局用户资料缓存（按房间+uid，所有房间共享容量）
+user_profiles = UserProfileCache(USER_PROFILE_CACHE_SIZE, USER_PROFILE_TTL, USER_PROFILE_ATTACH)
+
+# 全局礼物目录（按 gift_id，进程退出时保存）
+gift_catalog = GiftCatalog(GIFT_CATALOG_FILE, refresh=GIFT_CATALOG_REFRESH)
+atexit.register(gift_catalog.stop)
+
+# 进程退出时关闭各房间的事件归档文件
+atexit.register(close_event_archives)
+
+# 全局 SQLite 事件归档（所有房间共享一个写线程，进程退出时写完队列中的事件）
+sqlite_archive = SqliteArchive(
+    EVENT_ARCHIVE_SQLITE, batch_size=EVENT_ARCHIVE_SQLITE_BATCH, max_delay=EVENT_ARCHIVE_SQLITE_MAX_DELAY,
+    queue_size=EVENT_ARCHIVE_SQLITE_QUEUE_SIZE, store_raw=EVENT_ARCHIVE_SQLITE_RAW
+) if EVENT_ARCHIVE_SQLITE else None
+if sqlite_archive:
+    atexit.register(sqlite_archive.stop)
+
+# 全局弹幕全文索引（所有房间共享，进程退出时写出内存缓冲）
+danmaku_index = DanmakuIndex(
+    DANMAKU_INDEX_DIR, flush_docs=DANMAKU_INDEX_FLUSH_DOCS, flush_interval=DANMAKU_INDEX_FLUSH_INTERVAL,
+    merge_factor=DANMAKU_INDEX_MERGE_FACTOR
+) if DANMAKU_INDEX_DIR else None
+if danmaku_index:
+    atexit.register(danmaku_index.stop)
+
+# 处理耗时多在亚毫秒级，沿用追踪的细分桶
+HANDLER_BUCKETS = STAGE_BUCKETS
+
+metrics.describe("ws_frames_total", "收到的 WebSocket 帧数")
+metrics.describe("ws_received_bytes_total", "收到的 WebSocket 帧字节数（压缩后）")
+metrics.describe("ws_decompressed_bytes_total", "解压后的字节数")
+metrics.describe("ws_decompress_seconds", "每个压缩包的解压耗时")
+metrics.describe("ws_json_decode_seconds", "每条业务消息的 JSON 解码耗时")
+metrics.describe("ws_messages_total", "收到的业务消息数（按 cmd）")
+metrics.describe("handler_seconds", "消息处理器耗时（按处理器类）")
+metrics.describe("api_requests_total", "发出的 API 请求数（按端点和状态码）")
+metrics.describe("api_request_seconds", "API 请求耗时（按端点）")
+metrics.describe("live_popularity", "心跳回复(op=3)中的人气值")
+metrics.describe("ws_heartbeat_ack_age_seconds", "距上次收到心跳回复(op=3)的秒数")
+metrics.describe("gift_combo_pending", "礼物连击合并窗口中待发送的礼物数")
+metrics.describe("api_batch_pending", "批量发送队列中待发送的事件数")
+
+
 # API 客户端
 class APIClient:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, batch_enabled: bool = API_BATCH_ENABLED, outbox_enabled: bool = OUTBOX_ENABLED,
+                 breaker_enabled: bool = CIRCUIT_BREAKER_ENABLED, lanes_enabled: bool = OUTBOUND_LANES_ENABLED,
+                 debug_raw: bool = PAYLOAD_PROJECTION_DEBUG_RAW):
         self.base_url = base_url
+        
+        # 请求体投影：发送前按端点规则去掉后端用不到的字段（如 raw_message）
+        self.projector: Optional[PayloadProjector] = None
+        if PAYLOAD_PROJECTION_ENABLED:
+            self.projector = PayloadProjector(
+                PAYLOAD_PROJECTION_RULES,
+                debug_raw=debug_raw,
+                sample_every=PAYLOAD_PROJECTION_SAMPLE_EVERY
+            )
+        
+        # 优先级通道：按端点分流到独立的队列与工作线程
+        self.lanes: Optional[OutboundLanes] = outbound_lanes if lanes_enabled else None
+        if self.lanes:
+            self.lanes.start()
+        
+        # 熔断器：每个端点独立，熔断期间按 CIRCUIT_OPEN_POLICY 写入发件箱或丢弃
+        self.breakers: Optional[CircuitBreakerRegistry] = None
+        self.open_policy: Dict[str, str] = {}
+        if breaker_enabled:
+            self.breakers = CircuitBreakerRegistry(
+                window=CIRCUIT_BREAKER_WINDOW,
+                min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+                error_rate=CIRCUIT_BREAKER_ERROR_RATE,
+                slow_call_seconds=CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+                slow_call_rate=CIRCUIT_BREAKER_SLOW_CALL_RATE,
+                open_seconds=CIRCUIT_BREAKER_OPEN_SECONDS,
+                half_open_calls=CIRCUIT_BREAKER_HALF_OPEN_CALLS
+            )
+            self.open_policy = dict(CIRCUIT_OPEN_POLICY)
+        
+        # 发件箱：可重试的失败请求写入磁盘，由后台线程重发
+        self.outbox_endpoints = set(OUTBOX_ENDPOINTS) if outbox_enabled else set()
+        if self.outbox_endpoints or "spool" in self.open_policy.values():
+            outbox.start(_replay_outbox_record)
+        
+        # 批量模式：参与批量的端点先攒批，再以数组形式一次发送
+        self.batcher: Optional[EndpointBatcher] = None
+        self.batch_endpoints = set(API_BATCH_ENDPOINTS) - set(API_BATCH_OPT_OUT)
+        if batch_enabled:
+            self.batcher = EndpointBatcher(
+                self._dispatch,
+                max_items=API_BATCH_MAX_ITEMS,
+                max_delay_ms=API_BATCH_MAX_DELAY_MS,
+                unwrap_endpoints=API_BATCH_UNWRAP_ENDPOINTS
+            )
+            logger.info(f"📦 API批量模式已启用，批量端点: {', '.join(sorted(self.batch_endpoints))}")
+            metrics.register_collector(
+                lambda: metrics.set_gauge("api_batch_pending", self.batcher.stats()["pending"], base_url=self.base_url)
+            )
+
+        if self.batcher or outbox.started or self.lanes:
+            atexit.register(self.close)
 
     def post(self, endpoint: str, payload: Dict[str, Any]) -> tuple:
         """发送 POST 请求到指定端点
         
+        批量模式下，参与批量的端点只做入队并立即返回 (True, None)；
+        非等待型通道同样入队即返回 (True, None)，此时并不代表后端已收到
+        
         Returns:
             tuple: (成功标志, 状态码或None)
         """
-        url = f"{self.base_url}/{endpoint}"
-        try:
-            response = requests.post(url, json=payload, timeout=Constants.DEFAULT_TIMEOUT)
-            status_code = response.status_code
-            if status_code == 200:
-                logger.info(f"✅ 请求成功发送至 {url}")
-                return True, status_code
-            else:
-                logger.error(f"❌ 请求失败，HTTP 状态码: {status_code}")
-                return False, status_code
-        except requests.RequestException as e:
-            logger.error(f"❌ 请求异常: {e}")
-            return False, None
+        if self.projector:
+            payload = self.projector.project(endpoint, payload)
+        trace = tracer.enqueued(endpoint)
+        if self.batcher and endpoint in self.batch_endpoints:
+            self.batcher.add(endpoint, payload)
+            return True, None
+        return self._dispatch(endpoint, payload, trace)
+
+    def _dispatch(self, endpoint: str, body: Union[Dict[str, Any], List[Dict[str, Any]]],
+                  trace: Optional[ApiTrace] = None) -> tuple:
+        """经由优先级通道发送；未启用通道时在当前线程直接发送"""
+        if not self.lanes:
+            return self._send(endpoint, body, trace)
+        return self.lanes.submit(endpoint, self._send, endpoint, body, trace,
+                                 on_full=lambda: self._shed(endpoint, body, reason="lane_full"))
+
+    def close(self) -> None:
+        """发送所有待发的批次，等待通道中已入队的请求发完，并把发件箱缓冲写入磁盘"""
+        if self.batcher:
+            self.batcher.stop()
+        if self.lanes:
+            self.lanes.drain()
+        if outbox.started:
+            outbox.stop()
+
+    def _send(self, endpoint: str, body: Union[Dict[str, Any], List[Dict[str, Any]]],
+              trace: Optional[ApiTrace] = None) -> tuple:
+        """实际发送 HTTP 请求，body 为单条事件或事件数组
+        
+        端点熔断时不发请求，按策略写入发件箱或丢弃；
+        可重试的失败（网络异常、5xx、429）会写入发件箱等待重发；
+        trace 为这次请求的追踪上下文，抽样命中时附带 X-Trace-Id
+        """
+        breaker = self.breakers.get(endpoint) if self.breakers else None
+        if breaker and not breaker.allow():
+            return self._shed(endpoint, body)
+        
+        start = time.monotonic()
+        extra_headers = {TRACE_HEADER: trace.trace_id} if trace is not None and trace.trace_id else None
+        success, status_code = _http_post(f"{self.base_url}/{endpoint}", body, API_PAYLOAD_ENCODINGS.get(endpoint),
+                                          extra_headers)
+        elapsed = time.monotonic() - start
+        tracer.responded(trace, endpoint, success)
+        metrics.inc("api_requests_total", endpoint=endpoint, status=status_code or "error")
+        metrics.observe("api_request_seconds", elapsed, endpoint=endpoint)
+        retryable = not success and self._is_retryable(status_code)
+        if breaker:
+            breaker.record(not retryable, elapsed)
+        if retryable and endpoint in self.outbox_endpoints:
+            if outbox.append(self.base_url, endpoint, body):
+                logger.warning(f"📮 /{endpoint} 发送失败，已写入发件箱等待重发")
+        return success, status_code
+
+    def _shed(self, endpoint: str, body: Union[Dict[str, Any], List[Dict[str, Any]]], reason: str = "circuit_open") -> tuple:
+        """降载处理（熔断中或通道队列已满）：按端点策略写入发件箱或直接丢弃"""
+        policy = self.open_policy.get(endpoint, "spool" if endpoint in self.outbox_endpoints else "drop")
+        if policy == "spool" and outbox.append(self.base_url, endpoint, body):
+            logger.debug(f"⚡ /{endpoint} 降载({reason})，事件已写入发件箱")
+        else:
+            policy = "drop"
+            logger.debug(f"⚡ /{endpoint} 降载({reason})，事件已丢弃")
+        metrics.inc("api_shed_total", endpoint=endpoint, policy=policy, reason=reason)
+        return False, None
+
+    @staticmethod
+    def _is_retryable(status_code: Optional[int]) -> bool:
+        """网络异常、服务端错误和限流可以重试；其他 4xx 说明请求本身有问题"""
+        return status_code is None or status_code >= 500 or status_code == 429
 
 
 # 事件处理器基类
 class EventHandler(ABC):
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        """子类的 handle 自动加上热点计时（计时开关关闭时几乎无开销）"""
+        super().__init_subclass__(**kwargs)
+        if "handle" in cls.__dict__:
+            cls.handle = timed(f"{cls.__name__}.handle")(cls.__dict__["handle"])
+    
     @abstractmethod
     def handle(self, message: Dict[str, Any]) -> None:
         """处理事件消息"""
@@ -264,52 +598,128 @@ class PKDataCollector:
 class GuardModeManager:
     """保卫模式管理器
     
-    负责管理保卫模式的激活状态和相关逻辑
+    按房间管理保卫模式的激活状态。状态按 room_id 散列到多个分片，每个分片一把锁，
+    多个房间共用一个进程时互不影响，也不会争抢同一把锁。
+    状态可以导出快照并恢复，PK 进行中重启进程不会丢失已激活的保卫模式。
     """
     
-    def __init__(self):
-        self.is_active = False
-        self.activated_keyword = None
-        self.lock = threading.Lock()
+    def __init__(self, shard_count: int = GUARD_MODE_SHARD_COUNT, state_file: Optional[str] = GUARD_MODE_STATE_FILE):
+        self._shards = [({}, threading.Lock()) for _ in range(max(1, int(shard_count)))]
+        self.state_file = state_file
+        self._save_lock = threading.Lock()
+        self._loaded = False
+    
+    def _shard(self, room_id: int) -> tuple:
+        """获取房间对应的分片 (状态字典, 锁)"""
+        return self._shards[hash(int(room_id)) % len(self._shards)]
     
-    def activate(self, keyword: str) -> bool:
+    def activate(self, room_id: int, keyword: str) -> bool:
         """激活保卫模式
         
         Args:
+            room_id: 房间ID
             keyword: 激活保卫模式的关键词
             
         Returns:
             bool: 是否成功激活
         """
-        with self.lock:
-            if not self.is_active:
-                self.is_active = True
-                self.activated_keyword = keyword
-                logger.info(f"🛡️ 保卫模式已激活，触发关键词：'{keyword}'")
-                return True
-            else:
-                logger.info(f"⚠️ 保卫模式已经处于激活状态，忽略关键词：'{keyword}'")
+        states, lock = self._shard(room_id)
+        with lock:
+            if room_id in states:
+                logger.info(f"⚠️ 房间 {room_id} 保卫模式已经处于激活状态，忽略关键词：'{keyword}'")
                 return False
+            states[room_id] = {"keyword": keyword, "activated_at": time.time()}
+        logger.info(f"🛡️ 房间 {room_id} 保卫模式已激活，触发关键词：'{keyword}'")
+        self.save_state()
+        return True
     
-    def deactivate(self) -> None:
+    def deactivate(self, room_id: int) -> None:
         """关闭保卫模式"""
-        with self.lock:
-            if self.is_active:
-                logger.info(f"🛡️ 保卫模式已关闭，之前的触发关键词：'{self.activated_keyword}'")
-                self.is_active = False
-                self.activated_keyword = None
-            else:
-                logger.debug("保卫模式本来就是关闭状态")
+        states, lock = self._shard(room_id)
+        with lock:
+            state = states.pop(room_id, None)
+        if state:
+            logger.info(f"🛡️ 房间 {room_id} 保卫模式已关闭，之前的触发关键词：'{state['keyword']}'")
+            self.save_state()
+        else:
+            logger.debug(f"房间 {room_id} 保卫模式本来就是关闭状态")
     
-    def is_guard_mode_active(self) -> bool:
+    def is_guard_mode_active(self, room_id: int) -> bool:
         """检查保卫模式是否激活"""
-        with self.lock:
-            return self.is_active
+        states, lock = self._shard(room_id)
+        with lock:
+            return room_id in states
     
-    def get_activated_keyword(self) -> Optional[str]:
+    def get_activated_keyword(self, room_id: int) -> Optional[str]:
         """获取激活保卫模式的关键词"""
-        with self.lock:
-            return self.activated_keyword
+        states, lock = self._shard(room_id)
+        with lock:
+            state = states.get(room_id)
+            return state["keyword"] if state else None
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """导出所有房间的保卫模式状态快照
+        
+        Returns:
+            Dict: {room_id字符串: {"keyword": 关键词, "activated_at": 激活时间戳}}
+        """
+        result: Dict[str, Dict[str, Any]] = {}
+        for states, lock in self._shards:
+            with lock:
+                for room_id, state in states.items():
+                    result[str(room_id)] = dict(state)
+        return result
+    
+    def restore(self, snapshot: Dict[str, Dict[str, Any]]) -> int:
+        """从快照恢复保卫模式状态，已有的房间状态会被覆盖
+        
+        Returns:
+            int: 恢复的房间数量
+        """
+        restored = 0
+        for room_key, state in (snapshot or {}).items():
+            try:
+                room_id = int(room_key)
+                keyword = state["keyword"]
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"⚠️ 忽略无效的保卫模式快照条目: {room_key}={state}")
+                continue
+            states, lock = self._shard(room_id)
+            with lock:
+                states[room_id] = {"keyword": keyword, "activated_at": state.get("activated_at", time.time())}
+            restored += 1
+        return restored
+    
+    def save_state(self) -> None:
+        """将快照写入状态文件（先写临时文件再替换，避免写到一半损坏）"""
+        if not self.state_file:
+            return
+        with self._save_lock:
+            try:
+                tmp_path = f"{self.state_file}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.state_file)
+            except OSError as e:
+                logger.error(f"❌ 保存保卫模式状态失败: {e}")
+    
+    def load_state(self) -> None:
+        """从状态文件恢复保卫模式（每个进程只加载一次）"""
+        with self._save_lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.state_file or not os.path.exists(self.state_file):
+                return
+            try:
+                with open(self.state_file, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ 读取保卫模式状态失败: {e}")
+                return
+        restored = self.restore(snapshot)
+        if restored:
+            logger.info(f"🛡️ 已从 {self.state_file} 恢复 {restored} 个房间的保卫模式状态")
 
 
 # 全局保卫模式管理器实例
@@ -318,12 +728,14 @@ guard_mode_manager = GuardModeManager()
 
 # PK 战斗处理器
 class PKBattleHandler(EventHandler):
-    def __init__(self, room_id: int, api_client: APIClient, battle_type: int):
+    def __init__(self, room_id: int, api_client: APIClient, battle_type: int, on_deadline: Optional[Callable[[], None]] = None):
         self.room_id = room_id
         self.api_client = api_client
         self.battle_type = self._normalize_battle_type(battle_type)
         self.data_collector = PKDataCollector(room_id)
         self.pk_triggered = False
+        # PK 截止检查前的回调（如刷新尚在合并窗口中的礼物记录）
+        self.on_deadline = on_deadline
         
         # 初始化定时器
         self.delayed_check_timer = threading.Timer(Constants.PK_DELAYED_CHECK_TIME, self.delayed_check)
@@ -356,6 +768,7 @@ class PKBattleHandler(EventHandler):
     def delayed_check(self) -> None:
         """根据 PK 类型和票数触发绝杀计时器"""
         logger.info("⏱️ 绝杀 PK 定时器触发")
+        self._run_deadline_hook()
         
         if self.pk_triggered:
             logger.info("❌ PK 已经被触发过，跳过检查")
@@ -379,6 +792,7 @@ class PKBattleHandler(EventHandler):
     def end_check(self) -> None:
         """结束计时器逻辑"""
         logger.info("⏱️ 结束计时器触发")
+        self._run_deadline_hook()
         
         if self.pk_triggered:
             logger.info("❌ PK 已经被触发过，跳过结束检查")
@@ -390,8 +804,8 @@ class PKBattleHandler(EventHandler):
             logger.info(f"🔍 结束检查 battle_type={self.battle_type}: 己方votes={self_votes}, 对方votes={opponent_votes}")
             
             # 检查保卫模式是否激活
-            if guard_mode_manager.is_guard_mode_active():
-                activated_keyword = guard_mode_manager.get_activated_keyword()
+            if guard_mode_manager.is_guard_mode_active(self.room_id):
+                activated_keyword = guard_mode_manager.get_activated_keyword(self.room_id)
                 target_votes = opponent_votes + Constants.GUARD_MODE_VOTE_DIFFERENCE
                 
                 logger.info(f"🛡️ 保卫模式激活中，触发关键词：'{activated_keyword}'")
@@ -409,6 +823,14 @@ class PKBattleHandler(EventHandler):
         except Exception as e:
             logger.error(f"❌ 结束检查出错: {e}")
     
+    def _run_deadline_hook(self) -> None:
+        """执行 PK 截止检查前的回调"""
+        if callable(self.on_deadline):
+            try:
+                self.on_deadline()
+            except Exception as e:
+                logger.error(f"❌ PK截止回调出错: {e}")
+    
     def cancel_end_timer(self) -> None:
         """取消结束计时器"""
         if self.end_timer:
@@ -423,7 +845,7 @@ class PKBattleHandler(EventHandler):
             self.end_timer.cancel()
         
         # PK结束时关闭保卫模式
-        guard_mode_manager.deactivate()
+        guard_mode_manager.deactivate(self.room_id)
         
         logger.info("🛑 停止计时器并销毁 PKBattleHandler 实例")
     
@@ -468,15 +890,24 @@ class PKBattleHandler(EventHandler):
 
 # 弹幕处理器
 class DanmakuHandler(EventHandler):
-    def __init__(self, room_id: int, api_client: APIClient):
+    def __init__(self, room_id: int, api_client: APIClient, limiter: Optional[TriggerRateLimiter] = None,
+                 history: Optional[EventRingBuffer] = None):
         self.room_id = room_id
         self.api_client = api_client
+        # 按用户/房间限制 chatbot、sendlike、setting 的触发频率
+        self.limiter = limiter
+        # 本房间最近事件（为 chatbot 提供上下文）
+        self.history = history
+    
+    def _allow(self, trigger: str, uid: Any) -> bool:
+        return self.limiter is None or self.limiter.allow(trigger, uid)
     
     def handle(self, message: Dict[str, Any]) -> None:
         """处理弹幕消息"""
         info = message.get("info", [])
         if len(info) > 2:
             comment = info[1]
+            uid = info[2][0] if info[2] else None
             username = info[2][1]
             
             # 使用 print 确保弹幕立即输出，同时保留日志
@@ -499,20 +930,21 @@ class DanmakuHandler(EventHandler):
                 modified_comment = comment
                 
                 # 检查是否是豆豆+点赞组合，如果是则先处理sendlike
-                if "豆豆" in comment and "点赞" in comment:
+                if "豆豆" in comment and "点赞" in comment and self._allow("sendlike", uid):
                     error_msg = self._sendlike_detection(comment, message)
                     if error_msg:
                         # 如果有错误信息，则将其附加到原始消息后
                         modified_comment = f"{comment} {error_msg}"
                 
                 # 然后再处理chatbot
-                self._chatbot_detection(modified_comment, message)
+                if self._allow("chatbot", uid):
+                    self._chatbot_detection(modified_comment, message)
                 
                 # 保卫模式检测（需要先激活豆豆）
                 self._guard_mode_detection(comment, message)
             
             # 机器人指令检测
-            if Constants.ROBOT_KEYWORD in comment:
+            if Constants.ROBOT_KEYWORD in comment and self._allow("setting", uid):
                 self._send_to_setting(comment, message)
     
     def _keyword_detection(self, danmaku: str, raw_message: Dict[str, Any]) -> None:
@@ -523,9 +955,9 @@ class DanmakuHandler(EventHandler):
                 "danmaku": danmaku,
                 "raw_message": raw_message
             }
-            success, _ = self.api_client.post("ticket", payload)
+            success, status_code = self.api_client.post("ticket", payload)
             if success:
-                logger.info(f"✅ 关键字检测成功：'{danmaku}' 已发送至 ticket 接口")
+                logger.info(f"{_sent_label(status_code)} 关键字弹幕至 ticket 接口：'{danmaku}'")
     
     def _chatbot_detection(self, danmaku: str, raw_message: Dict[str, Any]) -> None:
         """检测弹幕内容是否包含chatbot关键词并发送到 chatbot 接口"""
@@ -624,25 +1056,18 @@ class DanmakuHandler(EventHandler):
                     except Exception:
                         pass
 
-                # 解析 user.base/wealth/guard 等
+                # 解析 user.base/wealth/guard 等（经用户资料缓存，同一用户不重复遍历）
                 user_block = header_obj.get("user")
                 if isinstance(user_block, dict):
-                    base = user_block.get("base") or {}
-                    if isinstance(base, dict):
-                        face_url = base.get("face") or face_url
-                        name_color = base.get("name_color_str") or base.get("name_color") or name_color
-                        official = base.get("official_info") or {}
-                        if isinstance(official, dict):
-                            official_role = official.get("role")
-                            official_title = official.get("title")
-                    wealth = user_block.get("wealth")
-                    if isinstance(wealth, dict):
-                        wealth_level = wealth.get("level", wealth_level)
-                    guard = user_block.get("guard")
-                    if isinstance(guard, dict):
-                        guard_level = guard.get("level", guard_level)
+                    profile = user_profiles.lookup(self.room_id, uid, user_block)
+                    face_url = profile.get("face") or face_url
+                    name_color = profile.get("name_color") or name_color
+                    official_role = profile.get("official_role")
+                    official_title = profile.get("official_title")
+                    wealth_level = profile.get("wealth_level", wealth_level)
+                    guard_level = profile.get("guard_level", guard_level)
                     # 是否舰长：guard_level==3 可视为舰长
-                    is_captain = (guard_level == 3) or bool(user_block.get("guard_leader", {}).get("is_guard_leader"))
+                    is_captain = (guard_level == 3) or bool(profile.get("is_guard_leader"))
 
             # 从尾部的 dict 提取 ts（时间戳）
             if isinstance(info, list):
@@ -672,6 +1097,7 @@ class DanmakuHandler(EventHandler):
         if official_title:
             sender_payload["official_title"] = official_title
         sender_payload["is_captain"] = bool(is_captain)
+        user_profiles.attach(self.room_id, uid, sender_payload)
 
         meta_payload: Dict[str, Any] = {}
         if ts is not None:
@@ -680,6 +1106,11 @@ class DanmakuHandler(EventHandler):
             meta_payload["message_id"] = message_id
         if triggered_keywords:
             meta_payload["triggered_keywords"] = triggered_keywords
+        # 最近的弹幕作为上下文（当前弹幕已写入缓冲，去掉最后一条）
+        if self.history is not None and CHATBOT_CONTEXT_MESSAGES > 0:
+            context = self.history.recent(CHATBOT_CONTEXT_MESSAGES + 1, cmd="DANMU_MSG")[:-1]
+            if context:
+                meta_payload["context"] = [{"uid": row["uid"], "text": row["text"]} for row in context]
 
         chatbot_payload: Dict[str, Any] = {
             "room_id": str(self.room_id),
@@ -732,15 +1163,15 @@ class DanmakuHandler(EventHandler):
             "danmaku": danmaku,
             "raw_message": raw_message
         }
-        success, _ = self.api_client.post("setting", payload)
+        success, status_code = self.api_client.post("setting", payload)
         if success:
-            logger.info(f"✅ 记仇机器人指令：'{danmaku}' 已发送")
+            logger.info(f"{_sent_label(status_code)} 记仇机器人指令：'{danmaku}'")
     
     def _guard_mode_detection(self, danmaku: str, raw_message: Dict[str, Any]) -> None:
         """检测弹幕内容是否包含保卫模式关键词并激活保卫模式"""
         for keyword in Constants.GUARD_MODE_KEYWORDS:
             if keyword in danmaku:
-                success = guard_mode_manager.activate(keyword)
+                success = guard_mode_manager.activate(self.room_id, keyword)
                 if success:
                     logger.info(f"🛡️ 保卫模式已激活，触发关键词：'{keyword}'，完整消息：'{danmaku}'")
                     
@@ -765,9 +1196,17 @@ class DanmakuHandler(EventHandler):
 
 # 礼物处理器
 class GiftHandler(EventHandler):
-    def __init__(self, room_id: int, api_client: APIClient):
+    # GIFT_CATALOG_PAYLOAD 为 "id" 时从 /money 请求体中去掉的静态字段
+    CATALOG_FIELDS = ("gift_type", "gift_assets", "tag_image", "combo_resources_id")
+    
+    def __init__(self, room_id: int, api_client: APIClient, combo_window: float = 0,
+                 revenue: Optional[RevenueAggregator] = None):
         self.room_id = room_id
         self.api_client = api_client
+        # 流水增量聚合（按单条礼物累加，不受连击合并影响）
+        self.revenue = revenue
+        # 连击合并：窗口大于0时同一连击的礼物先聚合再发送
+        self.aggregator = GiftComboAggregator(self.post_money, window=combo_window) if combo_window > 0 else None
     
     def handle(self, message: Dict[str, Any]) -> None:
         """处理礼物消息"""
@@ -792,6 +1231,11 @@ class GiftHandler(EventHandler):
             # 打印礼物信息，包含数量
             logger.info(f"🎁 礼物: [{uname}] 赠送 [{gift_name}] x{gift_num}, 价值: {price * gift_num}")
             
+            # 礼物的静态字段（名称、图标、动画资源）从礼物目录复用
+            catalog_entry, catalog_changed = gift_catalog.learn(data) if GIFT_CATALOG_ENABLED else (None, False)
+            if catalog_changed and GIFT_CATALOG_SYNC_ENDPOINT:
+                self.api_client.post(GIFT_CATALOG_SYNC_ENDPOINT, {"room_id": self.room_id, "gifts": [catalog_entry]})
+            
             # 发送到 /money 接口，扩展更多有效字段
             total_price = (price or 0) * (gift_num or 1)
             payload = {
@@ -854,42 +1298,21 @@ class GiftHandler(EventHandler):
             sender_payload: Dict[str, Any] = {}
             sender_uinfo = data.get("sender_uinfo") if isinstance(data, dict) else None
             if isinstance(sender_uinfo, dict):
-                base = sender_uinfo.get("base") or {}
-                if isinstance(base, dict):
-                    face_url = base.get("face")
-                    name_color = base.get("name_color_str") or base.get("name_color")
-                    if face_url:
-                        sender_payload["face"] = face_url
-                    if name_color:
-                        sender_payload["name_color"] = name_color
-                # 财富等级
-                wealth = sender_uinfo.get("wealth")
-                if isinstance(wealth, dict) and "level" in wealth:
-                    sender_payload["wealth_level"] = wealth.get("level")
-                # 守护等级
-                guard = sender_uinfo.get("guard")
-                if isinstance(guard, dict) and "level" in guard:
-                    sender_payload["guard_level"] = guard.get("level")
-                # 勋章
-                medal = sender_uinfo.get("medal")
-                if isinstance(medal, dict):
-                    sender_payload["medal"] = {
-                        "name": medal.get("name"),
-                        "level": medal.get("level"),
-                        "is_light": medal.get("is_light"),
-                        "ruid": medal.get("ruid"),
-                        "guard_level": medal.get("guard_level"),
-                        "color": medal.get("color"),
-                        "color_start": medal.get("color_start"),
-                        "color_end": medal.get("color_end"),
-                        "color_border": medal.get("color_border")
-                    }
+                # 头像、名称色、财富等级、守护等级、勋章（经用户资料缓存）
+                profile = user_profiles.lookup(self.room_id, uid, sender_uinfo)
+                for key in ("face", "name_color"):
+                    if profile.get(key):
+                        sender_payload[key] = profile[key]
+                for key in ("wealth_level", "guard_level", "medal"):
+                    if key in profile:
+                        sender_payload[key] = profile[key]
             # 顶层 wealth_level/guard_level（有些事件会直接给出）
             if isinstance(data.get("wealth_level"), int) and "wealth_level" not in sender_payload:
                 sender_payload["wealth_level"] = data.get("wealth_level")
             if isinstance(data.get("guard_level"), int) and "guard_level" not in sender_payload:
                 sender_payload["guard_level"] = data.get("guard_level")
             if sender_payload:
+                user_profiles.attach(self.room_id, uid, sender_payload)
                 payload["sender"] = sender_payload
 
             # 接收者信息（被赠送方）
@@ -939,7 +1362,10 @@ class GiftHandler(EventHandler):
 
             # 礼物动画与图标等可视资源
             gift_info = data.get("gift_info")
-            if isinstance(gift_info, dict):
+            if catalog_entry is not None:
+                if "gift_assets" in catalog_entry:
+                    payload["gift_assets"] = catalog_entry["gift_assets"]
+            elif isinstance(gift_info, dict):
                 gift_assets: Dict[str, Any] = {}
                 for key in ["effect_id", "gif", "webp", "img_basic", "has_imaged_gift"]:
                     if key in gift_info:
@@ -969,24 +1395,54 @@ class GiftHandler(EventHandler):
             if isinstance(data.get("gift_tag"), list):
                 payload["gift_tag"] = data.get("gift_tag")
             
-            success, _ = self.api_client.post("money", payload)
-            if success:
-                logger.info(f"✅ 礼物记录已发送: {uname} 赠送 {gift_name} x{gift_num}")
+            # 只发送 gift_id，静态字段由后端按礼物目录补全
+            if catalog_entry is not None and GIFT_CATALOG_PAYLOAD == "id":
+                for key in self.CATALOG_FIELDS:
+                    payload.pop(key, None)
+            
+            if self.revenue:
+                self.revenue.add(payload)
+            
+            if self.aggregator:
+                self.aggregator.add(payload)
             else:
-                logger.error(f"❌ 礼物记录发送失败: {uname} 赠送 {gift_name} x{gift_num}")
+                self.post_money(payload)
         except Exception as e:
             logger.error(f"❌ 处理礼物消息时发生错误: {e}")
     
+    def post_money(self, payload: Dict[str, Any]) -> None:
+        """发送礼物记录到 /money 接口"""
+        uname = payload.get("uname")
+        gift_name = payload.get("gift_name")
+        gift_num = payload.get("gift_num")
+        success, status_code = self.api_client.post("money", payload)
+        if success:
+            logger.info(f"{_sent_label(status_code)} 礼物记录: {uname} 赠送 {gift_name} x{gift_num}")
+        else:
+            logger.error(f"❌ 礼物记录发送失败: {uname} 赠送 {gift_name} x{gift_num}")
+    
+    def flush(self, reason: str = "manual") -> None:
+        """立即发送所有尚在合并窗口中的礼物记录"""
+        if self.aggregator:
+            self.aggregator.flush(reason)
+    
     def stop(self) -> None:
         """停止处理器"""
-        pass
+        if self.aggregator:
+            self.aggregator.stop()
+            logger.info(f"🎁 连击合并统计: {self.aggregator.stats()}")
+        if self.revenue:
+            self.revenue.stop()
 
 
 # 上舰（大航海购买/续费）处理器
 class GuardBuyHandler(EventHandler):
-    def __init__(self, room_id: int, api_client: APIClient):
+    def __init__(self, room_id: int, api_client: APIClient, correlation_window: float = 0):
         self.room_id = room_id
         self.api_client = api_client
+        # 上舰关联：窗口大于0时 GUARD_BUY 与 USER_TOAST_MSG 先关联合并再发送
+        self.correlator = GuardEventCorrelator(self.post_guard, window=correlation_window, room_id=room_id) \
+            if correlation_window > 0 else None
 
     def handle(self, message: Dict[str, Any]) -> None:
         """处理上舰相关事件（如 GUARD_BUY / USER_TOAST_MSG），上报到 /guard 接口"""
@@ -1032,23 +1488,48 @@ class GuardBuyHandler(EventHandler):
                 "end_time": end_time,
                 "raw_message": message
             }
+            # USER_TOAST_MSG 独有的订单号、时长单位、开通/续费类型
+            if isinstance(data, dict):
+                for k in GUARD_TOAST_FIELDS:
+                    if data.get(k) is not None:
+                        payload[k] = data.get(k)
 
-            success, _ = self.api_client.post("guard", payload)
-            if success:
-                logger.info(f"✅ 上报上舰事件成功：uid={uid or '-'} username={username or '-'} level={guard_level} count={num}")
+            # 大航海等级已变化，缓存的用户资料作废
+            if uid:
+                user_profiles.invalidate(self.room_id, uid)
+
+            cmd = message.get("cmd", "") if isinstance(message, dict) else ""
+            if self.correlator:
+                self.correlator.add(cmd, payload)
             else:
-                logger.error("❌ 上报上舰事件失败 (/guard)")
+                self.post_guard(payload)
         except Exception as e:
             logger.error(f"❌ 处理上舰事件时发生错误: {e}")
 
+    def post_guard(self, payload: Dict[str, Any]) -> None:
+        """发送上舰记录到 /guard 接口"""
+        uid = payload.get("uid")
+        username = payload.get("username")
+        success, status_code = self.api_client.post("guard", payload)
+        if success:
+            logger.info(f"{_sent_label(status_code)} 上舰事件：uid={uid or '-'} username={username or '-'} "
+                        f"level={payload.get('guard_level')} count={payload.get('count')}")
+        else:
+            logger.error("❌ 上报上舰事件失败 (/guard)")
+
     def stop(self) -> None:
-        pass
+        """停止处理器"""
+        if self.correlator:
+            self.correlator.stop()
+            logger.info(f"⚓ 上舰关联统计: {self.correlator.stats()}")
 
 # 进场特效（用户进入）处理器
 class EntryEffectHandler(EventHandler):
-    def __init__(self, room_id: int, api_client: APIClient):
+    def __init__(self, room_id: int, api_client: APIClient, throttle: Optional[EntryThrottle] = None):
         self.room_id = room_id
         self.api_client = api_client
+        # 进场限流：按用户冷却 + 高峰抽样，舰长及以上总是放行
+        self.throttle = throttle
 
     def handle(self, message: Dict[str, Any]) -> None:
         """处理 ENTRY_EFFECT（用户进入）事件，转发到 /entry_welcome 接口"""
@@ -1063,47 +1544,24 @@ class EntryEffectHandler(EventHandler):
             privilege_type = None
 
             if isinstance(data, dict):
-                # uid、uname、头像
+                # uid、uname、头像、财富等级、勋章、大航海等级（经用户资料缓存）
                 uid = data.get("uid") or (data.get("uinfo", {}) or {}).get("uid")
-                uinfo = data.get("uinfo") or {}
-                base = uinfo.get("base") if isinstance(uinfo, dict) else None
-                if isinstance(base, dict):
-                    uname = base.get("name")
-                    face_url = base.get("face")
-                if not face_url:
-                    face_url = data.get("face")
-
-                # 财富等级
-                wealth = uinfo.get("wealth") if isinstance(uinfo, dict) else None
-                if isinstance(wealth, dict):
-                    wealth_level = wealth.get("level")
+                profile = user_profiles.lookup(self.room_id, uid, data.get("uinfo"))
+                uname = profile.get("uname")
+                face_url = profile.get("face") or data.get("face")
+                wealth_level = profile.get("wealth_level")
                 if wealth_level is None and isinstance(data.get("wealthy_info"), dict):
                     wealth_level = data["wealthy_info"].get("level")
-
-                # 勋章信息（牌子 + 等级）
-                medal = uinfo.get("medal") if isinstance(uinfo, dict) else None
-                if isinstance(medal, dict):
-                    medal_info = {
-                        "name": medal.get("name"),
-                        "level": medal.get("level"),
-                        "is_light": medal.get("is_light"),
-                        "ruid": medal.get("ruid"),
-                        "guard_level": medal.get("guard_level"),
-                        "color": medal.get("color"),
-                        "color_start": medal.get("color_start"),
-                        "color_end": medal.get("color_end"),
-                        "color_border": medal.get("color_border"),
-                    }
-
-                # 舰长/大航海等级与类型
-                guard = uinfo.get("guard") if isinstance(uinfo, dict) else None
-                if isinstance(guard, dict):
-                    guard_level = guard.get("level")
+                medal_info = profile.get("medal") or {}
+                guard_level = profile.get("guard_level")
                 privilege_type = data.get("privilege_type")
 
             # 是否是舰长（guard_level==3 或 privilege_type==3 视为舰长）
             is_captain = (guard_level == 3) or (privilege_type == 3)
 
+            if self.throttle and not self.throttle.allow(uid, guard_level or privilege_type, is_captain):
+                return
+
             payload: Dict[str, Any] = {
                 "room_id": self.room_id,
                 "raw_message": message,
@@ -1123,11 +1581,13 @@ class EntryEffectHandler(EventHandler):
                 payload["guard_level"] = guard_level
             if privilege_type is not None:
                 payload["privilege_type"] = privilege_type
+            user_profiles.attach(self.room_id, uid, payload)
 
-            success, _ = self.api_client.post("entry_welcome", payload)
+            success, status_code = self.api_client.post("entry_welcome", payload)
             if success:
                 logger.info(
-                    f"✅ /entry_welcome 上报成功：uid={uid or '-'} uname={uname or '-'} is_captain={is_captain}"
+                    f"{_sent_label(status_code)} /entry_welcome：uid={uid or '-'} uname={uname or '-'} "
+                    f"is_captain={is_captain}"
                 )
             else:
                 logger.error("❌ 上报 /entry_welcome 失败")
@@ -1150,8 +1610,9 @@ class LiveRoomListHandler(EventHandler):
             "stop_live_room_list": message.get("data", {})
         }
         
-        if self.api_client.post("live_room_spider", payload):
-            logger.info("✅ STOP_LIVE_ROOM_LIST 已成功发送")
+        success, status_code = self.api_client.post("live_room_spider", payload)
+        if success:
+            logger.info(f"{_sent_label(status_code)} STOP_LIVE_ROOM_LIST")
     
     def stop(self) -> None:
         """停止处理器"""
@@ -1196,25 +1657,125 @@ class MessageHandlerFactory:
 class BiliMessageParser:
     def __init__(self, room_id: int, api_base_url: str = API_BASE_URL, spider: bool = False, debug_events: bool = False, on_authenticated=None):
         self.room_id = room_id
-        self.api_client = APIClient(api_base_url)
+        self.debug_events = bool(debug_events)
+        self.api_client = APIClient(api_base_url, debug_raw=PAYLOAD_PROJECTION_DEBUG_RAW or self.debug_events)
         self.current_pk_handler = None
         # 确保将spider参数转换为布尔值
         self.spider_enabled = bool(spider)
-        self.debug_events = bool(debug_events)
         self.on_authenticated = on_authenticated
         
         # 初始化处理器映射
         self.persistent_handlers = {}
         
+        # 心跳回复(op=3)：最近一次的人气值与收到时间
+        self.popularity: Optional[int] = None
+        self.last_heartbeat_ack: Optional[float] = None
+        # 连接活性监测（由客户端在认证通过后设置）
+        self.liveness = None
+        
+        # 最近事件的列式环形缓冲（跨重连保留）
+        self.events = create_ring(room_id, EVENT_RING_CAPACITY, EVENT_RING_TEXT_BYTES) if EVENT_RING_ENABLED else None
+        
+        # 事件归档（供离线分析，跨重连保留）
+        self.recorder = EventRecorder(room_id, EVENT_ARCHIVE_DIR, EVENT_ARCHIVE_CMDS, EVENT_ARCHIVE_COMPRESS) \
+            if EVENT_ARCHIVE_DIR else None
+        if sqlite_archive:
+            sqlite_archive.start()
+        if danmaku_index:
+            danmaku_index.start()
+        
+        # 消息去重（跨重连保留）
+        self.deduplicator = MessageDeduplicator(
+            room_id, capacity=DEDUP_CAPACITY, false_positive_rate=DEDUP_FALSE_POSITIVE_RATE,
+            window=DEDUP_WINDOW, generations=DEDUP_GENERATIONS, exact_max_ids=DEDUP_EXACT_MAX_IDS
+        ) if DEDUP_ENABLED else None
+        
+        # 恢复重启前已激活的保卫模式
+        guard_mode_manager.load_state()
+        
+        # 加载上次保存的礼物目录
+        if GIFT_CATALOG_ENABLED:
+            gift_catalog.load()
+        
+        # 礼物处理器常驻，以便跨消息合并连击礼物
+        self.revenue = RevenueAggregator(
+            room_id,
+            emit=(lambda snapshot: self.api_client.post(REVENUE_SNAPSHOT_ENDPOINT, snapshot))
+            if REVENUE_SNAPSHOT_ENDPOINT else None,
+            interval=REVENUE_SNAPSHOT_INTERVAL, top_k=REVENUE_TOP_K, minute_buckets=REVENUE_MINUTE_BUCKETS
+        ) if REVENUE_ENABLED else None
+        if self.revenue:
+            self.revenue.start()
+        self.gift_handler = GiftHandler(room_id, self.api_client, combo_window=GIFT_COMBO_WINDOW,
+                                        revenue=self.revenue)
+        self.persistent_handlers["SEND_GIFT"] = self.gift_handler
+        
+        # 弹幕处理器常驻，以便跨消息保留触发限流状态
+        limiter = TriggerRateLimiter(room_id, DANMAKU_TRIGGER_LIMITS, DANMAKU_TRIGGER_MAX_USERS) \
+            if DANMAKU_TRIGGER_LIMITS else None
+        self.persistent_handlers["DANMU_MSG"] = DanmakuHandler(room_id, self.api_client, limiter=limiter,
+                                                               history=self.events)
+        
+        # 上舰处理器常驻，以便关联同一次上舰的 GUARD_BUY 与 USER_TOAST_MSG
+        self.guard_handler = GuardBuyHandler(room_id, self.api_client, correlation_window=GUARD_CORRELATION_WINDOW)
+        self.persistent_handlers["GUARD_BUY"] = self.guard_handler
+        self.persistent_handlers["USER_TOAST_MSG"] = self.guard_handler
+        
+        # 进场特效处理器常驻，以便跨消息保留按用户的冷却状态
+        entry_throttle = EntryThrottle.for_room(room_id, {
+            "enabled": ENTRY_THROTTLE_ENABLED,
+            "cooldown": ENTRY_THROTTLE_COOLDOWN,
+            "target_rate": ENTRY_THROTTLE_TARGET_RATE,
+            "max_users": ENTRY_THROTTLE_MAX_USERS,
+            "pass_guard_level": ENTRY_THROTTLE_PASS_GUARD_LEVEL,
+        }, ENTRY_THROTTLE_ROOM_OVERRIDES)
+        self.persistent_handlers["ENTRY_EFFECT"] = EntryEffectHandler(room_id, self.api_client, throttle=entry_throttle)
+        
         # 注册处理器
         if self.spider_enabled:
             self.persistent_handlers["STOP_LIVE_ROOM_LIST"] = LiveRoomListHandler(room_id, self.api_client)
             logger.info("🕷️ 直播间爬虫功能已启用，将监听 STOP_LIVE_ROOM_LIST 消息")
         else:
             logger.info("ℹ️ 直播间爬虫功能未启用")
+        
+        metrics.register_collector(self._collect_metrics)
+        # 进程退出时输出仍在合并窗口中的记录（在 APIClient.close 之前执行）
+        self._stopped = False
+        atexit.register(self.stop)
     
+    def stop(self) -> None:
+        """停止解析器：输出仍在合并窗口中的连击礼物、等待关联的上舰记录与最后一次流水快照（重复调用无副作用）"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.gift_handler.stop()
+        self.guard_handler.stop()
+    
+    def _collect_metrics(self) -> None:
+        """导出前刷新本房间的心跳、连击合并队列与去重指标"""
+        if self.last_heartbeat_ack is not None:
+            metrics.set_gauge("ws_heartbeat_ack_age_seconds", time.time() - self.last_heartbeat_ack, room=self.room_id)
+        if self.gift_handler.aggregator:
+            metrics.set_gauge("gift_combo_pending", self.gift_handler.aggregator.stats()["pending"], room=self.room_id)
+        if self.deduplicator:
+            self.deduplicator.collect_metrics()
+    
+    @timed()
     def parse_message(self, data: bytes) -> None:
-        """解析服务器返回的消息"""
+        """解析服务器返回的消息（一个 WebSocket 帧）"""
+        metrics.inc("ws_frames_total")
+        metrics.inc("ws_received_bytes_total", len(data))
+        liveness = self.liveness
+        if liveness is not None and len(data) >= 16:
+            operation = int.from_bytes(data[8:12], "big")
+            if operation == 5:
+                liveness.message_received()
+            elif operation == 3:
+                liveness.ack_received()
+        self._parse_packets(data, tracer.frame())
+
+    def _parse_packets(self, data: bytes, frame: Optional[FrameTimer]) -> None:
+        """解析帧内的数据包，压缩包解压后递归解析"""
         try:
             offset = 0
             while offset < len(data):
@@ -1240,15 +1801,22 @@ class BiliMessageParser:
                     except Exception:
                         pass
 
-                if protover == 2:
-                    decompressed_data = zlib.decompress(body)
-                    self.parse_message(decompressed_data)
-                elif protover == 3:
-                    decompressed_data = brotli.decompress(body)
-                    self.parse_message(decompressed_data)
+                if protover in (2, 3):
+                    started = time.perf_counter()
+                    decompressed_data = zlib.decompress(body) if protover == 2 else brotli.decompress(body)
+                    tracer.frame_decompressed(frame)
+                    metrics.observe("ws_decompress_seconds", time.perf_counter() - started, HANDLER_BUCKETS,
+                                    codec="zlib" if protover == 2 else "brotli")
+                    metrics.inc("ws_decompressed_bytes_total", len(decompressed_data))
+                    self._parse_packets(decompressed_data, frame)
                 elif protover in (0, 1):
                     if operation == 5:
+                        started = time.perf_counter()
                         message = json.loads(body.decode("utf-8"))
+                        metrics.observe("ws_json_decode_seconds", time.perf_counter() - started, HANDLER_BUCKETS)
+                        if isinstance(message, dict):
+                            metrics.inc("ws_messages_total", cmd=message.get("cmd") or "unknown")
+                        trace = tracer.begin_event(frame, message)
                         if self.debug_events:
                             try:
                                 # 美化打印整条消息（不做任何过滤）
@@ -1256,9 +1824,16 @@ class BiliMessageParser:
                             except Exception:
                                 # 兜底打印
                                 print(f"[DEBUG] 事件: {message}", flush=True)
-                        self._handle_message(message)
+                        try:
+                            self._handle_message(message)
+                        finally:
+                            if trace is not None:
+                                tracer.end_event()
                     elif operation == 3:
-                        popularity = int.from_bytes(body, "big")
+                        popularity = int.from_bytes(body[:4], "big")
+                        self.popularity = popularity
+                        self.last_heartbeat_ack = time.time()
+                        metrics.set_gauge("live_popularity", popularity, room=self.room_id)
                         if self.debug_events:
                             print(f"[DEBUG] 人气值: {popularity}", flush=True)
                     elif operation == 8:
@@ -1271,21 +1846,34 @@ class BiliMessageParser:
         except Exception as e:
             logger.error(f"❌ 消息解析错误: {e}")
     
+    @timed()
     def _handle_message(self, message: Dict[str, Any]) -> None:
         """处理解析后的消息"""
         try:
             if isinstance(message, dict):
                 cmd = message.get("cmd", "")
+                if self.deduplicator and self.deduplicator.is_duplicate(message):
+                    return
+                if self.events is not None:
+                    self.events.record(message)
+                if self.recorder is not None:
+                    self.recorder.record(message)
+                if sqlite_archive is not None:
+                    sqlite_archive.put(self.room_id, message)
+                if danmaku_index is not None and cmd == "DANMU_MSG":
+                    danmaku_index.add_message(self.room_id, message)
+                tracer.handler_started()
                 
                 # 处理 PK 相关消息
                 if cmd == "PK_INFO" or cmd == "PK_BATTLE_PROCESS_NEW":
                     if self.current_pk_handler:
-                        self.current_pk_handler.handle(message)
+                        self._run_handler(self.current_pk_handler, message)
                 elif cmd == "PK_BATTLE_START_NEW":
                     logger.info("✅ 收到 PK_BATTLE_START_NEW 消息")
                     battle_type = message["data"].get("battle_type", Constants.PK_TYPE_1)
                     self.current_pk_handler = PKBattleHandler(
-                        self.room_id, self.api_client, battle_type
+                        self.room_id, self.api_client, battle_type,
+                        on_deadline=lambda: self.gift_handler.flush("pk_deadline")
                     )
                 elif cmd == "PK_BATTLE_END":
                     logger.info("🛑 收到 PK_BATTLE_END 消息，销毁 PKBattleHandler 实例")
@@ -1297,7 +1885,7 @@ class BiliMessageParser:
                     if self.spider_enabled:
                         handler = self.persistent_handlers.get(cmd)
                         if handler:
-                            handler.handle(message)
+                            self._run_handler(handler, message)
                     else:
                         logger.debug(f"收到STOP_LIVE_ROOM_LIST消息，但爬虫功能未启用，忽略此消息")
                 # 处理其他消息
@@ -1311,6 +1899,16 @@ class BiliMessageParser:
                     
                     # 如果有处理器，则处理消息
                     if handler:
-                        handler.handle(message)
+                        self._run_handler(handler, message)
         except Exception as e:
             logger.error(f"❌ 处理消息时发生错误: {e}")
+    
+    @staticmethod
+    def _run_handler(handler: EventHandler, message: Dict[str, Any]) -> None:
+        """调用处理器并按处理器类记录耗时"""
+        started = time.perf_counter()
+        try:
+            handler.handle(message)
+        finally:
+            metrics.observe("handler_seconds", time.perf_counter() - started, HANDLER_BUCKETS,
+                            handler=type(handler).__name__)
@@ -0,0 +1,69 @@
+"""出站请求体编码
+
+按端点配置请求体格式：
+  format:   "json"（默认）或 "msgpack"（需要安装 msgpack）
+  compress: None 或 "gzip"，请求体不小于 min_bytes 时才压缩
+服务端可用 decode_body 按 Content-Type / Content-Encoding 还原。
+"""
+
+import gzip
+import json
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+_msgpack_warned = False
+
+
+def encode_body(body: Any, fmt: str = "json", compress: Optional[str] = None,
+                min_bytes: int = 1024, level: int = 6) -> Tuple[bytes, Dict[str, str]]:
+    """把请求体编码为字节串
+
+    Args:
+        body: 单条事件或事件数组
+        fmt: "json" 或 "msgpack"；msgpack 未安装时退回 json
+        compress: None 或 "gzip"
+        min_bytes: 编码后不小于该大小才压缩，小包压缩得不偿失
+        level: gzip 压缩等级
+
+    Returns:
+        Tuple[bytes, Dict[str, str]]: (请求体字节, 需要附加的请求头)
+    """
+    global _msgpack_warned
+    if fmt == "msgpack" and msgpack is None:
+        if not _msgpack_warned:
+            _msgpack_warned = True
+            logger.warning("⚠️ 未安装 msgpack，请求体将使用 JSON 编码（pip install msgpack）")
+        fmt = "json"
+
+    if fmt == "msgpack":
+        data = msgpack.packb(body, use_bin_type=True)
+        headers = {"Content-Type": MSGPACK_CONTENT_TYPE}
+    else:
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        headers = {"Content-Type": JSON_CONTENT_TYPE}
+
+    if compress == "gzip" and len(data) >= min_bytes:
+        data = gzip.compress(data, compresslevel=level)
+        headers["Content-Encoding"] = "gzip"
+    return data, headers
+
+
+def decode_body(data: bytes, content_type: Optional[str] = None, content_encoding: Optional[str] = None) -> Any:
+    """按请求头还原请求体（供后端或测试桩使用）"""
+    if content_encoding and content_encoding.lower() == "gzip":
+        data = gzip.decompress(data)
+    if content_type and content_type.split(";")[0].strip() == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise ValueError("收到 msgpack 请求体，但未安装 msgpack")
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data.decode("utf-8"))
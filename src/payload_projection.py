@@ -0,0 +1,164 @@
+"""出站请求体投影
+
+按端点声明式地裁剪请求体：后端只读取少量字段，完整的 raw_message
+（用户、勋章、表情等嵌套数据）往往有几 KB，序列化之前就把它去掉。
+
+规则格式（每个端点一条，字段路径可用 "a.b.c" 表示嵌套字段）：
+  include: 只保留这些字段
+  exclude: 去掉这些字段
+  raw:     raw_message 的处理方式，"always" 保留 / "never" 去掉 / "debug" 仅调试开关打开时保留
+  raw_fields: 去掉 raw_message 时先从中提取的字段 {顶层字段: "路径"}，路径中的数字表示列表下标，
+              例如弹幕的发送者 {"uid": "info.2.0", "uname": "info.2.1"}；请求体已有该字段时不覆盖
+"""
+
+import json
+import threading
+import logging
+from typing import Dict, Any, List, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RAW_FIELD = "raw_message"
+
+metrics.describe("payload_projection_saved_bytes_total", "投影裁剪掉的请求体字节数（抽样估算）")
+
+
+def _get_path(data: Dict[str, Any], path: List[str]) -> Any:
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def _has_path(data: Dict[str, Any], path: List[str]) -> bool:
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return False
+        data = data[key]
+    return True
+
+
+def _get_raw_path(data: Any, path: List[str]) -> Any:
+    """按路径取值，数字段作为列表下标"""
+    for key in path:
+        if isinstance(data, list) and key.isdigit():
+            index = int(key)
+            if index >= len(data):
+                return None
+            data = data[index]
+        elif isinstance(data, dict):
+            data = data.get(key)
+        else:
+            return None
+    return data
+
+
+def _set_path(data: Dict[str, Any], path: List[str], value: Any) -> None:
+    for key in path[:-1]:
+        data = data.setdefault(key, {})
+    data[path[-1]] = value
+
+
+def _pop_path(data: Dict[str, Any], path: List[str]) -> Any:
+    """删除嵌套字段，沿途的字典先浅拷贝，避免修改调用方的原始数据"""
+    for key in path[:-1]:
+        child = data.get(key)
+        if not isinstance(child, dict):
+            return None
+        child = dict(child)
+        data[key] = child
+        data = child
+    return data.pop(path[-1], None)
+
+
+class PayloadProjector:
+    """按端点规则裁剪请求体"""
+
+    def __init__(self, rules: Dict[str, Dict[str, Any]], debug_raw: bool = False, sample_every: int = 10):
+        """
+        Args:
+            rules: {端点: {"include": [...], "exclude": [...], "raw": "always"|"never"|"debug",
+                          "raw_fields": {字段: 路径}}}
+            debug_raw: 调试开关，打开时 raw 规则为 "debug" 的端点保留 raw_message
+            sample_every: 每多少次投影抽样计算一次节省的字节数（计算需要额外序列化）
+        """
+        self.rules = {
+            endpoint: {
+                "include": [p.split(".") for p in rule.get("include", [])],
+                "exclude": [p.split(".") for p in rule.get("exclude", [])],
+                "raw": rule.get("raw", "always"),
+                "raw_fields": {field: path.split(".") for field, path in rule.get("raw_fields", {}).items()},
+            }
+            for endpoint, rule in (rules or {}).items()
+        }
+        self.debug_raw = bool(debug_raw)
+        self.sample_every = max(1, int(sample_every))
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _keep_raw(self, rule: Dict[str, Any]) -> bool:
+        mode = rule["raw"]
+        return mode == "always" or (mode == "debug" and self.debug_raw)
+
+    def project(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """返回裁剪后的请求体（不修改传入的字典）"""
+        rule = self.rules.get(endpoint)
+        if rule is None or not isinstance(payload, dict):
+            return payload
+
+        if rule["include"]:
+            result: Dict[str, Any] = {}
+            for path in rule["include"]:
+                if _has_path(payload, path):
+                    _set_path(result, path, _get_path(payload, path))
+            if self._keep_raw(rule) and RAW_FIELD in payload:
+                result[RAW_FIELD] = payload[RAW_FIELD]
+            else:
+                self._extract_raw_fields(rule, payload, result)
+            removed: Optional[Dict[str, Any]] = None
+        else:
+            result = dict(payload)
+            removed = {}
+            for path in rule["exclude"]:
+                if _has_path(result, path):
+                    removed[".".join(path)] = _pop_path(result, path)
+            if not self._keep_raw(rule) and RAW_FIELD in result:
+                self._extract_raw_fields(rule, payload, result)
+                removed[RAW_FIELD] = result.pop(RAW_FIELD)
+
+        self._record_savings(endpoint, payload, result, removed)
+        return result
+
+    @staticmethod
+    def _extract_raw_fields(rule: Dict[str, Any], payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """去掉 raw_message 之前把后端仍需要的字段（如发送者 uid、uname）提到顶层"""
+        raw = payload.get(RAW_FIELD)
+        if raw is None:
+            return
+        for field, path in rule["raw_fields"].items():
+            if field in result:
+                continue
+            value = _get_raw_path(raw, path)
+            if value is not None:
+                result[field] = value
+
+    def _record_savings(self, endpoint: str, original: Dict[str, Any], projected: Dict[str, Any],
+                        removed: Optional[Dict[str, Any]]) -> None:
+        """抽样估算节省的字节数：只序列化被去掉的部分（include 规则下比较前后大小）"""
+        with self._lock:
+            self._count += 1
+            if self._count % self.sample_every:
+                return
+        try:
+            if removed is not None:
+                saved = len(json.dumps(removed, ensure_ascii=False).encode("utf-8")) if removed else 0
+            else:
+                saved = (len(json.dumps(original, ensure_ascii=False).encode("utf-8"))
+                         - len(json.dumps(projected, ensure_ascii=False).encode("utf-8")))
+        except (TypeError, ValueError):
+            return
+        if saved > 0:
+            metrics.inc("payload_projection_saved_bytes_total", saved * self.sample_every, endpoint=endpoint)
@@ -0,0 +1,143 @@
+"""出站请求优先级通道
+
+按端点把出站请求分到不同通道（PK 关键请求 / 交互请求 / 批量上报），
+每个通道有独立的队列、工作线程和令牌桶限流，
+进场特效洪峰只会堆积在批量通道里，不会拖慢 PK 绝杀请求。
+"""
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, List, Optional
+
+from .metrics import metrics
+from .rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("api_lane_wait_seconds", "请求从入队到开始发送的等待时间")
+metrics.describe("api_lane_queue_depth", "各通道排队中的请求数")
+metrics.describe("api_lane_dropped_total", "通道队列满时被拒绝的请求数")
+
+
+class Lane:
+    """单个优先级通道"""
+
+    def __init__(self, name: str, endpoints: List[str], workers: int = 1, rate: float = 0, burst: float = 1,
+                 queue_size: int = 1000, wait: bool = True):
+        """
+        Args:
+            name: 通道名称
+            endpoints: 归属该通道的端点
+            workers: 工作线程数
+            rate: 令牌桶速率（请求/秒），<=0 表示不限流
+            burst: 令牌桶容量
+            queue_size: 队列长度上限
+            wait: 调用方是否等待请求完成；为 False 时入队即返回
+        """
+        self.name = name
+        self.endpoints = list(endpoints)
+        self.workers = max(1, int(workers))
+        self.bucket = TokenBucket(rate, burst)
+        self.wait = bool(wait)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"lane-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            enqueued_at, future, fn, args = self.queue.get()
+            try:
+                self.bucket.acquire()
+                metrics.observe("api_lane_wait_seconds", time.monotonic() - enqueued_at, lane=self.name)
+                if future.set_running_or_notify_cancel():
+                    future.set_result(fn(*args))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                logger.error(f"❌ 通道 {self.name} 执行请求出错: {e}")
+            finally:
+                self.queue.task_done()
+
+
+class OutboundLanes:
+    """出站请求通道调度器"""
+
+    def __init__(self, lanes_config: Dict[str, Dict[str, Any]], default_lane: str):
+        """
+        Args:
+            lanes_config: {通道名: Lane 参数}
+            default_lane: 未归类端点使用的通道
+        """
+        self.lanes: Dict[str, Lane] = {name: Lane(name, **cfg) for name, cfg in lanes_config.items()}
+        if default_lane not in self.lanes:
+            raise ValueError(f"默认通道 {default_lane} 未在通道配置中定义")
+        self.default_lane = default_lane
+        self._routes: Dict[str, Lane] = {}
+        for lane in self.lanes.values():
+            for endpoint in lane.endpoints:
+                self._routes[endpoint] = lane
+        self._started = False
+        self._lock = threading.Lock()
+        metrics.register_collector(self._collect_metrics)
+
+    def start(self) -> None:
+        """启动所有通道的工作线程（重复调用无副作用）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for lane in self.lanes.values():
+                lane.start()
+        logger.info("🚦 出站优先级通道已启动: " + ", ".join(
+            f"{lane.name}(workers={lane.workers})" for lane in self.lanes.values()))
+
+    def lane_for(self, endpoint: str) -> Lane:
+        """端点所属的通道"""
+        return self._routes.get(endpoint) or self.lanes[self.default_lane]
+
+    def submit(self, endpoint: str, fn: Callable[..., tuple], *args: Any,
+               on_full: Optional[Callable[[], tuple]] = None) -> tuple:
+        """把请求提交到端点所属的通道
+
+        Args:
+            endpoint: 目标端点
+            fn: 在工作线程中执行的发送函数，返回 (成功标志, 状态码或None)
+            on_full: 队列已满时的处理函数，默认直接判为失败
+
+        Returns:
+            tuple: 等待型通道返回 fn 的结果；非等待型通道入队即返回 (True, None)
+        """
+        lane = self.lane_for(endpoint)
+        future: Future = Future()
+        try:
+            lane.queue.put_nowait((time.monotonic(), future, fn, args))
+        except queue.Full:
+            metrics.inc("api_lane_dropped_total", lane=lane.name, endpoint=endpoint)
+            logger.warning(f"🚦 通道 {lane.name} 队列已满，/{endpoint} 请求被拒绝")
+            return on_full() if on_full else (False, None)
+        if not lane.wait:
+            return True, None
+        return future.result()
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """等待各通道中已入队的请求发送完毕（进程退出前调用），返回是否全部完成"""
+        deadline = time.monotonic() + timeout
+        for lane in self.lanes.values():
+            while lane.queue.unfinished_tasks and time.monotonic() < deadline:
+                time.sleep(0.05)
+        pending = sum(lane.queue.unfinished_tasks for lane in self.lanes.values())
+        if pending:
+            logger.warning(f"🚦 退出时仍有 {pending} 个请求未发送完毕")
+        return not pending
+
+    def _collect_metrics(self) -> None:
+        for lane in self.lanes.values():
+            metrics.set_gauge("api_lane_queue_depth", lane.queue.qsize(), lane=lane.name)
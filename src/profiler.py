@@ -0,0 +1,189 @@
+"""按需采样剖析与热点计时
+
+线上房间卡顿时无法进容器挂 profiler，这里提供两样内置工具：
+  - 采样剖析：后台线程按固定间隔用 sys._current_frames() 抓取所有线程的调用栈，
+    持续 N 秒后输出 collapsed stacks（每行 "线程;函数;函数... 次数"），可直接交给 flamegraph.pl / speedscope。
+    通过 SIGUSR1 信号（结果写入 PROFILER_OUTPUT_DIR）或指标服务上的 /debug/profile?seconds=N（直接返回结果）触发。
+  - 热点计时：@timed 装饰器记录函数耗时到 hotpath_seconds{fn} 直方图。
+    默认关闭，关闭时只多一次布尔判断；剖析期间自动打开，也可用 /debug/timings?enable=1 手动开关。
+"""
+
+import functools
+import os
+import signal
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from .metrics import metrics, add_route
+from .tracing import STAGE_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("hotpath_seconds", "热点函数耗时（仅在计时开关打开时记录）")
+
+
+class _TimingSwitch:
+    """热点计时开关（所有 @timed 共享）"""
+    enabled = False
+
+
+def set_timings_enabled(enabled: bool) -> None:
+    """打开或关闭 @timed 计时"""
+    _TimingSwitch.enabled = bool(enabled)
+
+
+def timings_enabled() -> bool:
+    return _TimingSwitch.enabled
+
+
+def timed(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """热点计时装饰器，name 默认为函数的限定名"""
+    def decorate(fn: Callable) -> Callable:
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _TimingSwitch.enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.observe("hotpath_seconds", time.perf_counter() - started, STAGE_BUCKETS, fn=label)
+        return wrapper
+    return decorate
+
+
+class SamplingProfiler:
+    """基于采样的多线程剖析器；同一时刻只允许一次剖析"""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def profile(self, seconds: float) -> Tuple[Counter, int]:
+        """在当前线程中采样 seconds 秒，返回 (调用栈计数, 采样轮数)
+
+        Raises:
+            RuntimeError: 已有剖析正在进行
+        """
+        with self._lock:
+            if self._running:
+                raise RuntimeError("已有剖析正在进行")
+            self._running = True
+        timings_before = timings_enabled()
+        set_timings_enabled(True)
+        stacks: Counter = Counter()
+        rounds = 0
+        me = threading.get_ident()
+        try:
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stacks[self._collapse(names.get(ident, f"thread-{ident}"), frame)] += 1
+                rounds += 1
+                time.sleep(self.interval)
+        finally:
+            set_timings_enabled(timings_before)
+            self._running = False
+        return stacks, rounds
+
+    def _collapse(self, thread_name: str, frame: Any) -> str:
+        parts: List[str] = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name.replace(";", ":"))
+        return ";".join(reversed(parts))
+
+    @staticmethod
+    def format_collapsed(stacks: Counter) -> str:
+        """按 collapsed stacks 格式输出（出现次数多的在前）"""
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def profile_to_file(self, seconds: float, output_dir: str) -> Optional[str]:
+        """采样并写入 output_dir/profile-<时间>.collapsed，返回文件路径"""
+        try:
+            stacks, rounds = self.profile(seconds)
+        except RuntimeError as e:
+            logger.warning(f"⚠️ 无法开始剖析: {e}")
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, time.strftime("profile-%Y%m%d-%H%M%S.collapsed"))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.format_collapsed(stacks))
+        logger.info(f"🔥 剖析完成：{seconds:g} 秒，{rounds} 轮采样，{len(stacks)} 个不同调用栈，已写入 {path}")
+        return path
+
+    def start_background(self, seconds: float, output_dir: str) -> bool:
+        """在后台线程剖析并写文件；已有剖析在进行时返回 False"""
+        if self._running:
+            logger.warning("⚠️ 已有剖析正在进行，忽略本次请求")
+            return False
+        logger.info(f"🔥 开始采样剖析 {seconds:g} 秒")
+        threading.Thread(target=self.profile_to_file, args=(seconds, output_dir),
+                         name="sampling-profiler", daemon=True).start()
+        return True
+
+
+# 全局剖析器
+profiler = SamplingProfiler()
+
+
+def install_signal_handler(seconds: float, output_dir: str, signum: Optional[int] = None) -> bool:
+    """收到信号（默认 SIGUSR1）时剖析 seconds 秒并写入 output_dir；只能在主线程调用
+
+    Returns:
+        bool: 当前平台是否支持该信号
+    """
+    signum = signum if signum is not None else getattr(signal, "SIGUSR1", None)
+    if signum is None:
+        return False
+
+    def handler(_signum: int, _frame: Any) -> None:
+        profiler.start_background(seconds, output_dir)
+
+    signal.signal(signum, handler)
+    logger.info(f"🔥 已注册剖析信号：kill -USR1 {os.getpid()} 将采样 {seconds:g} 秒")
+    return True
+
+
+def _first(query: Dict[str, List[str]], key: str, default: str) -> str:
+    return query.get(key, [default])[0]
+
+
+def _profile_route(query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+    """GET /debug/profile?seconds=N：采样 N 秒，直接返回 collapsed stacks"""
+    seconds = min(300.0, max(0.1, float(_first(query, "seconds", "10"))))
+    try:
+        stacks, _ = profiler.profile(seconds)
+    except RuntimeError as e:
+        return 409, "text/plain; charset=utf-8", f"{e}\n".encode("utf-8")
+    return 200, "text/plain; charset=utf-8", profiler.format_collapsed(stacks).encode("utf-8")
+
+
+def _timings_route(query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+    """GET /debug/timings?enable=1|0：开关热点计时，返回当前状态"""
+    if "enable" in query:
+        set_timings_enabled(_first(query, "enable", "0") in ("1", "true", "on"))
+    return 200, "text/plain; charset=utf-8", f"timings_enabled={int(timings_enabled())}\n".encode("utf-8")
+
+
+def register_admin_routes() -> None:
+    """在指标 HTTP 服务上注册 /debug/profile 与 /debug/timings"""
+    add_route("/debug/profile", _profile_route)
+    add_route("/debug/timings", _timings_route)
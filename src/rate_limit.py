@@ -0,0 +1,107 @@
+"""令牌桶限流"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多积攒 burst 个"""
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: 每秒补充的令牌数，<=0 表示不限流
+            burst: 桶容量（允许的突发量）
+        """
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        """补充令牌（需持有锁）"""
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """尝试取走令牌，不足时立即返回 False"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def refund(self, tokens: float = 1.0) -> None:
+        """退还已取走的令牌（后续检查未通过、本次并未使用时）"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """距离攒够令牌还需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+            return max(0.0, missing / self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """阻塞直到取得令牌
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        start = time.monotonic()
+        while not self.try_acquire(tokens):
+            time.sleep(max(0.001, self.time_until_available(tokens)))
+        return time.monotonic() - start
+
+
+class KeyedTokenBuckets:
+    """按键（如用户）分配令牌桶，最多保留 max_keys 个，超出时淘汰最久未使用的键
+
+    被淘汰的键下次出现时拿到一个满的新桶，因此 max_keys 应大于窗口内的活跃键数。
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max(1, int(max_keys))
+        self._buckets: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def try_acquire(self, key: Any, tokens: float = 1.0) -> bool:
+        """尝试从 key 对应的桶取走令牌，不足时立即返回 False"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+        return bucket.try_acquire(tokens)
+
+    def refund(self, key: Any, tokens: float = 1.0) -> None:
+        """退还 key 对应的桶中已取走的令牌"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.refund(tokens)
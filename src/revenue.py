@@ -0,0 +1,188 @@
+"""礼物流水增量聚合
+
+后端目前要从 /money 原始事件重新计算每个房间的流水、送礼榜和盲盒盈亏。
+这里在客户端随每条礼物增量维护：
+  - 按货币类型（gold / silver）的总额、礼物数和事件数
+  - 按 uid、按 gift_id 的累计值；送礼榜在生成快照时用堆取前 K 名
+  - 盲盒：原价、开出价值、差额之和以及盈/亏/平次数（按礼物数量计）
+  - 最近 minute_buckets 分钟的每分钟金瓜子流水
+金额单位与 B站一致（金瓜子，1000 = 1 元）。每隔 interval 秒，有变化时把紧凑的快照发送到
+REVENUE_SNAPSHOT_ENDPOINT；指标服务上的 /revenue?room=N 可随时查看当前快照。
+"""
+
+import heapq
+import json
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from .metrics import metrics, add_route
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("revenue_gold_total", "本次运行以来的金瓜子礼物流水")
+metrics.describe("revenue_blind_box_diff_total", "本次运行以来的盲盒盈亏（开出价值 - 原价）")
+
+# 所有房间的聚合器，供 /revenue 路由查询
+aggregators: Dict[int, "RevenueAggregator"] = {}
+
+
+class RevenueAggregator:
+    """单个房间的礼物流水聚合器"""
+
+    def __init__(self, room_id: int, emit: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 interval: float = 60.0, top_k: int = 10, minute_buckets: int = 60):
+        """
+        Args:
+            room_id: 房间ID
+            emit: 快照的输出回调（通常是发送到后端），None 表示只在本地维护
+            interval: 输出快照的间隔（秒）
+            top_k: 快照中送礼榜、礼物榜的条数
+            minute_buckets: 保留的每分钟流水桶数
+        """
+        self.room_id = room_id
+        self.emit = emit
+        self.interval = float(interval)
+        self.top_k = max(1, int(top_k))
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.totals: Dict[str, Dict[str, int]] = {}       # coin_type -> {value, gifts, events}
+        self.by_user: Dict[Any, List[Any]] = {}           # uid -> [金瓜子, 礼物数, uname]
+        self.by_gift: Dict[Any, List[Any]] = {}           # gift_id -> [金瓜子, 礼物数, gift_name]
+        self.blind_box = {"gifts": 0, "original": 0, "revealed": 0, "diff": 0, "profit": 0, "loss": 0, "even": 0}
+        self.minutes: "deque[List[int]]" = deque(maxlen=max(1, int(minute_buckets)))  # [分钟起点, 金瓜子, 礼物数]
+
+        aggregators[room_id] = self
+
+    def add(self, payload: Dict[str, Any]) -> None:
+        """累加一条礼物记录（GiftHandler 构造的 /money 请求体）"""
+        coin_type = payload.get("coin_type") or "gold"
+        num = payload.get("gift_num") or 1
+        value = payload.get("total_price") or 0
+        uid = payload.get("uid")
+        gift_id = payload.get("gift_id")
+        minute = int(payload.get("timestamp") or time.time()) // 60 * 60
+        with self._lock:
+            self._dirty = True
+            total = self.totals.setdefault(coin_type, {"value": 0, "gifts": 0, "events": 0})
+            total["value"] += value
+            total["gifts"] += num
+            total["events"] += 1
+            if coin_type != "gold":
+                return
+
+            user = self.by_user.get(uid)
+            if user is None:
+                user = self.by_user[uid] = [0, 0, None]
+            user[0] += value
+            user[1] += num
+            user[2] = payload.get("uname") or user[2]
+
+            gift = self.by_gift.get(gift_id)
+            if gift is None:
+                gift = self.by_gift[gift_id] = [0, 0, None]
+            gift[0] += value
+            gift[1] += num
+            gift[2] = payload.get("gift_name") or gift[2]
+
+            if not self.minutes or self.minutes[-1][0] < minute:
+                self.minutes.append([minute, 0, 0])
+            # 乱序到达的礼物计入对应的旧桶，早于保留范围的只计入总额
+            bucket = next((b for b in reversed(self.minutes) if b[0] == minute), None)
+            if bucket is not None:
+                bucket[1] += value
+                bucket[2] += num
+
+            blind = payload.get("blind_box") if payload.get("is_blind_gift") else None
+            if isinstance(blind, dict):
+                self._add_blind_box(blind, num)
+        metrics.inc("revenue_gold_total", value, room=self.room_id)
+
+    def _add_blind_box(self, blind: Dict[str, Any], num: int) -> None:
+        """累加盲盒盈亏（需持有锁）"""
+        original = blind.get("original_gift_price")
+        revealed = blind.get("revealed_gift_price")
+        if not isinstance(original, (int, float)) or not isinstance(revealed, (int, float)):
+            return
+        stats = self.blind_box
+        stats["gifts"] += num
+        stats["original"] += original * num
+        stats["revealed"] += revealed * num
+        stats["diff"] += (revealed - original) * num
+        result = blind.get("result")
+        if result in ("profit", "loss", "even"):
+            stats[result] += num
+        metrics.inc("revenue_blind_box_diff_total", (revealed - original) * num, room=self.room_id)
+
+    @staticmethod
+    def _top(table: Dict[Any, List[Any]], k: int, id_field: str, name_field: str) -> List[Dict[str, Any]]:
+        top: List[Tuple[Any, List[Any]]] = heapq.nlargest(k, table.items(), key=lambda item: item[1][0])
+        return [{id_field: key, name_field: row[2], "value": row[0], "gifts": row[1]} for key, row in top]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """生成紧凑快照"""
+        with self._lock:
+            return {
+                "room_id": self.room_id,
+                "since": int(self.started_at),
+                "generated_at": int(time.time()),
+                "totals": {coin: dict(total) for coin, total in self.totals.items()},
+                "gifters": len(self.by_user),
+                "top_users": self._top(self.by_user, self.top_k, "uid", "uname"),
+                "top_gifts": self._top(self.by_gift, self.top_k, "gift_id", "gift_name"),
+                "blind_box": dict(self.blind_box),
+                "per_minute": [{"minute": m, "value": v, "gifts": g} for m, v, g in self.minutes],
+            }
+
+    def flush(self) -> bool:
+        """有变化时输出一次快照，返回是否输出"""
+        if self.emit is None:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._dirty = False
+        try:
+            self.emit(self.snapshot())
+        except Exception as e:
+            logger.error(f"❌ 输出流水快照时出错: {e}")
+        return True
+
+    def start(self) -> None:
+        """启动定时输出线程（没有输出回调时不启动）"""
+        if self.emit is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=f"revenue-{self.room_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+def _revenue_route(query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+    """GET /revenue[?room=N]：返回一个或全部房间的流水快照"""
+    rooms = query.get("room")
+    if rooms:
+        aggregator = aggregators.get(int(rooms[0]))
+        if aggregator is None:
+            return 404, "text/plain; charset=utf-8", b"room not found\n"
+        body: Any = aggregator.snapshot()
+    else:
+        body = [aggregator.snapshot() for aggregator in list(aggregators.values())]
+    return 200, "application/json; charset=utf-8", json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def register_routes() -> None:
+    """在指标 HTTP 服务上注册 /revenue"""
+    add_route("/revenue", _revenue_route)
@@ -0,0 +1,342 @@
+"""示例事件
+
+按B站直播广播消息的真实结构构造 SEND_GIFT、ENTRY_EFFECT 等事件，
+字段与线上抓包保持一致，供基准测试和本地压测使用。
+"""
+
+import json
+import random
+import time
+from typing import Dict, Any, Optional
+
+FACE_URL = "https://i0.hdslb.com/bfs/face/0a1b2c3d4e5f60718293a4b5c6d7e8f901234567.jpg"
+
+
+def _medal(anchor_uid: int, level: int = 21, guard_level: int = 0) -> Dict[str, Any]:
+    return {
+        "name": "鱼豆腐",
+        "level": level,
+        "color_start": 1725515,
+        "color_end": 5414290,
+        "color_border": 6809855,
+        "color": 1725515,
+        "id": 0,
+        "typ": 0,
+        "is_light": 1,
+        "ruid": anchor_uid,
+        "guard_level": guard_level,
+        "score": 50001980,
+        "guard_icon": "",
+        "honor_icon": "",
+        "v2_medal_color_start": "#4775EFCC",
+        "v2_medal_color_end": "#4775EFCC",
+        "v2_medal_color_border": "#58A1F8FF",
+        "v2_medal_color_text": "#FFFFFFFF",
+        "v2_medal_color_level": "#000B7099",
+        "user_receive_count": 0,
+    }
+
+
+def _uinfo(uid: int, uname: str, anchor_uid: int, guard_level: int = 0, wealth_level: int = 20) -> Dict[str, Any]:
+    return {
+        "uid": uid,
+        "base": {
+            "name": uname,
+            "face": FACE_URL,
+            "name_color": 0,
+            "is_mystery": False,
+            "risk_ctrl_info": None,
+            "origin_info": {"name": uname, "face": FACE_URL},
+            "official_info": {"role": 0, "title": "", "desc": "", "type": -1},
+            "name_color_str": "",
+        },
+        "medal": _medal(anchor_uid, guard_level=guard_level),
+        "wealth": {"level": wealth_level, "dm_icon_key": ""},
+        "title": {"old_title_css_id": "", "title_css_id": ""},
+        "guard": {"level": guard_level, "expired_str": ""},
+        "uhead_frame": None,
+        "guard_leader": {"is_guard_leader": False},
+    }
+
+
+def make_send_gift(uid: int = 10001, uname: str = "观众甲", room_id: int = 1, anchor_uid: int = 2,
+                   gift_id: int = 31036, gift_name: str = "小花花", price: int = 100, num: int = 1,
+                   batch_combo_id: Optional[str] = None, blind: bool = False) -> Dict[str, Any]:
+    """构造 SEND_GIFT 事件"""
+    now = int(time.time())
+    data: Dict[str, Any] = {
+        "action": "投喂",
+        "batch_combo_id": batch_combo_id or "",
+        "batch_combo_send": None,
+        "beatId": "",
+        "biz_source": "Live",
+        "blind_gift": None,
+        "broadcast_id": 0,
+        "coin_type": "gold",
+        "combo_resources_id": 1,
+        "combo_send": None,
+        "combo_stay_time": 5,
+        "combo_total_coin": price * num,
+        "crit_prob": 0,
+        "demarcation": 1,
+        "discount_price": price,
+        "dmscore": 40,
+        "draw": 0,
+        "effect": 0,
+        "effect_block": 1,
+        "face": FACE_URL,
+        "face_effect_id": 0,
+        "face_effect_type": 0,
+        "face_effect_v2": {"id": 0, "type": 0},
+        "float_sc_resource_id": 0,
+        "giftId": gift_id,
+        "giftName": gift_name,
+        "giftType": 0,
+        "gift_info": {
+            "effect_id": 0,
+            "gif": "https://i0.hdslb.com/bfs/live/8b40d0470890e7d573995383af8a8ae074d485d9.gif",
+            "has_imaged_gift": 0,
+            "img_basic": "https://s1.hdslb.com/bfs/live/8b40d0470890e7d573995383af8a8ae074d485d9.png",
+            "webp": "https://i0.hdslb.com/bfs/live/8b40d0470890e7d573995383af8a8ae074d485d9.webp",
+        },
+        "gift_tag": [],
+        "gold": 0,
+        "guard_level": 0,
+        "is_first": True,
+        "is_join_receiver": False,
+        "is_naming": False,
+        "is_special_batch": 0,
+        "magnification": 1,
+        "medal_info": _medal(anchor_uid),
+        "name_color": "",
+        "num": num,
+        "original_gift_name": "",
+        "price": price,
+        "rcost": 200000,
+        "receive_user_info": {"uid": anchor_uid, "uname": "主播"},
+        "receiver_uinfo": _uinfo(anchor_uid, "主播", anchor_uid),
+        "remain": 0,
+        "rnd": str(random.randint(10 ** 17, 10 ** 18)),
+        "send_master": None,
+        "sender_uinfo": _uinfo(uid, uname, anchor_uid),
+        "silver": 0,
+        "super": 0,
+        "super_batch_gift_num": num,
+        "super_gift_num": num,
+        "svga_block": 0,
+        "switch": True,
+        "tag_image": "",
+        "tid": str(random.randint(10 ** 17, 10 ** 18)),
+        "timestamp": now,
+        "top_list": None,
+        "total_coin": price * num,
+        "uid": uid,
+        "uname": uname,
+        "wealth_level": 20,
+    }
+    if batch_combo_id:
+        data["combo_send"] = {
+            "action": "投喂", "combo_id": batch_combo_id, "combo_num": num, "gift_id": gift_id,
+            "gift_name": gift_name, "gift_num": num, "send_master": None, "uid": uid, "uname": uname,
+        }
+    if blind:
+        data["blind_gift"] = {
+            "blind_gift_config_id": 51, "from": 0, "gift_action": "爆出",
+            "gift_tip_price": price, "original_gift_id": 32251, "original_gift_name": "心动盲盒",
+            "original_gift_price": 15000,
+        }
+    return {"cmd": "SEND_GIFT", "data": data}
+
+
+def make_entry_effect(uid: int = 10002, uname: str = "观众乙", room_id: int = 1, anchor_uid: int = 2,
+                      guard_level: int = 0) -> Dict[str, Any]:
+    """构造 ENTRY_EFFECT 事件"""
+    now_ms = int(time.time() * 1000)
+    privilege_type = guard_level
+    return {
+        "cmd": "ENTRY_EFFECT",
+        "data": {
+            "id": 4 if guard_level else 136,
+            "uid": uid,
+            "target_id": anchor_uid,
+            "mock_effect": 0,
+            "face": FACE_URL,
+            "privilege_type": privilege_type,
+            "copy_writing": f"欢迎 <%{uname}%> 进入直播间",
+            "copy_color": "#000000",
+            "highlight_color": "#FFF100",
+            "priority": 1,
+            "basemap_url": "",
+            "show_avatar": 1,
+            "effective_time": 2,
+            "web_basemap_url": "https://i0.hdslb.com/bfs/live/mlive/586f60be8ee1c8a9ee2b6d9b5a4c5f6b.png",
+            "web_effective_time": 2,
+            "web_effect_close": 0,
+            "web_close_time": 0,
+            "business": 3,
+            "copy_writing_v2": f"欢迎 <^icon^> <%{uname}%> 进入直播间",
+            "icon_list": [2],
+            "max_delay_time": 7,
+            "trigger_time": now_ms * 1000000,
+            "identities": 22,
+            "effect_silent_time": 0,
+            "effective_time_new": 0,
+            "web_dynamic_url_webp": "",
+            "web_dynamic_url_apng": "",
+            "mobile_dynamic_url_webp": "",
+            "wealthy_info": {"uid": 0, "level": 20, "level_total_score": 0, "cur_score": 0,
+                             "upgrade_need_score": 0, "status": 0, "dm_icon_key": ""},
+            "new_style": 1,
+            "is_mystery": False,
+            "uinfo": _uinfo(uid, uname, anchor_uid, guard_level=guard_level),
+            "full_cartoon_id": 0,
+            "priority_long": 0,
+        },
+    }
+
+
+def make_danmaku(uid: int = 10003, uname: str = "观众丙", text: str = "主播好", room_id: int = 1,
+                 anchor_uid: int = 2, guard_level: int = 0) -> Dict[str, Any]:
+    """构造 DANMU_MSG 事件（info 数组结构）"""
+    now_ms = int(time.time() * 1000)
+    id_str = "%032x" % random.getrandbits(128)
+    extra = {
+        "send_from_me": False, "master_player_hidden": False, "mode": 0, "color": 16777215,
+        "dm_type": 0, "font_size": 25, "player_mode": 1, "show_player_type": 0, "content": text,
+        "user_hash": "1234567890", "emoticon_unique": "", "bulge_display": 0, "recommend_score": 3,
+        "main_state_dm_color": "", "objective_state_dm_color": "", "direction": 0, "pk_direction": 0,
+        "quartet_direction": 0, "anniversary_crowd": 0, "yeah_space_type": "", "yeah_space_url": "",
+        "jump_to_url": "", "space_type": "", "space_url": "", "animation": {}, "emots": None,
+        "is_audited": False, "id_str": id_str, "icon": None, "show_reply": True, "reply_mid": 0,
+        "reply_uname": "", "reply_uname_color": "", "reply_is_mystery": False, "hit_combo": 0,
+    }
+    header = {
+        "mode": 0, "show_player_type": 0, "extra": json.dumps(extra, ensure_ascii=False),
+        "user": _uinfo(uid, uname, anchor_uid, guard_level=guard_level),
+    }
+    return {
+        "cmd": "DANMU_MSG",
+        "dm_v2": "",
+        "info": [
+            [0, 1, 25, 16777215, now_ms, random.randint(0, 2 ** 31), 0, "1234567890", 0, 0, 0, "", 0,
+             "{}", "{}", header, {"activity_identity": "", "activity_source": 0, "not_show": 0}, 0],
+            text,
+            [uid, uname, 0, 0, 0, 10000, 1, ""],
+            [21, "鱼豆腐", "主播", room_id, 1725515, "", 0, 6809855, 1725515, 5414290, guard_level, 1, anchor_uid],
+            [0, 0, 9868950, ">50000", 0],
+            ["", ""],
+            0,
+            guard_level,
+            None,
+            {"ts": now_ms // 1000, "ct": "ABCDEF12", "uid": uid},
+            0,
+            0,
+            None,
+            None,
+            0,
+            105,
+            [20],
+            None,
+        ],
+    }
+
+
+def make_guard_buy(uid: int = 10004, uname: str = "舰长甲", guard_level: int = 3, num: int = 1) -> Dict[str, Any]:
+    """构造 GUARD_BUY 事件"""
+    now = int(time.time())
+    names = {1: "总督", 2: "提督", 3: "舰长"}
+    prices = {1: 19998000, 2: 1998000, 3: 198000}
+    return {
+        "cmd": "GUARD_BUY",
+        "data": {
+            "uid": uid, "username": uname, "guard_level": guard_level, "num": num,
+            "price": prices.get(guard_level, 198000), "gift_id": 10000 + guard_level,
+            "gift_name": names.get(guard_level, "舰长"), "start_time": now, "end_time": now,
+        },
+    }
+
+
+def make_user_toast(uid: int = 10004, uname: str = "舰长甲", guard_level: int = 3, num: int = 1,
+                    anchor_uid: int = 2) -> Dict[str, Any]:
+    """构造 USER_TOAST_MSG 事件（与 GUARD_BUY 描述同一次上舰）"""
+    now = int(time.time())
+    names = {1: "总督", 2: "提督", 3: "舰长"}
+    return {
+        "cmd": "USER_TOAST_MSG",
+        "data": {
+            "anchor_show": True, "color": "#00D1F1", "dmscore": 90, "effect_id": 397,
+            "end_time": now, "face_effect_id": 44, "gift_id": 10000 + guard_level,
+            "group_name": "", "guard_level": guard_level, "is_group": 0, "num": num,
+            "op_type": 3, "payflow_id": "2404%016x" % random.getrandbits(64), "price": 138000,
+            "role_name": names.get(guard_level, "舰长"), "room_effect_id": 590, "room_gift_effect_id": 0,
+            "room_group_effect_id": 1337, "source": 0, "start_time": now,
+            "svga_block": 0, "target_guard_count": 520,
+            "toast_msg": f"<%{uname}%> 续费了{names.get(guard_level, '舰长')}",
+            "uid": uid, "unit": "月", "user_show": True, "username": uname,
+            "receiver_uinfo": _uinfo(anchor_uid, "主播", anchor_uid),
+            "sender_uinfo": _uinfo(uid, uname, anchor_uid, guard_level=guard_level),
+        },
+    }
+
+
+def make_pk_start(room_id: int = 1, battle_type: int = 1, pk_id: int = 1) -> Dict[str, Any]:
+    """构造 PK_BATTLE_START_NEW 事件"""
+    now = int(time.time())
+    return {
+        "cmd": "PK_BATTLE_START_NEW",
+        "pk_id": pk_id,
+        "pk_status": 201,
+        "timestamp": now,
+        "data": {
+            "battle_type": battle_type, "final_hit_votes": 0, "pk_start_time": now,
+            "pk_frozen_time": now + 300, "pk_end_time": now + 310, "pk_votes_type": 0,
+            "pk_votes_add": 0, "pk_votes_name": "PK值", "star_light_msg": "", "pk_countdown": now + 310,
+            "final_conf": {"switch": 1, "start_time": now + 240, "end_time": now + 300},
+            "init_info": {"room_id": room_id, "date_streak": 0},
+            "match_info": {"room_id": room_id + 1000000, "date_streak": 0},
+        },
+    }
+
+
+def make_pk_process(room_id: int = 1, self_votes: int = 0, opponent_votes: int = 0, pk_id: int = 1) -> Dict[str, Any]:
+    """构造 PK_BATTLE_PROCESS_NEW 事件"""
+    return {
+        "cmd": "PK_BATTLE_PROCESS_NEW",
+        "pk_id": pk_id,
+        "pk_status": 201,
+        "timestamp": int(time.time()),
+        "data": {
+            "battle_type": 1,
+            "init_info": {"room_id": room_id, "votes": self_votes, "best_uname": "观众甲", "vision_desc": 0},
+            "match_info": {"room_id": room_id + 1000000, "votes": opponent_votes, "best_uname": "对面观众",
+                           "vision_desc": 0},
+        },
+    }
+
+
+def make_pk_info(room_id: int = 1, self_votes: int = 0, opponent_votes: int = 0) -> Dict[str, Any]:
+    """构造 PK_INFO 事件（battle_type=2 的多人 PK 票数）"""
+    return {
+        "cmd": "PK_INFO",
+        "data": {
+            "battle_type": 2,
+            "members": [
+                {"room_id": room_id, "votes": self_votes, "golds": self_votes * 100, "uname": "主播"},
+                {"room_id": room_id + 1000000, "votes": opponent_votes, "golds": opponent_votes * 100,
+                 "uname": "对面主播"},
+            ],
+        },
+    }
+
+
+def make_pk_end(room_id: int = 1, pk_id: int = 1) -> Dict[str, Any]:
+    """构造 PK_BATTLE_END 事件"""
+    return {
+        "cmd": "PK_BATTLE_END",
+        "pk_id": str(pk_id),
+        "pk_status": 401,
+        "timestamp": int(time.time()),
+        "data": {"battle_type": 1, "timer": 10,
+                 "init_info": {"room_id": room_id, "votes": 0, "winner_type": 2},
+                 "match_info": {"room_id": room_id + 1000000, "votes": 0, "winner_type": -1}},
+    }
@@ -0,0 +1,236 @@
+"""SQLite 事件归档
+
+把解析后的事件解码为列写入 SQLite（WAL 模式），按 cmd 分表：
+  danmaku      弹幕（uid、用户名、内容、大航海等级、粉丝勋章等级）
+  gifts        礼物（gift_id、礼物名、数量、单价、货币类型、金瓜子价值、盲盒原价）
+  guards       上舰（GUARD_BUY 与 USER_TOAST_MSG，source 列区分，统计流水时只取 GUARD_BUY）
+  entries      进场（privilege_type）
+  super_chats  醒目留言（价格、价值、内容）
+  pk           PK 票数更新与开始/结束（pk_id、battle_type、本方/对方票数）
+每张表都有 (room_id, ts) 索引，带 uid 的表另有 uid 索引。
+
+处理线程上只做一次队列 put；解码与写入都在单独的写线程中进行：每批最多 batch_size 条或等待
+max_delay 秒，一批在一个事务中 executemany 写入。队列满时丢弃并计数。所有房间共享一个写线程与数据库文件。
+
+指标：
+  event_archive_sqlite_rows_total{table}     写入行数（用 rate() 计算吞吐）
+  event_archive_sqlite_batch_seconds         每批事务耗时
+  event_archive_sqlite_lag_seconds           最近一批中最早的事件从入队到提交的时间
+  event_archive_sqlite_queue_depth           待写入的事件数
+  event_archive_sqlite_dropped_total         队列满时丢弃的事件数
+  event_archive_sqlite_errors_total          写入失败的批次数
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from .event_archive import archive_row
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("event_archive_sqlite_rows_total", "写入 SQLite 归档的行数")
+metrics.describe("event_archive_sqlite_batch_seconds", "SQLite 归档每批事务的耗时")
+metrics.describe("event_archive_sqlite_lag_seconds", "SQLite 归档最近一批中最早的事件从入队到提交的时间")
+metrics.describe("event_archive_sqlite_queue_depth", "等待写入 SQLite 归档的事件数")
+metrics.describe("event_archive_sqlite_dropped_total", "SQLite 归档队列满时丢弃的事件数")
+metrics.describe("event_archive_sqlite_errors_total", "SQLite 归档写入失败的批次数")
+
+BATCH_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# 表名 -> 除 id、room_id、ts、raw 之外的列
+TABLES: Dict[str, Tuple[str, ...]] = {
+    "danmaku": ("uid INTEGER", "uname TEXT", "text TEXT", "guard_level INTEGER", "medal_level INTEGER"),
+    "gifts": ("uid INTEGER", "uname TEXT", "gift_id INTEGER", "gift_name TEXT", "num INTEGER", "price INTEGER",
+              "coin_type TEXT", "value INTEGER", "blind_original INTEGER"),
+    "guards": ("uid INTEGER", "uname TEXT", "guard_level INTEGER", "num INTEGER", "value INTEGER", "source TEXT"),
+    "entries": ("uid INTEGER", "uname TEXT", "privilege_type INTEGER"),
+    "super_chats": ("uid INTEGER", "uname TEXT", "price INTEGER", "value INTEGER", "text TEXT"),
+    "pk": ("cmd TEXT", "pk_id INTEGER", "battle_type INTEGER", "self_votes INTEGER", "opponent_votes INTEGER"),
+}
+
+CMD_TABLES = {
+    "DANMU_MSG": "danmaku",
+    "SEND_GIFT": "gifts",
+    "GUARD_BUY": "guards",
+    "USER_TOAST_MSG": "guards",
+    "ENTRY_EFFECT": "entries",
+    "SUPER_CHAT_MESSAGE": "super_chats",
+    "PK_BATTLE_START_NEW": "pk",
+    "PK_BATTLE_PROCESS_NEW": "pk",
+    "PK_INFO": "pk",
+    "PK_BATTLE_END": "pk",
+}
+
+_STOP = object()
+
+
+def _at(value: Any, *path: Any) -> Any:
+    """按下标/键逐层取值，任一层不存在时返回 None"""
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return value
+
+
+def decode_event(message: Dict[str, Any], ts: float, room_id: int) -> Optional[Tuple[str, Tuple[Any, ...]]]:
+    """把消息解码为 (表名, 列值)；列值顺序为 room_id、ts、TABLES 中的列"""
+    table = CMD_TABLES.get(message.get("cmd"))
+    row = archive_row(message, ts, room_id) if table else None
+    if row is None:
+        return None
+    cmd, uid, v1, v2, v3, v4 = row[2:]
+    data = message.get("data") or {}
+    if table == "danmaku":
+        info = message.get("info")
+        values: Tuple[Any, ...] = (uid, _at(info, 2, 1), _at(info, 1), _at(info, 7), _at(info, 3, 0))
+    elif table == "gifts":
+        values = (uid, data.get("uname"), v1, data.get("giftName"), v2, data.get("price"), data.get("coin_type"),
+                  v3, v4)
+    elif table == "guards":
+        values = (uid, data.get("username"), v1, v2, v3, cmd)
+    elif table == "entries":
+        uname = _at(data, "uinfo", "base", "name")
+        values = (uid, uname, v1)
+    elif table == "super_chats":
+        values = (uid, _at(data, "user_info", "uname"), data.get("price"), v1, data.get("message"))
+    else:
+        values = (cmd, v1, v2, v3, v4)
+    return table, (room_id, row[0]) + values
+
+
+class SqliteArchive:
+    """批量写入 SQLite 的事件归档（单个写线程）"""
+
+    def __init__(self, path: str, batch_size: int = 500, max_delay: float = 1.0, queue_size: int = 100000,
+                 store_raw: bool = False):
+        """
+        Args:
+            path: 数据库文件
+            batch_size: 每个事务最多写入的事件数
+            max_delay: 凑批的最长等待时间（秒），也是事件入队到写入的最长延迟（不含事务耗时）
+            queue_size: 队列长度上限，满时丢弃新事件
+            store_raw: 是否在 raw 列保存原始消息 JSON（体积约大 10 倍）
+        """
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.max_delay = float(max_delay)
+        self.store_raw = bool(store_raw)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.lag = 0.0
+        self._inserts = {
+            table: f"INSERT INTO {table} (room_id, ts, {', '.join(c.split()[0] for c in columns)}, raw) "
+                   f"VALUES ({', '.join('?' * (len(columns) + 3))})"
+            for table, columns in TABLES.items()
+        }
+        metrics.register_collector(self._collect_metrics)
+
+    def put(self, room_id: int, message: Dict[str, Any]) -> None:
+        """在处理线程上调用：只入队，解码与写入在写线程中进行"""
+        if message.get("cmd") not in CMD_TABLES:
+            return
+        try:
+            self._queue.put_nowait((time.time(), room_id, message))
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("event_archive_sqlite_dropped_total")
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-archive", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """写完队列中已有的事件后停止写线程"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("⚠️ SQLite 归档队列已满，退出时未能写完全部事件")
+            return
+        self._thread.join(timeout)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            for table, columns in TABLES.items():
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, room_id INTEGER NOT NULL, "
+                             f"ts REAL NOT NULL, {', '.join(columns)}, raw TEXT)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_room_ts ON {table} (room_id, ts)")
+                if any(column.startswith("uid ") for column in columns):
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_uid ON {table} (uid)")
+        return conn
+
+    def _run(self) -> None:
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            logger.error(f"❌ 打开 SQLite 归档 {self.path} 失败: {e}")
+            return
+        logger.info(f"🗄️ SQLite 事件归档写入 {self.path}")
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(conn, batch)
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[Tuple[float, int, Dict[str, Any]]]) -> None:
+        """解码一批事件并在一个事务中写入"""
+        rows: Dict[str, List[Tuple[Any, ...]]] = {}
+        for ts, room_id, message in batch:
+            decoded = decode_event(message, ts, room_id)
+            if decoded is None:
+                continue
+            table, values = decoded
+            raw = json.dumps(message, ensure_ascii=False) if self.store_raw else None
+            rows.setdefault(table, []).append(values + (raw,))
+
+        started = time.perf_counter()
+        try:
+            with conn:
+                for table, table_rows in rows.items():
+                    conn.executemany(self._inserts[table], table_rows)
+        except sqlite3.Error as e:
+            metrics.inc("event_archive_sqlite_errors_total")
+            logger.error(f"❌ 写入 SQLite 归档失败（丢弃 {len(batch)} 条事件）: {e}")
+            return
+        metrics.observe("event_archive_sqlite_batch_seconds", time.perf_counter() - started, BATCH_BUCKETS)
+        self.lag = time.time() - batch[0][0]
+        for table, table_rows in rows.items():
+            self.written += len(table_rows)
+            metrics.inc("event_archive_sqlite_rows_total", len(table_rows), table=table)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"written": self.written, "dropped": self.dropped, "queue_depth": self._queue.qsize(), "lag": self.lag}
+
+    def _collect_metrics(self) -> None:
+        metrics.set_gauge("event_archive_sqlite_queue_depth", self._queue.qsize())
+        metrics.set_gauge("event_archive_sqlite_lag_seconds", self.lag)
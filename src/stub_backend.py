@@ -0,0 +1,268 @@
+"""本地桩后端
+
+模拟 8081 后端的全部接口（ticket、setting、chatbot、sendlike、guard_mode、pk_wanzun、
+money、guard、entry_welcome、live_room_spider），支持：
+  - 可配置的响应延迟与错误注入（全局或按端点）
+  - 记录收到的请求体（支持批量数组、gzip、MessagePack）
+  - GET /_stats 返回各端点的请求数、事件数、带 X-Trace-Id 的请求数与最近一段时间的请求速率
+  - GET /_payloads?endpoint=money&limit=20 返回最近收到的请求体
+  - POST /_config 运行时调整延迟与错误注入
+不需要网络即可在单机上对客户端做压测和联调。
+
+用法：
+    python -m src.stub_backend --port 8081 --latency-ms 20 --error-rate 0.05
+    python -m src.stub_backend --endpoint-latency pk_wanzun=5 --endpoint-error money=0.5
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Deque, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+from .payload_encoding import decode_body
+from .api_batcher import unwrap_batch
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = [
+    "ticket", "setting", "chatbot", "sendlike", "guard_mode",
+    "pk_wanzun", "money", "guard", "entry_welcome", "live_room_spider",
+]
+
+
+class StubState:
+    """桩后端的配置与统计（多线程共享）"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, error_status: int = 500,
+                 keep_payloads: int = 1000):
+        self.latency_ms = float(latency_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.error_rate = float(error_rate)
+        self.error_status = int(error_status)
+        self.endpoint_latency_ms: Dict[str, float] = {}
+        self.endpoint_error_rate: Dict[str, float] = {}
+        self.keep_payloads = int(keep_payloads)
+
+        self.started_at = time.time()
+        self.requests: Dict[str, int] = {}
+        self.events: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.bytes_in: Dict[str, int] = {}
+        self.traced: Dict[str, int] = {}
+        self.payloads: Dict[str, Deque[Any]] = {}
+        self._recent: Deque[tuple] = deque()
+        self._lock = threading.Lock()
+
+    def latency_for(self, endpoint: str) -> float:
+        base = self.endpoint_latency_ms.get(endpoint, self.latency_ms)
+        if self.jitter_ms:
+            base += random.uniform(0, self.jitter_ms)
+        return max(0.0, base) / 1000.0
+
+    def should_fail(self, endpoint: str) -> bool:
+        return random.random() < self.endpoint_error_rate.get(endpoint, self.error_rate)
+
+    def record(self, endpoint: str, body: Any, size: int, failed: bool, trace_id: Optional[str] = None) -> None:
+        events = unwrap_batch(body)
+        now = time.time()
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if trace_id:
+                self.traced[endpoint] = self.traced.get(endpoint, 0) + 1
+            self.bytes_in[endpoint] = self.bytes_in.get(endpoint, 0) + size
+            if failed:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+                return
+            self.events[endpoint] = self.events.get(endpoint, 0) + len(events)
+            stored = self.payloads.setdefault(endpoint, deque(maxlen=self.keep_payloads))
+            stored.extend(events)
+            self._recent.append((now, endpoint, len(events)))
+            while self._recent and now - self._recent[0][0] > 10:
+                self._recent.popleft()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            window = min(10.0, max(1e-6, now - self.started_at))
+            rates: Dict[str, Dict[str, float]] = {}
+            for ts, endpoint, count in self._recent:
+                if now - ts <= window:
+                    rate = rates.setdefault(endpoint, {"requests_per_sec": 0.0, "events_per_sec": 0.0})
+                    rate["requests_per_sec"] += 1 / window
+                    rate["events_per_sec"] += count / window
+            return {
+                "uptime_sec": now - self.started_at,
+                "requests": dict(self.requests),
+                "events": dict(self.events),
+                "errors": dict(self.errors),
+                "bytes_in": dict(self.bytes_in),
+                "traced": dict(self.traced),
+                "rates": rates,
+                "config": {
+                    "latency_ms": self.latency_ms,
+                    "jitter_ms": self.jitter_ms,
+                    "error_rate": self.error_rate,
+                    "error_status": self.error_status,
+                    "endpoint_latency_ms": dict(self.endpoint_latency_ms),
+                    "endpoint_error_rate": dict(self.endpoint_error_rate),
+                },
+            }
+
+    def recent_payloads(self, endpoint: str, limit: int) -> List[Any]:
+        with self._lock:
+            return list(self.payloads.get(endpoint, ()))[-limit:]
+
+    def update_config(self, config: Dict[str, Any]) -> None:
+        with self._lock:
+            for key in ("latency_ms", "jitter_ms", "error_rate"):
+                if key in config:
+                    setattr(self, key, float(config[key]))
+            if "error_status" in config:
+                self.error_status = int(config["error_status"])
+            if isinstance(config.get("endpoint_latency_ms"), dict):
+                self.endpoint_latency_ms.update({k: float(v) for k, v in config["endpoint_latency_ms"].items()})
+            if isinstance(config.get("endpoint_error_rate"), dict):
+                self.endpoint_error_rate.update({k: float(v) for k, v in config["endpoint_error_rate"].items()})
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """桩后端的请求处理"""
+
+    server_version = "TofuStubBackend/1.0"
+    state: StubState = None  # 由 make_server 绑定
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("stub: " + format % args)
+
+    def _reply(self, status: int, body: Any) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/_stats":
+            self._reply(200, self.state.stats())
+        elif url.path == "/_payloads":
+            query = parse_qs(url.query)
+            endpoint = query.get("endpoint", [""])[0]
+            limit = int(query.get("limit", ["20"])[0])
+            self._reply(200, self.state.recent_payloads(endpoint, limit))
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        if url.path == "/_config":
+            try:
+                self.state.update_config(json.loads(raw.decode("utf-8") or "{}"))
+            except (ValueError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+                return
+            self._reply(200, self.state.stats()["config"])
+            return
+
+        endpoint = url.path.strip("/")
+        if endpoint not in ENDPOINTS:
+            self._reply(404, {"error": f"unknown endpoint {endpoint}"})
+            return
+        try:
+            body = decode_body(raw, self.headers.get("Content-Type"), self.headers.get("Content-Encoding"))
+        except (ValueError, OSError) as e:
+            self.state.record(endpoint, None, len(raw), failed=True)
+            self._reply(400, {"error": f"invalid body: {e}"})
+            return
+
+        trace_id = self.headers.get("X-Trace-Id")
+        if trace_id:
+            logger.debug(f"stub: trace={trace_id} /{endpoint}")
+        delay = self.state.latency_for(endpoint)
+        if delay:
+            time.sleep(delay)
+        if self.state.should_fail(endpoint):
+            self.state.record(endpoint, body, len(raw), failed=True, trace_id=trace_id)
+            self._reply(self.state.error_status, {"error": "injected failure"})
+            return
+        self.state.record(endpoint, body, len(raw), failed=False, trace_id=trace_id)
+        self._reply(200, {"code": 0, "received": len(unwrap_batch(body))})
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8081, state: Optional[StubState] = None) -> ThreadingHTTPServer:
+    """创建桩后端服务器（未启动），port=0 时自动分配端口"""
+    state = state or StubState()
+    handler = type("BoundStubRequestHandler", (StubRequestHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def start_in_background(host: str = "127.0.0.1", port: int = 0, **state_kwargs: Any) -> ThreadingHTTPServer:
+    """在后台线程中启动桩后端，返回服务器对象（server.server_address 为实际地址）"""
+    server = make_server(host, port, StubState(**state_kwargs))
+    threading.Thread(target=server.serve_forever, name="stub-backend", daemon=True).start()
+    return server
+
+
+def _parse_pairs(pairs: List[str]) -> Dict[str, float]:
+    result = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        result[key.strip()] = float(value)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tofu Danmaku 本地桩后端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的固定延迟(毫秒)")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="额外的随机延迟上限(毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0, help="错误注入比例 0~1")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误时返回的状态码")
+    parser.add_argument("--endpoint-latency", nargs="*", metavar="EP=MS", help="按端点覆盖延迟，如 money=50")
+    parser.add_argument("--endpoint-error", nargs="*", metavar="EP=RATE", help="按端点覆盖错误比例，如 guard=0.5")
+    parser.add_argument("--keep-payloads", type=int, default=1000, help="每个端点保留最近多少条请求体")
+    parser.add_argument("--stats-interval", type=float, default=10, help="打印请求速率的间隔(秒)，0 表示不打印")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    state = StubState(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.keep_payloads)
+    state.endpoint_latency_ms.update(_parse_pairs(args.endpoint_latency))
+    state.endpoint_error_rate.update(_parse_pairs(args.endpoint_error))
+    server = make_server(args.host, args.port, state)
+    logger.info(f"🧪 桩后端已启动: http://{args.host}:{server.server_address[1]} （统计: /_stats）")
+
+    if args.stats_interval > 0:
+        def report() -> None:
+            while True:
+                time.sleep(args.stats_interval)
+                rates = state.stats()["rates"]
+                if rates:
+                    logger.info("📈 " + ", ".join(
+                        f"{ep}={r['requests_per_sec']:.1f}req/s({r['events_per_sec']:.1f}ev/s)"
+                        for ep, r in sorted(rates.items())))
+        threading.Thread(target=report, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""端到端延迟追踪
+
+一条消息从B站服务器到后端确认经过的追踪点：
+  服务器时间戳 → 收到帧 → 解压完成 → JSON 解码 → 处理器开始 → API 入队 → API 响应
+相邻追踪点的耗时按 cmd / 端点写入直方图：
+  trace_server_lag_seconds{cmd}                 服务器时间戳 → 收到帧（含时钟偏差，DANMU_MSG 为毫秒精度，其余多为秒级）
+  trace_stage_seconds{cmd, stage}               decompress（按帧内每条消息各记一次）/ decode / dispatch / handler
+  trace_api_seconds{cmd, endpoint, stage}       send（入队→响应，含通道排队）/ local（收到帧→响应）/ total（服务器时间戳→响应）
+按 TRACE_SAMPLE_RATE 抽样的请求会附带 X-Trace-Id 请求头，并以 DEBUG 级别记录完整时间线，方便与后端日志对照。
+
+追踪上下文保存在线程局部变量中：处理器在解析线程里调用 APIClient.post 时自动关联；
+经礼物连击合并或批量发送的请求不在解析线程发出，只记录到入队为止。
+"""
+
+import random
+import threading
+import time
+import uuid
+import logging
+from typing import Dict, Any, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Trace-Id"
+
+# 进程内各阶段多在亚毫秒级，分桶比默认的更细
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0)
+
+metrics.describe("trace_server_lag_seconds", "B站服务器时间戳到收到帧的延迟")
+metrics.describe("trace_stage_seconds", "消息在进程内各阶段的耗时")
+metrics.describe("trace_api_seconds", "消息触发的 API 请求耗时")
+
+
+def _to_seconds(value: Any) -> Optional[float]:
+    """时间戳统一换算为秒（B站各消息分别使用秒、毫秒、纳秒）"""
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+        return None
+    if value > 1e15:
+        return value / 1e9
+    if value > 1e12:
+        return value / 1000.0
+    return float(value)
+
+
+def server_timestamp(message: Dict[str, Any]) -> Optional[float]:
+    """提取消息自带的服务器时间戳（秒），没有时返回 None"""
+    try:
+        if message.get("cmd") == "DANMU_MSG":
+            info = message.get("info") or []
+            # info[0][4] 为毫秒时间戳；退回 info[9].ts（秒）
+            if info and isinstance(info[0], list) and len(info[0]) > 4:
+                ts = _to_seconds(info[0][4])
+                if ts and info[0][4] > 1e12:
+                    return ts
+            for part in info:
+                if isinstance(part, dict) and "ts" in part:
+                    return _to_seconds(part["ts"])
+            return None
+        data = message.get("data")
+        if isinstance(data, dict):
+            for key in ("timestamp", "send_time", "trigger_time", "start_time"):
+                ts = _to_seconds(data.get(key))
+                if ts:
+                    return ts
+        return _to_seconds(message.get("timestamp") or message.get("send_time"))
+    except (TypeError, IndexError, AttributeError):
+        return None
+
+
+class FrameTimer:
+    """一个 WebSocket 帧的接收与解压时刻"""
+
+    __slots__ = ("received", "received_wall", "decompressed")
+
+    def __init__(self):
+        self.received = time.perf_counter()
+        self.received_wall = time.time()
+        self.decompressed: Optional[float] = None
+
+
+class EventTrace:
+    """一条业务消息的追踪点"""
+
+    __slots__ = ("cmd", "trace_id", "server_ts", "frame", "decoded", "handler_start", "enqueued")
+
+    def __init__(self, cmd: str, frame: FrameTimer, decoded: float, server_ts: Optional[float],
+                 trace_id: Optional[str]):
+        self.cmd = cmd
+        self.frame = frame
+        self.decoded = decoded
+        self.server_ts = server_ts
+        self.trace_id = trace_id
+        self.handler_start: Optional[float] = None
+        # 第一次 API 入队时刻，作为处理器阶段的终点
+        self.enqueued: Optional[float] = None
+
+
+class ApiTrace:
+    """消息触发的一次 API 请求：同一条消息可能先后入队多个端点，send 阶段各自从入队时刻算起"""
+
+    __slots__ = ("event", "trace_id", "enqueued")
+
+    def __init__(self, event: EventTrace, enqueued: float):
+        self.event = event
+        self.trace_id = event.trace_id
+        self.enqueued = enqueued
+
+
+class Tracer:
+    """追踪点记录器；enabled=False 时所有方法立即返回"""
+
+    def __init__(self, enabled: bool = True, sample_rate: float = 0.01):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self._local = threading.local()
+
+    def frame(self) -> Optional[FrameTimer]:
+        """收到一个 WebSocket 帧"""
+        return FrameTimer() if self.enabled else None
+
+    @staticmethod
+    def frame_decompressed(frame: Optional[FrameTimer]) -> None:
+        if frame is not None and frame.decompressed is None:
+            frame.decompressed = time.perf_counter()
+
+    def begin_event(self, frame: Optional[FrameTimer], message: Any) -> Optional[EventTrace]:
+        """JSON 解码完成，开始追踪这条消息（成为当前线程的追踪上下文）"""
+        if frame is None or not isinstance(message, dict):
+            return None
+        decoded = time.perf_counter()
+        cmd = str(message.get("cmd", "") or "unknown")
+        server_ts = server_timestamp(message)
+        trace_id = uuid.uuid4().hex[:16] if random.random() < self.sample_rate else None
+        trace = EventTrace(cmd, frame, decoded, server_ts, trace_id)
+
+        if server_ts:
+            metrics.observe("trace_server_lag_seconds", max(0.0, frame.received_wall - server_ts), LAG_BUCKETS,
+                            cmd=cmd)
+        if frame.decompressed is not None:
+            metrics.observe("trace_stage_seconds", frame.decompressed - frame.received, STAGE_BUCKETS,
+                            cmd=cmd, stage="decompress")
+        metrics.observe("trace_stage_seconds", decoded - (frame.decompressed or frame.received), STAGE_BUCKETS,
+                        cmd=cmd, stage="decode")
+        self._local.trace = trace
+        return trace
+
+    def end_event(self) -> None:
+        self._local.trace = None
+
+    def current(self) -> Optional[EventTrace]:
+        return getattr(self._local, "trace", None) if self.enabled else None
+
+    def handler_started(self) -> None:
+        """处理器开始处理当前消息"""
+        trace = self.current()
+        if trace is not None and trace.handler_start is None:
+            trace.handler_start = time.perf_counter()
+            metrics.observe("trace_stage_seconds", trace.handler_start - trace.decoded, STAGE_BUCKETS,
+                            cmd=trace.cmd, stage="dispatch")
+
+    def enqueued(self, endpoint: str) -> Optional[ApiTrace]:
+        """当前消息触发了一次 API 请求；返回这次请求的追踪上下文，由调用方带到发送线程"""
+        trace = self.current()
+        if trace is None:
+            return None
+        now = time.perf_counter()
+        if trace.enqueued is None:
+            trace.enqueued = now
+            metrics.observe("trace_stage_seconds", now - (trace.handler_start or trace.decoded), STAGE_BUCKETS,
+                            cmd=trace.cmd, stage="handler")
+        return ApiTrace(trace, now)
+
+    def responded(self, request: Optional[ApiTrace], endpoint: str, success: bool) -> None:
+        """收到 API 响应（可能在通道工作线程中调用）"""
+        if request is None:
+            return
+        trace = request.event
+        now = time.perf_counter()
+        send = now - request.enqueued
+        local = now - trace.frame.received
+        metrics.observe("trace_api_seconds", send, cmd=trace.cmd, endpoint=endpoint, stage="send")
+        metrics.observe("trace_api_seconds", local, cmd=trace.cmd, endpoint=endpoint, stage="local")
+        total = None
+        if trace.server_ts:
+            total = max(0.0, trace.frame.received_wall + local - trace.server_ts)
+            metrics.observe("trace_api_seconds", total, LAG_BUCKETS, cmd=trace.cmd, endpoint=endpoint, stage="total")
+        if trace.trace_id:
+            frame = trace.frame
+            logger.debug(
+                f"🧭 trace={trace.trace_id} cmd={trace.cmd} /{endpoint} {'成功' if success else '失败'}: "
+                f"服务器→收到={_ms((frame.received_wall - trace.server_ts) if trace.server_ts else None)} "
+                f"解压={_ms((frame.decompressed - frame.received) if frame.decompressed else None)} "
+                f"解码={_ms(trace.decoded - (frame.decompressed or frame.received))} "
+                f"分发={_ms((trace.handler_start - trace.decoded) if trace.handler_start else None)} "
+                f"处理={_ms(trace.enqueued - (trace.handler_start or trace.decoded))} "
+                f"请求={_ms(send)} 合计={_ms(total)}"
+            )
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
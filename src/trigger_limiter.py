@@ -0,0 +1,56 @@
+"""弹幕触发限流
+
+同一个用户反复发送"豆豆"会让 DanmakuHandler 每条弹幕都调用一次 /chatbot（带"点赞"时还有 /sendlike），
+既占用后端也消耗大模型额度。这里按触发类型（chatbot / sendlike / setting）分别设置两级令牌桶：
+  - 每个用户一个桶（放在有上限的 LRU 中），限制单个用户的刷屏
+  - 每个房间一个桶，限制整个房间的触发总量
+任一级令牌不足时本次触发被抑制，计入 danmaku_triggers_suppressed_total{room, trigger, scope}。
+"""
+
+import logging
+from typing import Dict, Any, Optional
+
+from .metrics import metrics
+from .rate_limit import TokenBucket, KeyedTokenBuckets
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("danmaku_triggers_suppressed_total", "被限流抑制的弹幕触发次数")
+
+
+class TriggerRateLimiter:
+    """单个房间的弹幕触发限流器"""
+
+    def __init__(self, room_id: int, limits: Dict[str, Dict[str, float]], max_users: int = 10000):
+        """
+        Args:
+            room_id: 房间ID
+            limits: {触发类型: {"user_rate", "user_burst", "room_rate", "room_burst"}}，
+                    速率单位为 次/秒，<=0 表示该级不限流；未列出的触发类型不限流
+            max_users: 每种触发类型最多保留的用户桶数
+        """
+        self.room_id = room_id
+        self._users: Dict[str, KeyedTokenBuckets] = {}
+        self._rooms: Dict[str, TokenBucket] = {}
+        for trigger, limit in (limits or {}).items():
+            self._users[trigger] = KeyedTokenBuckets(limit.get("user_rate", 0), limit.get("user_burst", 1), max_users)
+            self._rooms[trigger] = TokenBucket(limit.get("room_rate", 0), limit.get("room_burst", 1))
+
+    def allow(self, trigger: str, uid: Optional[Any]) -> bool:
+        """本次触发是否放行"""
+        users = self._users.get(trigger)
+        if users is None:
+            return True
+        scope = None
+        if uid is not None and not users.try_acquire(uid):
+            scope = "user"
+        elif not self._rooms[trigger].try_acquire():
+            scope = "room"
+            # 房间额度不足时本次并未触发，退还用户令牌，避免该用户下一次正常触发被误抑制
+            if uid is not None:
+                users.refund(uid)
+        if scope is None:
+            return True
+        metrics.inc("danmaku_triggers_suppressed_total", room=self.room_id, trigger=trigger, scope=scope)
+        logger.info(f"🚦 抑制 {trigger} 触发：uid={uid or '-'} 超出{'用户' if scope == 'user' else '房间'}限额")
+        return False
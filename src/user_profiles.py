@@ -0,0 +1,232 @@
+"""用户资料缓存
+
+同一批观众会反复发弹幕、送礼、进场，每次处理器都要从 uinfo（DANMU_MSG 的 info[0][15].user、
+SEND_GIFT 的 sender_uinfo、ENTRY_EFFECT 的 uinfo）深层结构里重新取头像、名字颜色、勋章、财富与大航海等级。
+这里按 (room_id, uid) 缓存提取结果（大航海等级、勋章都与房间相关）：
+  - 缓存未过期（ttl 秒内）且资料完整时直接复用，不再遍历嵌套结构；缓存中有字段缺失或为空
+    （例如先收到的弹幕里没有勋章、财富等级）时，用本条消息的 uinfo 补齐
+  - 过期或首次出现时重新提取，新值覆盖旧值，本次消息缺失的字段保留缓存中的值，
+    因此资料会逐渐补全为各类消息中最完整的版本
+  - 上舰后调用 invalidate，下一条消息重新提取
+缓存按 LRU 淘汰，最多 max_entries 条。
+
+attach 模式为 "changed" 时，同一版本的资料只随第一条请求完整发送，之后的请求只带 uid 与
+profile_version，由后端按 uid 缓存（需后端支持；默认 "full" 每次完整发送）。
+
+指标：
+  user_profile_cache_hits_total / user_profile_cache_misses_total{reason}   命中与未命中次数
+  user_profile_cache_entries、user_profile_cache_bytes                       条目数与估算内存
+"""
+
+import sys
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("user_profile_cache_hits_total", "用户资料缓存命中次数")
+metrics.describe("user_profile_cache_misses_total", "用户资料缓存未命中次数")
+metrics.describe("user_profile_cache_entries", "用户资料缓存条目数")
+metrics.describe("user_profile_cache_bytes", "用户资料缓存估算占用内存（抽样）")
+
+# attach 模式为 "changed" 时可以省略的资料字段
+PROFILE_FIELDS = ("face", "name_color", "wealth_level", "medal", "official_role", "official_title")
+
+# 缓存命中时检查的字段：任一缺失或为空时用本条消息的 uinfo 补齐
+FILL_FIELDS = ("uname", "face", "name_color", "wealth_level", "guard_level", "medal")
+
+
+def _incomplete(profile: Dict[str, Any]) -> bool:
+    return any(profile.get(field) is None for field in FILL_FIELDS)
+
+
+def profile_from_uinfo(uinfo: Any) -> Dict[str, Any]:
+    """从 uinfo 结构提取用户资料
+
+    取值与各处理器原先的逐条解析一致：uinfo 中存在的字段原样保留（包括空字符串与 None，
+    例如 wealth.level 为 None 时 /money 仍会带上 wealth_level: null），是否发送由调用方按原有条件判断。
+    """
+    profile: Dict[str, Any] = {}
+    if not isinstance(uinfo, dict):
+        return profile
+    base = uinfo.get("base")
+    if isinstance(base, dict):
+        profile["uname"] = base.get("name")
+        profile["face"] = base.get("face")
+        profile["name_color"] = base.get("name_color_str") or base.get("name_color")
+        official = base.get("official_info")
+        if isinstance(official, dict):
+            profile["official_role"] = official.get("role")
+            profile["official_title"] = official.get("title")
+    wealth = uinfo.get("wealth")
+    if isinstance(wealth, dict) and "level" in wealth:
+        profile["wealth_level"] = wealth.get("level")
+    guard = uinfo.get("guard")
+    if isinstance(guard, dict) and "level" in guard:
+        profile["guard_level"] = guard.get("level")
+    guard_leader = uinfo.get("guard_leader")
+    if isinstance(guard_leader, dict):
+        profile["is_guard_leader"] = bool(guard_leader.get("is_guard_leader"))
+    medal = uinfo.get("medal")
+    if isinstance(medal, dict):
+        profile["medal"] = {
+            "name": medal.get("name"),
+            "level": medal.get("level"),
+            "is_light": medal.get("is_light"),
+            "ruid": medal.get("ruid"),
+            "guard_level": medal.get("guard_level"),
+            "color": medal.get("color"),
+            "color_start": medal.get("color_start"),
+            "color_end": medal.get("color_end"),
+            "color_border": medal.get("color_border"),
+        }
+    return profile
+
+
+def _deep_size(obj: Any) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_size(v) for v in obj)
+    return size
+
+
+class _Entry:
+    __slots__ = ("profile", "version", "sent_version", "updated")
+
+    def __init__(self, profile: Dict[str, Any], updated: float):
+        self.profile = profile
+        self.version = 1
+        self.sent_version = 0
+        self.updated = updated
+
+
+class UserProfileCache:
+    """按 (room_id, uid) 缓存的用户资料（LRU）"""
+
+    def __init__(self, max_entries: int = 50000, ttl: float = 600.0, attach: str = "full", size_sample: int = 50):
+        """
+        Args:
+            max_entries: 最多缓存的用户数，<=0 表示不缓存（每次都重新提取）
+            ttl: 缓存资料的有效期（秒），过期后下一条消息重新提取
+            attach: "full" 每次请求都带完整资料 / "changed" 资料变化后只完整发送一次
+            size_sample: 估算内存时抽样的条目数
+        """
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self.attach_mode = attach
+        self.size_sample = max(1, int(size_sample))
+        self._entries: "OrderedDict[Tuple[int, Any], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        metrics.register_collector(self._collect_metrics)
+
+    def lookup(self, room_id: int, uid: Any, uinfo: Any) -> Dict[str, Any]:
+        """返回用户资料；缓存有效时不解析 uinfo。返回的字典由缓存持有，调用方不要修改"""
+        if uid is None or self.max_entries <= 0:
+            return profile_from_uinfo(uinfo)
+        key = (room_id, uid)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.updated < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                profile = entry.profile
+            else:
+                profile = None
+        if profile is not None:
+            metrics.inc("user_profile_cache_hits_total")
+            if uinfo is not None and _incomplete(profile):
+                profile = self._fill(key, profile, profile_from_uinfo(uinfo))
+            return profile
+
+        fresh = profile_from_uinfo(uinfo)
+        with self._lock:
+            self.misses += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(fresh, now)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                reason = "new"
+            else:
+                merged = dict(entry.profile)
+                merged.update(fresh)
+                if merged != entry.profile:
+                    entry.profile = merged
+                    entry.version += 1
+                entry.updated = now
+                self._entries.move_to_end(key)
+                reason = "expired"
+            profile = entry.profile
+        metrics.inc("user_profile_cache_misses_total", reason=reason)
+        return profile
+
+    def _fill(self, key: Tuple[int, Any], profile: Dict[str, Any], fresh: Dict[str, Any]) -> Dict[str, Any]:
+        """用本条消息的资料补齐缓存中缺失或为空的字段（已有的值保持不变）"""
+        missing = {k: v for k, v in fresh.items() if v is not None and profile.get(k) is None}
+        if not missing:
+            return profile
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return dict(profile, **missing)
+            merged = dict(entry.profile)
+            merged.update({k: v for k, v in missing.items() if merged.get(k) is None})
+            if merged != entry.profile:
+                entry.profile = merged
+                entry.version += 1
+            return entry.profile
+
+    def invalidate(self, room_id: int, uid: Any) -> None:
+        """资料已变化（如上舰），下一条消息重新提取"""
+        with self._lock:
+            entry = self._entries.get((room_id, uid))
+            if entry is not None:
+                entry.updated = float("-inf")
+
+    def attach(self, room_id: int, uid: Any, block: Dict[str, Any], fields: Iterable[str] = PROFILE_FIELDS) -> None:
+        """按 attach 模式裁剪请求体中的资料字段（就地修改 block）"""
+        if self.attach_mode != "changed" or uid is None:
+            return
+        with self._lock:
+            entry = self._entries.get((room_id, uid))
+            if entry is None:
+                return
+            version = entry.version
+            already_sent = entry.sent_version == version
+            entry.sent_version = version
+        if already_sent:
+            for field in fields:
+                block.pop(field, None)
+        block["profile_version"] = version
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率与内存估算"""
+        with self._lock:
+            total = self.hits + self.misses
+            entries = len(self._entries)
+            sample = [e.profile for _, e in zip(range(self.size_sample), reversed(self._entries.values()))]
+            hit_ratio = self.hits / total if total else 0.0
+        per_entry = (sum(_deep_size(p) for p in sample) / len(sample) if sample else 0) + \
+            sys.getsizeof(_Entry({}, 0.0)) + 64  # 键元组与 OrderedDict 节点的粗略开销
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": hit_ratio,
+            "approx_bytes": int(per_entry * entries),
+        }
+
+    def _collect_metrics(self) -> None:
+        stats = self.stats()
+        metrics.set_gauge("user_profile_cache_entries", stats["entries"])
+        metrics.set_gauge("user_profile_cache_bytes", stats["approx_bytes"])
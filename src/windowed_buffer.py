@@ -0,0 +1,149 @@
+"""按键合并的窗口缓冲
+
+礼物连击聚合与上舰事件关联都是同一种模式：记录按键缓存一个时间窗口（从第一条记录到达开始计时），
+窗口内同键的后续记录合并进来，窗口结束、合并完成或提前刷新时输出一条记录。
+这里实现缓存、到期线程、刷新与停止，子类只定义键与合并逻辑。
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WindowedBuffer:
+    """按键合并的窗口缓冲基类
+
+    子类实现：
+      _key(...)          记录的合并键，None 表示不合并、直接输出
+      _new_entry(...)    由第一条记录创建缓存项
+      _accepts(entry, ...) 记录能否并入已有缓存项，不能时先输出已有项再重新开始（默认总是可以）
+      _merge(entry, ...) 合并后续记录，返回 True 表示已完整、立即输出
+      _emit(entry)       输出一条缓存项
+    """
+
+    # 后台线程名称与日志前缀
+    thread_name = "windowed-buffer"
+    log_prefix = "🪟 窗口缓冲"
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], window: float):
+        """
+        Args:
+            emit: 合并后记录的输出回调
+            window: 窗口长度（秒），<=0 表示不合并
+        """
+        self.emit = emit
+        self.window = float(window)
+        self._pending: Dict[Hashable, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        # 统计
+        self.received = 0
+        self.emitted = 0
+
+    # ---------- 子类实现 ----------
+
+    def _new_entry(self, *record: Any) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _accepts(self, entry: Dict[str, Any], *record: Any) -> bool:
+        return True
+
+    def _merge(self, entry: Dict[str, Any], *record: Any) -> bool:
+        raise NotImplementedError
+
+    def _emit(self, entry: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _counters(self) -> Dict[str, int]:
+        """子类的附加统计（持有锁时调用）"""
+        return {}
+
+    # ---------- 公共逻辑 ----------
+
+    def _offer(self, key: Optional[Hashable], *record: Any) -> None:
+        """按键缓存或合并一条记录；key 为 None、未开启合并或已停止时直接输出"""
+        previous = None
+        direct = False
+        with self._cond:
+            self.received += 1
+            if key is None or self.window <= 0 or self._stopped:
+                direct = True
+            else:
+                entry = self._pending.get(key)
+                if entry is not None and not self._accepts(entry, *record):
+                    previous = self._pending.pop(key)
+                    entry = None
+                if entry is None:
+                    entry = self._new_entry(*record)
+                    entry["deadline"] = time.monotonic() + self.window
+                    self._pending[key] = entry
+                    self._ensure_thread()
+                    self._cond.notify()
+                elif self._merge(entry, *record):
+                    previous = self._pending.pop(key)
+        if previous is not None:
+            self._output(previous)
+        if direct:
+            self._output(self._new_entry(*record))
+
+    def _output(self, entry: Dict[str, Any]) -> None:
+        with self._cond:
+            self.emitted += 1
+        self._emit(entry)
+
+    def flush(self, reason: str = "manual") -> int:
+        """立即输出所有缓存的记录
+
+        Returns:
+            int: 输出的记录数
+        """
+        with self._cond:
+            entries = list(self._pending.values())
+            self._pending.clear()
+        for entry in entries:
+            self._output(entry)
+        if entries:
+            logger.info(f"{self.log_prefix}提前刷新({reason})：输出 {len(entries)} 条记录")
+        return len(entries)
+
+    def stop(self) -> None:
+        """停止后台线程并输出剩余记录"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.flush("stop")
+
+    def stats(self) -> Dict[str, int]:
+        """返回统计"""
+        with self._cond:
+            stats = {"received": self.received, "emitted": self.emitted}
+            stats.update(self._counters())
+            stats["pending"] = len(self._pending)
+            return stats
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        """后台线程：等待最早到期的窗口并输出"""
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                due = [k for k, e in self._pending.items() if e["deadline"] <= now]
+                if not due:
+                    next_deadline = min((e["deadline"] for e in self._pending.values()), default=None)
+                    self._cond.wait(None if next_deadline is None else max(0.0, next_deadline - now))
+                    continue
+                ready = [self._pending.pop(k) for k in due]
+                self._cond.release()
+                try:
+                    for entry in ready:
+                        self._output(entry)
+                finally:
+                    self._cond.acquire()
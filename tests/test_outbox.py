@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from src.outbox import Outbox, ACKS_FILE
+
+
+def _ok(record):
+    return True, 200
+
+
+def _fail(record):
+    return False, None
+
+
+class OutboxRestartTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="tofu-outbox-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _wait_drained(self, outbox, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while outbox.backlog() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(outbox.backlog(), 0)
+
+    def test_ids_do_not_reuse_acked_after_idle_restart(self):
+        # 1. 写入一条并重发成功
+        outbox = Outbox(self.directory, retry_base_delay=0.01)
+        outbox.start(_ok)
+        self.assertTrue(outbox.append("http://backend", "/money", {"n": 1}))
+        self._wait_drained(outbox)
+        outbox.stop()
+
+        # 2. 空闲重启：已确认的分段被删除
+        outbox = Outbox(self.directory)
+        outbox.start(_fail)
+        outbox.stop()
+
+        # 3. 新的失败请求
+        outbox = Outbox(self.directory, retry_base_delay=60)
+        outbox.start(_fail)
+        self.assertTrue(outbox.append("http://backend", "/money", {"n": 2}))
+        outbox.stop()
+
+        # 4. 再次重启后这条记录仍待重发
+        outbox = Outbox(self.directory, retry_base_delay=60)
+        outbox.start(_fail)
+        try:
+            self.assertEqual(outbox.backlog("/money"), 1)
+        finally:
+            outbox.stop()
+
+    def test_stop_closes_files(self):
+        outbox = Outbox(self.directory, retry_base_delay=60)
+        outbox.start(_fail)
+        outbox.append("http://backend", "/money", {"n": 1})
+        active, acks = outbox._active_fh, outbox._acks_fh
+        outbox.stop()
+        self.assertTrue(active.closed)
+        self.assertTrue(acks.closed)
+        self.assertFalse(outbox.append("http://backend", "/money", {"n": 2}))
+        outbox.stop()
+
+    def test_acks_cleared_when_no_segments_remain(self):
+        outbox = Outbox(self.directory, retry_base_delay=0.01)
+        outbox.start(_ok)
+        outbox.append("http://backend", "/guard", {"n": 1})
+        self._wait_drained(outbox)
+        outbox.stop()
+
+        outbox = Outbox(self.directory)
+        outbox.start(_fail)
+        outbox.stop()
+        self.assertEqual(os.path.getsize(os.path.join(self.directory, ACKS_FILE)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
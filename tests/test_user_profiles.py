@@ -0,0 +1,34 @@
+import unittest
+
+from src.sample_events import make_danmaku, make_send_gift
+from src.user_profiles import UserProfileCache
+
+
+class UserProfileFillTest(unittest.TestCase):
+    def test_gift_after_sparse_danmaku_keeps_medal_and_wealth(self):
+        cache = UserProfileCache(max_entries=100, ttl=600)
+        danmaku = make_danmaku(uid=10001, room_id=1)
+        user = next(e for e in danmaku["info"][0] if isinstance(e, dict))["user"]
+        user["medal"] = None
+        user["wealth"] = None
+        profile = cache.lookup(1, 10001, user)
+        self.assertNotIn("medal", profile)
+        self.assertNotIn("wealth_level", profile)
+
+        gift = make_send_gift(uid=10001, room_id=1)
+        profile = cache.lookup(1, 10001, gift["data"]["sender_uinfo"])
+        self.assertEqual(profile["medal"]["level"], gift["data"]["sender_uinfo"]["medal"]["level"])
+        self.assertEqual(profile["wealth_level"], gift["data"]["sender_uinfo"]["wealth"]["level"])
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_complete_profile_is_not_overwritten_on_hit(self):
+        cache = UserProfileCache(max_entries=100, ttl=600)
+        first = make_send_gift(uid=10002, room_id=1)["data"]["sender_uinfo"]
+        cache.lookup(1, 10002, first)
+        second = make_send_gift(uid=10002, room_id=1)["data"]["sender_uinfo"]
+        second["wealth"] = {"level": 99}
+        self.assertEqual(cache.lookup(1, 10002, second)["wealth_level"], first["wealth"]["level"])
+
+
+if __name__ == "__main__":
+    unittest.main()